@@ -0,0 +1,836 @@
+#!/usr/bin/env python3
+"""
+PDF批次清洗工具 - 以有限的工作行程池平行清洗大量檔案
+Batch PDF Cleaner - Clean many files concurrently with a bounded worker pool
+"""
+
+import argparse
+import glob
+import importlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from log_config import configure_logging
+from memory_budget import (
+    MB,
+    MemoryBudget,
+    available_memory_bytes,
+    default_memory_budget,
+    estimate_job,
+)
+from metrics import DEFAULT_METRICS_PORT, CleanerMetrics, start_metrics_server
+from pdf_source import MAX_DPI, MIN_DPI, dpi_arg
+from sharding import (
+    SHARD_MIN_PAGES,
+    SHARDS_PER_WORKER,
+    combine_shard_results,
+    page_costs,
+    plan_shards,
+    shard_path,
+)
+
+# 支援的清洗模式: extract = pdf_cleaner.py, print = print.py
+MODES = ("extract", "print")
+
+# 列印模式的空白頁處理方式（同 print.BLANK_PAGE_MODES）
+BLANK_PAGE_MODES = ("keep", "empty", "drop")
+
+# 列印模式的索引色輸出方式（同 print.PALETTE_MODES）
+PALETTE_MODES = ("off", "lossless", "quantize")
+
+# 列印模式的輸出色彩（同 print.COLORSPACES）
+COLORSPACES = ("rgb", "gray", "mono", "mono-dither")
+
+# 每個工作行程的預估記憶體需求 (MB)，列印模式以 300 DPI 為基準
+WORKER_MEMORY_MB = {"extract": 256, "print": 1024}
+
+# 排程時預先估算記憶體的待處理工作數
+SCHEDULE_LOOKAHEAD = 32
+
+# 排在最前面的工作因預算不足被後方較小工作超越的次數上限，超過後保留預算給它
+MAX_BYPASS = 8
+
+# 工作行程當機（segfault、被 OOM 終止）時的失敗訊息
+WORKER_CRASH_MESSAGE = "工作行程異常結束"
+
+# 清洗器採延遲載入，工作行程啟動時先載入各模式需要的函式庫，讓第一份文件不必等待匯入
+PRELOAD_MODULES = {
+    "extract": ("fitz", "magic", "PyPDF2", "PIL.Image", "reportlab.pdfgen.canvas"),
+    "print": ("fitz", "numpy", "PIL.Image", "reportlab.pdfgen.canvas"),
+}
+
+# 只掃描不重建的工作行程（scan_index.py）只需要驗證與掃描用的函式庫，不載入 PIL 與 ReportLab
+SCAN_PRELOAD_MODULES = ("fitz", "magic", "PyPDF2")
+
+# 工作行程內的清洗器實例（每個行程、每種模式只建立一次）
+_worker_cleaners: Dict = {}
+_worker_mode = None
+_worker_options: Dict = {}
+
+
+def _is_pdf(path: str) -> bool:
+    return path.lower().endswith(".pdf")
+
+
+def collect_inputs(
+    sources: Iterable[str], list_file: Optional[str] = None
+) -> List[Tuple[str, str]]:
+    """收集輸入檔案，回傳 (輸入路徑, 相對輸出路徑) 清單"""
+    entries = list(sources)
+    if list_file:
+        with open(list_file, "r", encoding="utf-8") as f:
+            entries.extend(line.strip() for line in f if line.strip())
+
+    collected = []
+    for entry in entries:
+        if os.path.isdir(entry):
+            for root, _dirs, files in os.walk(entry):
+                for name in sorted(files):
+                    if _is_pdf(name):
+                        path = os.path.join(root, name)
+                        collected.append((path, os.path.relpath(path, entry)))
+        elif os.path.isfile(entry):
+            collected.append((entry, os.path.basename(entry)))
+        else:
+            for path in sorted(glob.glob(entry, recursive=True)):
+                if os.path.isfile(path) and _is_pdf(path):
+                    collected.append((path, os.path.basename(path)))
+
+    # 去除重複輸入，並避免不同來源的同名檔案覆蓋彼此
+    seen_inputs = set()
+    used_outputs = set()
+    unique = []
+    for path, rel in collected:
+        key = os.path.realpath(path)
+        if key in seen_inputs:
+            continue
+        seen_inputs.add(key)
+
+        stem, ext = os.path.splitext(rel)
+        candidate = rel
+        counter = 1
+        while candidate in used_outputs:
+            candidate = f"{stem}_{counter}{ext}"
+            counter += 1
+        used_outputs.add(candidate)
+        unique.append((path, candidate))
+
+    return unique
+
+
+def default_worker_count(mode: str, dpi: int = 300) -> int:
+    """依CPU核心數與可用記憶體決定工作行程數量"""
+    cpu_count = os.cpu_count() or 1
+
+    per_worker_mb = WORKER_MEMORY_MB[mode]
+    if mode == "print":
+        per_worker_mb = per_worker_mb * (dpi / 300) ** 2
+
+    available = available_memory_bytes()
+    if available is None:
+        return cpu_count
+
+    memory_limit = int(available / (per_worker_mb * 1024 * 1024))
+    return max(1, min(cpu_count, memory_limit))
+
+
+def validate_options(options: Dict) -> Optional[str]:
+    """
+    檢查清洗選項（例如來自服務請求的 JSON），回傳錯誤訊息，全部有效時回傳 None
+
+    解析度須為 MIN_DPI-MAX_DPI 的整數（output_dpi 與 max_image_dpi 可為 None），
+    列舉選項須為支援的值，開關選項須為布林值。
+    """
+    for key in ("dpi", "output_dpi", "max_image_dpi"):
+        value = options.get(key)
+        if value is None and key != "dpi":
+            continue
+        if isinstance(value, bool) or not isinstance(value, int):
+            return f"{key} 必須是整數"
+        if not MIN_DPI <= value <= MAX_DPI:
+            return f"{key} 應在 {MIN_DPI}-{MAX_DPI} 範圍內"
+
+    for key, choices in (
+        ("blank_pages", BLANK_PAGE_MODES),
+        ("palette", PALETTE_MODES),
+        ("colorspace", COLORSPACES),
+    ):
+        if options.get(key) not in choices:
+            return f"不支援的 {key}: {options.get(key)}（可用: {', '.join(choices)}）"
+
+    for key in ("optimize", "linearize", "deterministic", "verify", "incremental"):
+        if not isinstance(options.get(key, False), bool):
+            return f"{key} 必須是布林值"
+    return None
+
+
+def create_cleaner(mode: str):
+    """建立指定模式的清洗器"""
+    if mode == "print":
+        from print import PDFPrintCleaner
+
+        return PDFPrintCleaner()
+
+    from pdf_cleaner import PDFCleaner
+
+    return PDFCleaner()
+
+
+def _init_worker(modes, options: Dict):
+    """工作行程初始化 - 匯入函式庫並建立清洗器"""
+    global _worker_mode, _worker_options
+
+    if isinstance(modes, str):
+        modes = (modes,)
+
+    for mode in modes:
+        _worker_cleaners[mode] = create_cleaner(mode)
+        _preload(PRELOAD_MODULES[mode])
+
+    _worker_mode = modes[0]
+    _worker_options = dict(options)
+
+
+def _init_scan_worker():
+    """只執行 scan_one 的工作行程初始化 - 只匯入驗證與掃描用的函式庫"""
+    _worker_cleaners["extract"] = create_cleaner("extract")
+    _preload(SCAN_PRELOAD_MODULES)
+
+
+def _preload(module_names):
+    for module_name in module_names:
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            # 缺少的函式庫留到實際使用時由清洗器回報
+            pass
+
+
+def clean_one(
+    input_path: str,
+    output_path: str,
+    mode: Optional[str] = None,
+    options: Optional[Dict] = None,
+) -> Dict:
+    """
+    在工作行程中清洗單一檔案
+
+    失敗且重試可能成功（I/O 錯誤、記憶體不足、工作行程本身的錯誤）時 record["transient"]
+    為 True；格式錯誤的PDF等重試也會得到相同結果的失敗為 False。
+    """
+    mode = mode or _worker_mode
+    options = {**_worker_options, **(options or {})}
+    record = {
+        "input": input_path,
+        "output": output_path,
+        "mode": mode,
+    }
+    start = time.perf_counter()
+
+    try:
+        cleaner = _worker_cleaners.get(mode)
+        if cleaner is None:
+            cleaner = _worker_cleaners[mode] = create_cleaner(mode)
+
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+        if mode == "print":
+            result = cleaner.print_clean_pdf(
+                input_path,
+                output_path,
+                options.get("dpi", 300),
+                previous=output_path if options.get("incremental") else None,
+                output_dpi=options.get("output_dpi"),
+                blank_pages=options.get("blank_pages", "keep"),
+                palette=options.get("palette", "lossless"),
+                colorspace=options.get("colorspace", "rgb"),
+                optimize=options.get("optimize", False),
+                linearize=options.get("linearize", False),
+                deterministic=options.get("deterministic", False),
+                verify=options.get("verify", False),
+            )
+        else:
+            result = cleaner.clean_pdf(
+                input_path,
+                output_path,
+                max_image_dpi=options.get("max_image_dpi"),
+                optimize=options.get("optimize", False),
+                linearize=options.get("linearize", False),
+                deterministic=options.get("deterministic", False),
+                verify=options.get("verify", False),
+            )
+
+        record.update(result)
+        if record.get("success"):
+            record["input_bytes"] = os.path.getsize(input_path)
+            record["output_bytes"] = os.path.getsize(output_path)
+
+    except Exception as e:
+        record["success"] = False
+        record["message"] = f"處理失敗: {e}"
+        # 清洗器以外的錯誤（建立輸出目錄、載入清洗器等）與文件內容無關，可重試
+        record["transient"] = True
+
+    record["elapsed"] = round(time.perf_counter() - start, 4)
+    return record
+
+
+def clean_shard(
+    input_path: str,
+    shard_file: str,
+    first_page: int,
+    last_page: int,
+    mode: Optional[str] = None,
+    options: Optional[Dict] = None,
+) -> Dict:
+    """在工作行程中清洗文件的一個頁面範圍 [first_page, last_page)"""
+    mode = mode or _worker_mode
+    options = {**_worker_options, **(options or {})}
+    pages = range(first_page, last_page)
+
+    try:
+        cleaner = _worker_cleaners.get(mode)
+        if cleaner is None:
+            cleaner = _worker_cleaners[mode] = create_cleaner(mode)
+
+        if mode == "print":
+            result = cleaner.print_clean_pdf(
+                input_path,
+                shard_file,
+                options.get("dpi", 300),
+                pages=pages,
+                output_dpi=options.get("output_dpi"),
+                blank_pages=options.get("blank_pages", "keep"),
+                palette=options.get("palette", "lossless"),
+                colorspace=options.get("colorspace", "rgb"),
+                verify=options.get("verify", False),
+            )
+        else:
+            result = cleaner.clean_pages(
+                input_path,
+                shard_file,
+                pages,
+                options.get("max_image_dpi"),
+                options.get("verify", False),
+            )
+
+    except Exception as e:
+        result = {"success": False, "message": f"處理失敗: {e}"}
+
+    result["shard_path"] = shard_file
+    return result
+
+
+def scan_one(input_path: str) -> Dict:
+    """在工作行程中驗證並掃描整份文件（分片處理的內容提取模式使用）"""
+    cleaner = _worker_cleaners.get("extract")
+    if cleaner is None:
+        cleaner = _worker_cleaners["extract"] = create_cleaner("extract")
+    return cleaner.scan_pdf(input_path)
+
+
+def _failed_record(input_path: str, output_path: str, mode: str, message: str) -> Dict:
+    return {
+        "input": input_path,
+        "output": output_path,
+        "mode": mode,
+        "success": False,
+        "message": message,
+    }
+
+
+def _shard_tasks(
+    group: Dict, mode: str, dpi: int, workers: int, output_path: str
+) -> List[Dict]:
+    """將大型文件展開為分片工作（內容提取模式另加一個整份文件的掃描工作）"""
+    input_path = group["input"]
+    shards = plan_shards(page_costs(input_path, mode, dpi), workers * SHARDS_PER_WORKER)
+    if len(shards) == 1:
+        return []
+
+    output_dir = os.path.dirname(output_path) or "."
+    os.makedirs(output_dir, exist_ok=True)
+    group["shard_dir"] = tempfile.mkdtemp(prefix=".shards_", dir=output_dir)
+    group["shard_results"] = [None] * len(shards)
+    group["remaining"] = len(shards)
+
+    tasks = []
+    for index, pages in enumerate(shards):
+        tasks.append(
+            {
+                "kind": "shard",
+                "group": group,
+                "index": index,
+                "args": (
+                    input_path,
+                    shard_path(group["shard_dir"], index),
+                    pages.start,
+                    pages.stop,
+                ),
+                "estimate": estimate_job(input_path, mode, dpi, pages),
+            }
+        )
+
+    if mode != "print":
+        group["remaining"] += 1
+        tasks.append(
+            {
+                "kind": "scan",
+                "group": group,
+                "args": (input_path,),
+                "estimate": estimate_job(input_path, "extract", dpi),
+            }
+        )
+    return tasks
+
+
+def run_batch(
+    inputs: List[Tuple[str, str]],
+    output_dir: str,
+    mode: str = "extract",
+    workers: Optional[int] = None,
+    options: Optional[Dict] = None,
+    results_file=None,
+    memory_budget: Optional[int] = None,
+    shard_min_pages: int = SHARD_MIN_PAGES,
+    metrics: Optional[CleanerMetrics] = None,
+) -> Dict:
+    """
+    以工作行程池批次清洗，每完成一份文件寫出一行JSON結果
+
+    每份文件在送出前依頁面尺寸與DPI估算最高記憶體需求，只在全域記憶體預算
+    (memory_budget, bytes；預設為可用記憶體的 80%) 足夠時才開始執行，其餘排隊等待。
+    工作行程數只是同時執行數的上限。
+
+    頁數達 shard_min_pages 的文件依頁面複雜度切成多個分片，由不同工作行程
+    平行清洗後合併（0 代表不分片）。options["incremental"] 為 True 時，列印模式
+    只重建與既有輸出相比有變更的頁面（此時不分片）；options["optimize"] 為 True 時
+    對每份輸出執行最佳化後處理（分片的文件在合併後執行一次）；options["deterministic"]
+    為 True 時輸出可重現，此時不分片；options["verify"] 為 True 時逐頁比較輸入與輸出
+    的外觀（分片各自驗證後合併報告）。metrics 為選用的
+    CleanerMetrics，每份文件完成時記錄其結果。
+    """
+    logger = logging.getLogger(__name__)
+    options = options or {}
+    dpi = options.get("dpi", 300)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if not shard_min_pages:
+        workers = min(workers, len(inputs) or 1)
+    workers = max(1, workers)
+
+    if memory_budget is None:
+        memory_budget = default_memory_budget()
+    budget = MemoryBudget(memory_budget) if memory_budget else None
+
+    summary = {"total": len(inputs), "succeeded": 0, "failed": 0, "workers": workers}
+    start = time.perf_counter()
+
+    def write_record(record: Dict):
+        if record.get("success"):
+            summary["succeeded"] += 1
+        else:
+            summary["failed"] += 1
+        for key in ("pages_reused", "pages_rebuilt", "pages_blank"):
+            if key in record:
+                summary[key] = summary.get(key, 0) + record[key]
+        if "optimization" in record:
+            summary["optimized_saved_bytes"] = summary.get("optimized_saved_bytes", 0) + (
+                record["optimization"]["input_bytes"] - record["optimization"]["output_bytes"]
+            )
+        if "verification" in record:
+            summary["pages_verified"] = (
+                summary.get("pages_verified", 0) + record["verification"]["pages_compared"]
+            )
+            summary["pages_flagged"] = summary.get("pages_flagged", 0) + len(
+                record["verification"]["flagged"]
+            )
+        if record.get("images_downsampled"):
+            summary["images_downsampled"] = summary.get("images_downsampled", 0) + len(
+                record["images_downsampled"]
+            )
+        if metrics is not None:
+            metrics.observe(record)
+
+        if results_file is not None:
+            results_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            results_file.flush()
+
+    def next_tasks() -> List[Dict]:
+        job = next(jobs, None)
+        if job is None:
+            return []
+        input_path, rel_output = job
+        output_path = os.path.join(output_dir, rel_output)
+        estimate = estimate_job(input_path, mode, dpi)
+        group = {"input": input_path, "output": output_path, "start": time.perf_counter()}
+
+        # 增量重建只渲染變更的頁面，不需要分片
+        if (
+            shard_min_pages
+            and workers > 1
+            and not options.get("incremental")
+            # 分片合併的輸出結構依分片方式（工作行程數）而不同
+            and not options.get("deterministic")
+            and estimate["pages"] >= shard_min_pages
+        ):
+            try:
+                tasks = _shard_tasks(group, mode, dpi, workers, output_path)
+            except Exception:
+                # 無法分析頁面時改為整份文件處理
+                tasks = []
+            if tasks:
+                return tasks
+
+        return [
+            {
+                "kind": "document",
+                "group": group,
+                "args": (input_path, output_path),
+                "estimate": estimate,
+            }
+        ]
+
+    def finish_group(group: Dict):
+        record = combine_shard_results(
+            mode,
+            group["input"],
+            group["output"],
+            group["shard_dir"],
+            group["shard_results"],
+            group.get("scan_result"),
+            options.get("optimize", False),
+            options.get("linearize", False),
+        )
+        record["memory_estimate_mb"] = round(group["peak_bytes"] / MB, 1)
+        record["elapsed"] = round(time.perf_counter() - group["start"], 4)
+        write_record(record)
+
+    task_functions = {"document": clean_one, "shard": clean_shard, "scan": scan_one}
+    pending = {}
+    waiting = deque()
+    jobs = iter(inputs)
+    bypassed = 0
+
+    def make_executor():
+        return ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(mode, options)
+        )
+
+    def collect(future, task):
+        group = task["group"]
+        peak_bytes = task["estimate"]["peak_bytes"]
+        if budget is not None:
+            budget.release(peak_bytes)
+
+        try:
+            result = future.result()
+        except BrokenProcessPool:
+            # 無法得知是哪個工作讓行程當機：受影響的工作各自單獨重試一次，
+            # 單獨執行仍然當機的才記為失敗
+            if not task.get("isolated"):
+                task["isolated"] = True
+                waiting.appendleft(task)
+                return
+            result = _failed_record(group["input"], group["output"], mode, WORKER_CRASH_MESSAGE)
+        except Exception as e:
+            result = _failed_record(
+                group["input"], group["output"], mode, f"工作行程錯誤: {e}"
+            )
+
+        if task["kind"] == "document":
+            result["memory_estimate_mb"] = round(peak_bytes / MB, 1)
+            write_record(result)
+            return
+
+        if task["kind"] == "scan":
+            group["scan_result"] = result
+        else:
+            group["shard_results"][task["index"]] = result
+        group["peak_bytes"] = max(group.get("peak_bytes", 0), peak_bytes)
+        group["remaining"] -= 1
+        if group["remaining"] == 0:
+            finish_group(group)
+
+    executor = make_executor()
+    try:
+        while True:
+            # 只預先估算有限數量的工作，避免大型清單一次開啟所有文件
+            while len(waiting) < SCHEDULE_LOOKAHEAD:
+                tasks = next_tasks()
+                if not tasks:
+                    break
+                waiting.extend(tasks)
+
+            # 依序放行預算足夠的工作；較小的工作可以超越排在前面的大型工作，
+            # 但超越次數有限，之後保留預算直到大型工作可以執行。
+            # 當機後重試的工作排在最前面，等其他工作結束後單獨執行
+            broken = False
+            index = 0
+            while (
+                index < len(waiting)
+                and len(pending) < workers
+                and not any(task.get("isolated") for task in pending.values())
+            ):
+                if index > 0 and bypassed >= MAX_BYPASS:
+                    break
+                task = waiting[index]
+                if task.get("isolated") and pending:
+                    break
+                peak_bytes = task["estimate"]["peak_bytes"]
+                if budget is not None and not budget.try_acquire(peak_bytes):
+                    index += 1
+                    continue
+
+                bypassed = bypassed + 1 if index > 0 else 0
+                del waiting[index]
+                try:
+                    future = executor.submit(task_functions[task["kind"]], *task["args"])
+                except BrokenProcessPool:
+                    # 行程池在上次等待後才損壞，工作尚未開始
+                    if budget is not None:
+                        budget.release(peak_bytes)
+                    waiting.appendleft(task)
+                    broken = True
+                    break
+                pending[future] = task
+
+            if not pending and not broken:
+                break
+
+            if pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                if any(isinstance(future.exception(), BrokenProcessPool) for future in done):
+                    broken = True
+                    # 行程池損壞時其餘執行中的工作也會隨即失敗，一併收回
+                    done, _ = wait(pending)
+                for future in done:
+                    collect(future, pending.pop(future))
+
+            if broken:
+                logger.error("工作行程異常結束，重新啟動工作行程池")
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = make_executor()
+    finally:
+        executor.shutdown()
+
+    summary["elapsed"] = round(time.perf_counter() - start, 4)
+    if budget is not None:
+        summary["memory_budget_mb"] = round(budget.total_bytes / MB, 1)
+        summary["peak_reserved_mb"] = round(budget.peak_reserved_bytes / MB, 1)
+    return summary
+
+
+def main():
+    """主程式入口"""
+    parser = argparse.ArgumentParser(
+        description="PDF批次清洗工具 - 平行清洗目錄、萬用字元或清單中的檔案"
+    )
+    parser.add_argument(
+        "inputs", nargs="*", help="輸入目錄、PDF檔案或萬用字元 (例如 'inbox/**/*.pdf')"
+    )
+    parser.add_argument("-o", "--output-dir", required=True, help="輸出目錄")
+    parser.add_argument(
+        "--mode", choices=MODES, default="extract", help="清洗模式 (預設: extract)"
+    )
+    parser.add_argument("--list", dest="list_file", help="每行一個輸入路徑的清單檔案")
+    parser.add_argument(
+        "--dpi", type=int, default=300, help="列印模式渲染DPI (預設: 300)"
+    )
+    parser.add_argument(
+        "--output-dpi",
+        type=dpi_arg,
+        help="列印模式輸出解析度，低於 --dpi 時超取樣後縮小 (預設: 與 --dpi 相同)",
+    )
+    parser.add_argument(
+        "--max-image-dpi",
+        type=dpi_arg,
+        help="內容提取模式圖片目標解析度，解析度過高的圖片縮小到此解析度 (預設: 不縮小)",
+    )
+    parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="輸出最佳化：移除未使用物件、合併相同串流並壓縮為物件串流",
+    )
+    parser.add_argument(
+        "--linearize",
+        action="store_true",
+        help="線性化輸出以便網頁檢視器快速顯示第一頁 (隱含 --optimize，需要 pikepdf)",
+    )
+    parser.add_argument(
+        "--deterministic",
+        action="store_true",
+        help="可重現輸出：相同的輸入與選項產生位元組完全相同的PDF (不分片、不增量重建)",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="以低解析度逐頁比較輸入與輸出的外觀，差異過大的頁面列於結果檔",
+    )
+    parser.add_argument(
+        "--blank-pages",
+        choices=BLANK_PAGE_MODES,
+        default="keep",
+        help="列印模式空白頁處理: keep 照常渲染, empty 輸出空白頁, drop 移除 (預設: keep)",
+    )
+    parser.add_argument(
+        "--palette",
+        choices=PALETTE_MODES,
+        default="lossless",
+        help="列印模式索引色: lossless 無損, quantize 另量化顏色略多的頁面, off 一律RGB (預設: lossless)",
+    )
+    parser.add_argument(
+        "--colorspace",
+        choices=COLORSPACES,
+        default="rgb",
+        help="列印模式輸出色彩: rgb 全彩, gray 灰階, mono 黑白, mono-dither 抖動黑白 (預設: rgb)",
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, help="同時執行的工作行程上限 (預設: CPU核心數)"
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        metavar="MB",
+        help="同時執行工作的預估記憶體總上限 (預設: 可用記憶體的80%%，0 代表不限制)",
+    )
+    parser.add_argument(
+        "--shard-min-pages",
+        type=int,
+        default=SHARD_MIN_PAGES,
+        help=f"頁數達此值的文件分片平行處理後合併 (預設: {SHARD_MIN_PAGES}，0 代表不分片)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="列印模式只重建與既有輸出相比有變更的頁面",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        nargs="?",
+        const=DEFAULT_METRICS_PORT,
+        help=f"在本機此埠提供 Prometheus 指標 /metrics (未指定埠時為 {DEFAULT_METRICS_PORT})",
+    )
+    parser.add_argument(
+        "--results",
+        default="batch_results.jsonl",
+        help="JSONL結果檔案路徑，'-' 代表標準輸出 (預設: batch_results.jsonl)",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="詳細輸出")
+    parser.add_argument(
+        "--log-file", help='日誌檔案路徑，"-" 代表不寫入檔案 (預設: pdf_batch_cleaner.log)'
+    )
+
+    args = parser.parse_args()
+
+    # 工作行程沿用此設定；結果寫到標準輸出時，日誌改寫到標準錯誤
+    configure_logging(
+        log_file=args.log_file,
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        stream=sys.stderr if args.results == "-" else None,
+        default_log_file="pdf_batch_cleaner.log",
+    )
+
+    if args.dpi < 72 or args.dpi > 1200:
+        print("警告: DPI應在72-1200範圍內，使用預設值300")
+        args.dpi = 300
+
+    inputs = collect_inputs(args.inputs, args.list_file)
+    if not inputs:
+        print("找不到任何PDF輸入檔案")
+        return 1
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    memory_budget = None if args.memory_budget is None else args.memory_budget * MB
+
+    metrics = metrics_server = None
+    if args.metrics_port is not None:
+        metrics = CleanerMetrics()
+        metrics_server = start_metrics_server(metrics, args.metrics_port)
+
+    results_file = (
+        sys.stdout if args.results == "-" else open(args.results, "w", encoding="utf-8")
+    )
+    try:
+        summary = run_batch(
+            inputs,
+            args.output_dir,
+            args.mode,
+            args.workers,
+            {
+                "dpi": args.dpi,
+                "output_dpi": args.output_dpi,
+                "max_image_dpi": args.max_image_dpi,
+                "optimize": args.optimize,
+                "linearize": args.linearize,
+                "deterministic": args.deterministic,
+                "verify": args.verify,
+                "blank_pages": args.blank_pages,
+                "palette": args.palette,
+                "colorspace": args.colorspace,
+                "incremental": args.incremental,
+            },
+            results_file,
+            memory_budget,
+            args.shard_min_pages,
+            metrics,
+        )
+    finally:
+        if results_file is not sys.stdout:
+            results_file.close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+
+    # 結果輸出到標準輸出時，報告改寫到標準錯誤
+    report = sys.stderr if args.results == "-" else sys.stdout
+
+    print("\n" + "=" * 60, file=report)
+    print("PDF批次清洗結果報告", file=report)
+    print("=" * 60, file=report)
+    print(f"清洗模式: {args.mode}", file=report)
+    print(f"工作行程: {summary['workers']}", file=report)
+    if "memory_budget_mb" in summary:
+        print(
+            f"記憶體預算: {summary['memory_budget_mb']:.0f} MB"
+            f" (最高預估用量 {summary['peak_reserved_mb']:.0f} MB)",
+            file=report,
+        )
+    print(f"檔案總數: {summary['total']}", file=report)
+    print(f"成功: {summary['succeeded']}", file=report)
+    print(f"失敗: {summary['failed']}", file=report)
+    if "pages_reused" in summary:
+        print(
+            f"增量重建: 重用 {summary['pages_reused']} 頁，重建 {summary['pages_rebuilt']} 頁",
+            file=report,
+        )
+    if "pages_blank" in summary:
+        print(f"空白頁: {summary['pages_blank']} 頁略過渲染", file=report)
+    if "optimized_saved_bytes" in summary:
+        print(f"輸出最佳化: 共縮小 {summary['optimized_saved_bytes'] / MB:.1f} MB", file=report)
+    if "images_downsampled" in summary:
+        print(f"縮小圖片: {summary['images_downsampled']} 張", file=report)
+    if "pages_verified" in summary:
+        print(
+            f"視覺驗證: 比較 {summary['pages_verified']} 頁，差異過大 {summary['pages_flagged']} 頁",
+            file=report,
+        )
+    print(f"總耗時: {summary['elapsed']:.2f} 秒", file=report)
+    print("=" * 60, file=report)
+
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+啟動時間基準測試 - 量測各命令列入口的匯入與啟動時間
+Startup Benchmark - Measure import and startup time of each CLI entry point
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 與 setup_py.py 中 console_scripts 對應的入口
+ENTRY_POINTS = {
+    "clean_pdf": "pdf_cleaner:main",
+    "pdf_print_cleaner": "print:main",
+    "pdf_batch_cleaner": "batch_cleaner:main",
+}
+
+# 不應該在啟動時就被載入的重量級函式庫
+HEAVY_MODULES = ("fitz", "pymupdf", "reportlab", "PIL", "PyPDF2", "magic")
+
+# print.py 的模組名稱會遮蔽內建的 print，因此以 importlib 匯入並直接寫出結果
+_PROBE = """
+import importlib, json, sys, time
+start = time.perf_counter()
+importlib.import_module({module!r})
+elapsed = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+sys.stdout.write(json.dumps({{"import_seconds": elapsed, "heavy_modules": heavy}}) + "\\n")
+"""
+
+
+def _run(args: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable] + args,
+        cwd=REPO_ROOT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+
+
+def measure_import(module: str) -> Dict:
+    """在全新的直譯器中匯入模組，回傳匯入時間與已載入的重量級函式庫"""
+    proc = _run(["-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)])
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip())
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def measure_help(module: str) -> float:
+    """量測執行 --help 的總牆鐘時間（包含直譯器啟動）"""
+    start = time.perf_counter()
+    _run([f"{module}.py", "--help"])
+    return time.perf_counter() - start
+
+
+def benchmark(repeat: int = 5) -> Dict:
+    """對每個入口重複量測並取中位數"""
+    results = {}
+    for name, target in ENTRY_POINTS.items():
+        module = target.split(":")[0]
+        imports = [measure_import(module) for _ in range(repeat)]
+        helps = [measure_help(module) for _ in range(repeat)]
+        results[name] = {
+            "module": module,
+            "import_ms": round(
+                statistics.median(r["import_seconds"] for r in imports) * 1000, 2
+            ),
+            "help_ms": round(statistics.median(helps) * 1000, 2),
+            "heavy_modules": imports[-1]["heavy_modules"],
+        }
+    return results
+
+
+def main():
+    """主程式入口"""
+    parser = argparse.ArgumentParser(description="命令列入口啟動時間基準測試")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="重複次數 (預設: 5)")
+    parser.add_argument("--json", dest="json_path", help="將結果寫入JSON檔案")
+    args = parser.parse_args()
+
+    results = benchmark(args.repeat)
+
+    print("=" * 60)
+    print("命令列入口啟動時間")
+    print("=" * 60)
+    print(f"{'入口':<20}{'匯入 (ms)':>12}{'--help (ms)':>14}  已載入重量級函式庫")
+    for name, data in results.items():
+        heavy = ", ".join(data["heavy_modules"]) or "-"
+        print(f"{name:<20}{data['import_ms']:>12.2f}{data['help_ms']:>14.2f}  {heavy}")
+    print("=" * 60)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    # 任何入口在啟動時載入重量級函式庫都視為退步
+    return 1 if any(data["heavy_modules"] for data in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+效能回歸檢查 - 執行基準測試並與已提交的基準值比較
+Performance Regression Gate - Run the benchmarks and compare against stored baselines
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from make_corpus import DEFAULT_CORPUS_DIR, SCENARIOS  # noqa: E402
+from run_benchmarks import MODES, run_benchmarks  # noqa: E402
+
+DEFAULT_BASELINE_DIR = os.path.join(BENCH_DIR, "baselines")
+
+# 報告中依序列出的清洗階段
+STAGE_ORDER = ("scan", "extract", "render", "encode", "write")
+
+# 與基準值比較的欄位
+BASELINE_FIELDS = (
+    "pages",
+    "dpi",
+    "seconds",
+    "pages_per_s",
+    "mb_per_s",
+    "peak_rss_mb",
+    "output_bytes",
+    "timings",
+    "calibration_seconds",
+    "relative_seconds",
+)
+
+# 回歸檢查預設的重複次數；少於 MIN_REPEAT 次時中位數無法濾掉單次的雜訊
+DEFAULT_REPEAT = 5
+MIN_REPEAT = 3
+
+
+def baseline_path(baseline_dir: str, scenario: str) -> str:
+    return os.path.join(baseline_dir, f"{scenario}.json")
+
+
+def load_baseline(baseline_dir: str, scenario: str) -> Optional[Dict]:
+    """讀取單一情境的基準值，不存在時回傳 None"""
+    path = baseline_path(baseline_dir, scenario)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_baselines(results: List[Dict], baseline_dir: str):
+    """以本次結果更新基準值（每個情境一個檔案，保留未重測模式的既有值）"""
+    os.makedirs(baseline_dir, exist_ok=True)
+    by_scenario: Dict[str, Dict] = {}
+    for r in results:
+        by_scenario.setdefault(r["scenario"], {})[r["mode"]] = {
+            field: r[field] for field in BASELINE_FIELDS
+        }
+
+    for scenario, modes in by_scenario.items():
+        baseline = load_baseline(baseline_dir, scenario) or {"scenario": scenario, "modes": {}}
+        baseline["modes"].update(modes)
+        with open(baseline_path(baseline_dir, scenario), "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+def _change(current: Optional[float], base: Optional[float]) -> Optional[float]:
+    if current is None or not base:
+        return None
+    return (current - base) / base
+
+
+def is_calibrated(result: Dict, base: Dict) -> bool:
+    return bool(result.get("relative_seconds") and base.get("relative_seconds"))
+
+
+def expected_throughput(result: Dict, base: Dict) -> Optional[float]:
+    """換算本機預期的吞吐量（頁/秒）
+
+    基準與本次都有校正值時，以「耗時 / 校正耗時」的比值換算，
+    否則直接使用基準的吞吐量。
+    """
+    if base.get("pages_per_s") is None:
+        return None
+    if not is_calibrated(result, base):
+        return base["pages_per_s"]
+    return result["pages_per_s"] * result["relative_seconds"] / base["relative_seconds"]
+
+
+def compare_result(
+    result: Dict, base: Dict, tolerance: float, memory_tolerance: float
+) -> List[str]:
+    """比較單一情境與模式的結果，回傳回歸項目說明（空串列代表通過）"""
+    regressions = []
+
+    if not result["success"]:
+        regressions.append("清洗失敗")
+
+    if base.get("dpi") != result["dpi"]:
+        regressions.append(f"DPI不一致 (基準 {base.get('dpi')}，本次 {result['dpi']})，無法比較")
+        return regressions
+
+    expected = expected_throughput(result, base)
+    throughput = _change(result["pages_per_s"], expected)
+    if throughput is not None and throughput < -tolerance:
+        regressions.append(
+            f"吞吐量下降 {-throughput:.1%}: "
+            f"預期 {expected:.2f} -> {result['pages_per_s']:.2f} 頁/秒"
+        )
+
+    memory = _change(result["peak_rss_mb"], base.get("peak_rss_mb"))
+    if memory is not None and memory > memory_tolerance:
+        regressions.append(
+            f"最高記憶體增加 {memory:.1%}: "
+            f"{base['peak_rss_mb']:.1f} -> {result['peak_rss_mb']:.1f} MB"
+        )
+
+    return regressions
+
+
+def format_stage_diff(result: Dict, base: Dict) -> List[str]:
+    """產生各階段耗時差異的報告行"""
+    current = result.get("timings", {})
+    previous = base.get("timings", {})
+    names = [name for name in STAGE_ORDER if name in current or name in previous]
+    names += sorted((set(current) | set(previous)) - set(STAGE_ORDER))
+
+    lines = []
+    for name in names:
+        now = current.get(name, 0.0)
+        before = previous.get(name, 0.0)
+        change = _change(now, before)
+        change_text = f"{change:+.1%}" if change is not None else "新增"
+        lines.append(f"    {name:<10}{before:>10.3f}s{now:>10.3f}s{change_text:>10}")
+    return lines
+
+
+def check_results(
+    results: List[Dict], baseline_dir: str, tolerance: float, memory_tolerance: float
+) -> int:
+    """列印比較報告，回傳回歸（含缺少基準值）的項目數"""
+    failures = 0
+
+    print("=" * 78)
+    print("PDF清洗效能回歸檢查")
+    print(f"容許範圍: 吞吐量 -{tolerance:.0%} / 記憶體 +{memory_tolerance:.0%}")
+    print("=" * 78)
+
+    for result in results:
+        baseline = load_baseline(baseline_dir, result["scenario"]) or {}
+        base = baseline.get("modes", {}).get(result["mode"])
+        title = f"{result['scenario']} [{result['mode']}]"
+
+        if base is None:
+            failures += 1
+            print(f"❌ {title}: 找不到基準值，請以 --update 建立")
+            continue
+
+        regressions = compare_result(result, base, tolerance, memory_tolerance)
+        failures += bool(regressions)
+
+        throughput = _change(result["pages_per_s"], expected_throughput(result, base))
+        memory = _change(result["peak_rss_mb"], base.get("peak_rss_mb"))
+        print(
+            f"{'❌' if regressions else '✅'} {title}: "
+            f"{result['pages_per_s']:.2f} 頁/秒"
+            + (f" ({throughput:+.1%})" if throughput is not None else "")
+            + f", 最高RSS {result['peak_rss_mb'] or 0:.1f} MB"
+            + (f" ({memory:+.1%})" if memory is not None else "")
+        )
+        if is_calibrated(result, base):
+            print(
+                f"    校正耗時 基準 {base['calibration_seconds']:.3f}s / "
+                f"本次 {result['calibration_seconds']:.3f}s，"
+                f"相對耗時 基準 {base['relative_seconds']:.2f} / "
+                f"本次 {result['relative_seconds']:.2f}"
+            )
+        else:
+            print("    基準值缺少校正耗時，以原始吞吐量比較；請以 --update 重新產生")
+        for regression in regressions:
+            print(f"    - {regression}")
+
+        print(f"    {'階段':<8}{'基準':>9}{'本次':>9}{'變化':>8}")
+        for line in format_stage_diff(result, base):
+            print(line)
+
+    print("=" * 78)
+    if failures:
+        print(f"❌ 發現 {failures} 項效能回歸")
+    else:
+        print("✅ 未發現效能回歸")
+    return failures
+
+
+def main():
+    """主程式入口"""
+    parser = argparse.ArgumentParser(description="PDF清洗效能回歸檢查（與已提交的基準值比較）")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_DIR, help="語料目錄 (不存在時自動產生)")
+    parser.add_argument(
+        "--baselines", default=DEFAULT_BASELINE_DIR, help="基準值目錄 (預設: benchmarks/baselines)"
+    )
+    parser.add_argument(
+        "--scenario", action="append", choices=sorted(SCENARIOS), help="只檢查指定情境"
+    )
+    parser.add_argument("--mode", action="append", choices=MODES, help="只檢查指定模式")
+    parser.add_argument("--dpi", type=int, default=150, help="列印模式渲染DPI (預設: 150)")
+    parser.add_argument(
+        "-n",
+        "--repeat",
+        type=int,
+        default=DEFAULT_REPEAT,
+        help=f"重複次數，取中位數比較 (預設: {DEFAULT_REPEAT}，至少 {MIN_REPEAT})",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.15,
+        help="容許的吞吐量下降比例 (預設: 0.15，即 15%%)",
+    )
+    parser.add_argument(
+        "--memory-tolerance",
+        type=float,
+        default=0.10,
+        help="容許的最高記憶體增加比例 (預設: 0.10，即 10%%)",
+    )
+    parser.add_argument("--update", action="store_true", help="以本次結果更新基準值，不做比較")
+    args = parser.parse_args()
+    if args.repeat < MIN_REPEAT:
+        parser.error(f"--repeat 至少需為 {MIN_REPEAT}，單次量測的雜訊會被誤判為回歸")
+
+    results = run_benchmarks(
+        args.corpus, args.scenario, args.mode or MODES, args.dpi, args.repeat
+    )
+
+    if args.update:
+        write_baselines(results, args.baselines)
+        print(f"已更新 {len({r['scenario'] for r in results})} 個情境的基準值: {args.baselines}")
+        return 0 if all(r["success"] for r in results) else 1
+
+    failures = check_results(results, args.baselines, args.tolerance, args.memory_tolerance)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+合成PDF語料產生器 - 產生可重現的基準測試用PDF
+Synthetic PDF Corpus Generator - Build deterministic PDFs for benchmarks
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+from typing import Callable, Dict
+
+import fitz  # PyMuPDF
+
+DEFAULT_CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+# 固定的文件資訊，確保每次產生的檔案位元組完全相同
+FIXED_METADATA = {
+    "title": "clean_pdf benchmark corpus",
+    "author": "clean_pdf",
+    "creator": "make_corpus.py",
+    "producer": "make_corpus.py",
+    "creationDate": "D:20250101000000Z",
+    "modDate": "D:20250101000000Z",
+}
+
+_WORDS = (
+    "security document cleaner render extract image page stream object "
+    "font layout content filter threat sanitize rebuild archive report"
+).split()
+
+_CJK_TEXT = "安全文件清洗工具會移除潛在的惡意內容，並以渲染方式重建每一頁。"
+
+
+def _paragraph(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+def _noise_pixmap(rng: random.Random, width: int, height: int):
+    """產生隨機雜訊圖片（不易壓縮，模擬掃描或照片）"""
+    size = width * height * 3
+    samples = rng.getrandbits(size * 8).to_bytes(size, "little")
+    return fitz.Pixmap(fitz.csRGB, width, height, samples, False)
+
+
+def build_text_only(doc, rng: random.Random):
+    for _ in range(20):
+        page = doc.new_page()
+        page.insert_textbox(
+            fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50),
+            "\n\n".join(_paragraph(rng, 80) for _ in range(6)),
+            fontsize=10,
+        )
+
+
+def build_image_heavy(doc, rng: random.Random):
+    for _ in range(8):
+        page = doc.new_page()
+        for row in range(2):
+            for col in range(2):
+                rect = fitz.Rect(
+                    40 + col * 270, 60 + row * 360, 300 + col * 270, 400 + row * 360
+                )
+                page.insert_image(rect, pixmap=_noise_pixmap(rng, 320, 400))
+
+
+def build_shared_image(doc, rng: random.Random):
+    pix = _noise_pixmap(rng, 400, 300)
+    xref = 0
+    for number in range(20):
+        page = doc.new_page()
+        rect = fitz.Rect(100, 100, 500, 400)
+        # 第一頁插入圖片，其餘頁面重複引用同一個 xref
+        if xref:
+            page.insert_image(rect, xref=xref)
+        else:
+            xref = page.insert_image(rect, pixmap=pix)
+        page.insert_text((100, 450), f"shared image page {number + 1}", fontsize=12)
+
+
+def build_huge_page(doc, rng: random.Random):
+    # A0 尺寸頁面，渲染時記憶體需求最高
+    for _ in range(2):
+        page = doc.new_page(width=2384, height=3370)
+        for i in range(40):
+            page.insert_text((100, 100 + i * 80), _paragraph(rng, 20), fontsize=36)
+        page.draw_rect(fitz.Rect(200, 200, 2184, 3170), color=(0, 0, 1), width=4)
+
+
+def build_cjk(doc, rng: random.Random):
+    for _ in range(10):
+        page = doc.new_page()
+        for line in range(30):
+            start = rng.randrange(len(_CJK_TEXT) - 10)
+            text = (_CJK_TEXT[start:] + _CJK_TEXT[:start])[:28]
+            page.insert_text((50, 60 + line * 24), text, fontname="china-t", fontsize=14)
+
+
+def build_many_pages(doc, rng: random.Random):
+    for number in range(500):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Page {number + 1}", fontsize=18)
+        page.insert_text((72, 110), _paragraph(rng, 12), fontsize=11)
+
+
+def build_planted_threats(doc, rng: random.Random):
+    page = doc.new_page()
+    page.insert_text((72, 72), "Document with planted threats", fontsize=18)
+    page.insert_text((72, 110), _paragraph(rng, 12), fontsize=11)
+
+    # /Launch 連結
+    page.insert_link(
+        {"kind": fitz.LINK_LAUNCH, "from": fitz.Rect(72, 150, 300, 170), "file": "calc.exe"}
+    )
+
+    # 嵌入檔案（固定 PyMuPDF 自動寫入的建立與修改時間）
+    emb_xref = doc.embfile_add("payload.txt", b"not really malware", filename="payload.txt")
+    for key in ("Params/CreationDate", "Params/ModDate"):
+        doc.xref_set_key(emb_xref, key, f"({FIXED_METADATA['creationDate']})")
+
+    catalog = doc.pdf_catalog()
+
+    # 開啟文件時執行的 JavaScript (/JS)
+    doc.xref_set_key(catalog, "OpenAction", "<</S/JavaScript/JS(app.alert\\(1\\))>>")
+
+    # XFA 表單
+    xfa_xref = doc.get_new_xref()
+    doc.update_object(xfa_xref, "<<>>")
+    doc.update_stream(xfa_xref, b"<xdp:xdp><xfa:template/><xfa:data/></xdp:xdp>")
+    doc.xref_set_key(catalog, "AcroForm", f"<</Fields[]/XFA {xfa_xref} 0 R>>")
+
+
+SCENARIOS: Dict[str, Callable] = {
+    "text_only": build_text_only,
+    "image_heavy": build_image_heavy,
+    "shared_image": build_shared_image,
+    "huge_page": build_huge_page,
+    "cjk": build_cjk,
+    "many_pages": build_many_pages,
+    "planted_threats": build_planted_threats,
+}
+
+
+def build_scenario(name: str, output_dir: str) -> Dict:
+    """產生單一情境的PDF，回傳語料清單項目"""
+    rng = random.Random(name)
+    doc = fitz.open()
+    SCENARIOS[name](doc, rng)
+    doc.set_metadata(FIXED_METADATA)
+
+    path = os.path.join(output_dir, f"{name}.pdf")
+    doc.save(path, garbage=3, deflate=True, no_new_id=True)
+    page_count = doc.page_count
+    doc.close()
+
+    with open(path, "rb") as f:
+        data = f.read()
+
+    return {
+        "file": os.path.basename(path),
+        "pages": page_count,
+        "bytes": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(),
+    }
+
+
+def build_corpus(output_dir: str = DEFAULT_CORPUS_DIR, scenarios=None) -> Dict:
+    """產生語料並寫出 manifest.json"""
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {}
+    for name in scenarios or SCENARIOS:
+        manifest[name] = build_scenario(name, output_dir)
+
+    with open(os.path.join(output_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+    return manifest
+
+
+def main():
+    """主程式入口"""
+    parser = argparse.ArgumentParser(description="產生可重現的基準測試PDF語料")
+    parser.add_argument(
+        "-o", "--output-dir", default=DEFAULT_CORPUS_DIR, help="語料輸出目錄"
+    )
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="只產生指定情境 (可重複指定，預設全部)",
+    )
+    args = parser.parse_args()
+
+    manifest = build_corpus(args.output_dir, args.scenario)
+    for name, entry in manifest.items():
+        print(f"{name:<18}{entry['pages']:>6} 頁{entry['bytes'] / 1024:>10.1f} KB  {entry['sha256'][:12]}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
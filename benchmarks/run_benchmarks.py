@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+清洗效能基準測試 - 以合成語料量測兩種清洗模式的吞吐量與記憶體
+Cleaning Benchmark - Measure throughput and peak memory of both cleaning modes
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+from make_corpus import DEFAULT_CORPUS_DIR, SCENARIOS, build_corpus  # noqa: E402
+
+MODES = ("extract", "print")
+
+# 單次量測至少累積的清洗耗時；較短的文件會重複清洗並取平均，避免計時被排程雜訊主導
+MIN_RUN_SECONDS = 0.5
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """目前行程的最高常駐記憶體 (MB)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 回報，macOS 以 bytes 回報
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def _make_calibration():
+    """建立不經過本專案程式碼的固定校正工作量（PyMuPDF 渲染、zlib 壓縮與純 Python 運算）
+
+    回傳一個執行一輪工作量並回傳耗時的函式，用來反映量測機器當下的速度。
+    """
+    import zlib
+
+    import fitz
+
+    doc = fitz.open()
+    page = doc.new_page()
+    for i in range(40):
+        page.insert_text((36, 36 + i * 18), "calibration workload " * 4)
+
+    def calibrate() -> float:
+        start = time.perf_counter()
+        pix = page.get_pixmap(dpi=150)
+        zlib.compress(pix.samples, 6)
+        sum(i * i for i in range(75000))
+        return time.perf_counter() - start
+
+    return calibrate
+
+
+def run_single(mode: str, input_path: str, dpi: int) -> Dict:
+    """在目前行程中清洗一份文件並回傳量測結果（由子行程呼叫）
+
+    每次清洗前後交錯執行一輪校正工作量，relative_seconds 為清洗與校正的平均耗時比，
+    不受機器速度與當下負載影響。第一次清洗不到 MIN_RUN_SECONDS 時視為暖機並捨棄，
+    之後重複清洗到累積 MIN_RUN_SECONDS，seconds 為每次的平均耗時。
+    """
+    from log_config import configure_logging
+
+    configure_logging(log_file="-", level=logging.ERROR, console=False)
+    calibrate = _make_calibration()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_path = os.path.join(tmp_dir, "out.pdf")
+        if mode == "print":
+            from print import PDFPrintCleaner
+
+            cleaner = PDFPrintCleaner()
+
+            def clean():
+                return cleaner.print_clean_pdf(input_path, output_path, dpi)
+
+        else:
+            from pdf_cleaner import PDFCleaner
+
+            cleaner = PDFCleaner()
+
+            def clean():
+                return cleaner.clean_pdf(input_path, output_path)
+
+        calibrations = [calibrate()]
+        start = time.perf_counter()
+        result = clean()
+        total = time.perf_counter() - start
+        iterations = 1
+
+        if total < MIN_RUN_SECONDS and result.get("success", False):
+            calibrations = []
+            total = 0.0
+            iterations = 0
+            while total < MIN_RUN_SECONDS:
+                calibrations.append(calibrate())
+                start = time.perf_counter()
+                result = clean()
+                total += time.perf_counter() - start
+                iterations += 1
+                if not result.get("success", False):
+                    break
+        calibrations.append(calibrate())
+
+        elapsed = total / iterations
+        calibration = statistics.mean(calibrations)
+        output_bytes = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+
+    return {
+        "success": result.get("success", False),
+        "seconds": elapsed,
+        "calibration_seconds": calibration,
+        "relative_seconds": elapsed / calibration,
+        "output_bytes": output_bytes,
+        "peak_rss_mb": _peak_rss_mb(),
+        "timings": result.get("timings", {}),
+    }
+
+
+def _run_child(args: List[str]) -> Dict:
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__)] + args,
+        cwd=REPO_ROOT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip())
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _run_in_subprocess(mode: str, input_path: str, dpi: int) -> Dict:
+    # 每次量測使用全新的直譯器，讓最高記憶體用量互不影響
+    return _run_child(["--child", mode, input_path, str(dpi)])
+
+
+def benchmark_scenario(
+    scenario: str, entry: Dict, corpus_dir: str, mode: str, dpi: int, repeat: int
+) -> Dict:
+    """重複量測單一情境，取耗時（含相對校正耗時）中位數與最高記憶體"""
+    input_path = os.path.join(corpus_dir, entry["file"])
+    runs = [_run_in_subprocess(mode, input_path, dpi) for _ in range(repeat)]
+
+    seconds = statistics.median(run["seconds"] for run in runs)
+    peaks = [run["peak_rss_mb"] for run in runs if run["peak_rss_mb"] is not None]
+
+    # 各階段耗時取中位數
+    stage_names = sorted({name for run in runs for name in run["timings"]})
+    timings = {
+        name: round(statistics.median(run["timings"].get(name, 0.0) for run in runs), 4)
+        for name in stage_names
+    }
+
+    return {
+        "scenario": scenario,
+        "mode": mode,
+        "dpi": dpi if mode == "print" else None,
+        "success": all(run["success"] for run in runs),
+        "pages": entry["pages"],
+        "input_bytes": entry["bytes"],
+        "output_bytes": runs[-1]["output_bytes"],
+        "seconds": round(seconds, 4),
+        "pages_per_s": round(entry["pages"] / seconds, 3) if seconds else None,
+        "mb_per_s": round(entry["bytes"] / (1024 * 1024) / seconds, 3) if seconds else None,
+        "peak_rss_mb": round(max(peaks), 1) if peaks else None,
+        "timings": timings,
+        "calibration_seconds": round(
+            statistics.median(run["calibration_seconds"] for run in runs), 4
+        ),
+        "relative_seconds": round(statistics.median(run["relative_seconds"] for run in runs), 4),
+    }
+
+
+def run_benchmarks(
+    corpus_dir: str = DEFAULT_CORPUS_DIR,
+    scenarios: Optional[List[str]] = None,
+    modes=MODES,
+    dpi: int = 150,
+    repeat: int = 3,
+) -> List[Dict]:
+    """對語料中的每個情境與模式執行基準測試"""
+    manifest_path = os.path.join(corpus_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        build_corpus(corpus_dir)
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    results = []
+    for scenario in scenarios or SCENARIOS:
+        if scenario not in manifest:
+            manifest.update(build_corpus(corpus_dir, [scenario]))
+        for mode in modes:
+            results.append(
+                benchmark_scenario(scenario, manifest[scenario], corpus_dir, mode, dpi, repeat)
+            )
+    return results
+
+
+def print_report(results: List[Dict]):
+    """輸出基準測試結果表格"""
+    print("=" * 78)
+    print("PDF清洗效能基準測試")
+    print("=" * 78)
+    print(
+        f"{'情境':<16}{'模式':<9}{'頁數':>6}{'秒':>9}{'頁/秒':>10}{'MB/秒':>9}{'最高RSS(MB)':>13}"
+    )
+    for r in results:
+        status = "" if r["success"] else "  ❌"
+        peak = f"{r['peak_rss_mb']:.1f}" if r["peak_rss_mb"] is not None else "-"
+        print(
+            f"{r['scenario']:<16}{r['mode']:<9}{r['pages']:>6}{r['seconds']:>9.3f}"
+            f"{r['pages_per_s']:>10.2f}{r['mb_per_s']:>9.2f}{peak:>13}{status}"
+        )
+    print("=" * 78)
+
+
+def main():
+    """主程式入口"""
+    if len(sys.argv) == 5 and sys.argv[1] == "--child":
+        _, _, mode, input_path, dpi = sys.argv
+        sys.stdout.write(json.dumps(run_single(mode, input_path, int(dpi))) + "\n")
+        return 0
+
+    parser = argparse.ArgumentParser(description="PDF清洗效能基準測試（完全離線執行）")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_DIR, help="語料目錄 (不存在時自動產生)")
+    parser.add_argument(
+        "--scenario", action="append", choices=sorted(SCENARIOS), help="只測試指定情境"
+    )
+    parser.add_argument("--mode", action="append", choices=MODES, help="只測試指定模式")
+    parser.add_argument("--dpi", type=int, default=150, help="列印模式渲染DPI (預設: 150)")
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="重複次數 (預設: 3)")
+    parser.add_argument("--json", dest="json_path", help="將結果寫入JSON檔案")
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        args.corpus, args.scenario, args.mode or MODES, args.dpi, args.repeat
+    )
+    print_report(results)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    return 0 if all(r["success"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
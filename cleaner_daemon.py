@@ -0,0 +1,557 @@
+#!/usr/bin/env python3
+"""
+PDF清洗常駐服務 - 以預先啟動的工作行程池提供低延遲清洗
+PDF Cleaning Daemon - Low-latency cleaning with a prefork pool of warm workers
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from batch_cleaner import (
+    BLANK_PAGE_MODES,
+    COLORSPACES,
+    MODES,
+    PALETTE_MODES,
+    _init_worker,
+    clean_one,
+    default_worker_count,
+    validate_options,
+)
+from log_config import configure_logging
+from memory_budget import MB, MemoryBudget, default_memory_budget, estimate_job
+from metrics import DEFAULT_METRICS_PORT, CleanerMetrics, send_metrics, start_metrics_server
+from pdf_source import dpi_arg
+
+DEFAULT_PORT = 8765
+
+# 本機HTTP接受的 Host 名稱（不含埠）；其他名稱可能是 DNS rebinding 的網頁
+LOCAL_HOSTS = ("127.0.0.1", "localhost")
+
+
+class _DaemonRequestHandler(BaseHTTPRequestHandler):
+    """處理清洗請求的HTTP處理器"""
+
+    server_version = "CleanPDFDaemon/1.0"
+
+    def address_string(self):
+        # Unix socket 沒有 (host, port) 形式的用戶端位址
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"
+
+    def log_message(self, format, *args):
+        self.server.cleaner_daemon.logger.debug(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _host_allowed(self) -> bool:
+        """
+        檢查 Host 標頭是否為本機位址
+
+        瀏覽器中的網頁可透過 DNS rebinding 連到 127.0.0.1，但 Host 仍是該網頁的網域，
+        因此本機HTTP只接受 LOCAL_HOSTS (可附帶服務的埠)。Unix socket 不需檢查。
+        """
+        port = getattr(self.server, "local_port", None)
+        if port is None:
+            return True
+        host = (self.headers.get("Host") or "").lower()
+        return host in LOCAL_HOSTS or host in {f"{name}:{port}" for name in LOCAL_HOSTS}
+
+    def _reject_host(self) -> bool:
+        if self._host_allowed():
+            return False
+        self._send_json(403, {"success": False, "message": "拒絕非本機的 Host"})
+        return True
+
+    def do_GET(self):
+        if self._reject_host():
+            return
+        if self.path == "/health":
+            self._send_json(200, self.server.cleaner_daemon.status())
+        elif self.path == "/metrics":
+            send_metrics(self, self.server.cleaner_daemon.metrics)
+        else:
+            self._send_json(404, {"success": False, "message": "找不到路徑"})
+
+    def do_POST(self):
+        if self._reject_host():
+            return
+        if self.path != "/clean":
+            self._send_json(404, {"success": False, "message": "找不到路徑"})
+            return
+        # 只接受 JSON：瀏覽器不經 CORS 預檢即可送出 text/plain 等「簡單」請求
+        if self.headers.get_content_type() != "application/json":
+            self._send_json(
+                415, {"success": False, "message": "Content-Type 必須為 application/json"}
+            )
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job = json.loads(self.rfile.read(length) or b"{}")
+        except (ValueError, json.JSONDecodeError) as e:
+            self._send_json(400, {"success": False, "message": f"請求格式錯誤: {e}"})
+            return
+
+        status, result = self.server.cleaner_daemon.submit(job)
+        headers = {"Retry-After": "1"} if status == 503 else None
+        self._send_json(status, result, headers)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """以Unix socket提供服務的HTTP伺服器"""
+
+    daemon_threads = True
+
+
+class CleanerDaemon:
+    """PDF清洗常駐服務 - 工作行程預先載入函式庫並持有清洗器實例"""
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        max_tasks_per_child: Optional[int] = None,
+        memory_budget: Optional[int] = None,
+    ):
+        self.setup_logging()
+        self.workers = workers or default_worker_count("print")
+        # 允許排隊的請求數，超過時回應 503 讓用戶端退避重試
+        self.queue_size = self.workers * 2 if queue_size is None else queue_size
+        self.max_tasks_per_child = max_tasks_per_child
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        # 依預估記憶體放行請求，預算不足時請求在佇列中等待
+        if memory_budget is None:
+            memory_budget = default_memory_budget()
+        self.budget = MemoryBudget(memory_budget) if memory_budget else None
+        self._lock = threading.Lock()
+        self._active = 0
+        self._completed = 0
+        self._rejected = 0
+        self.metrics = CleanerMetrics()
+        self.metrics.add_gauge("clean_pdf_in_progress", "執行中的清洗請求數", lambda: self._active)
+        if self.budget is not None:
+            self.metrics.add_gauge(
+                "clean_pdf_memory_reserved_bytes",
+                "執行中請求的預估記憶體用量",
+                lambda: self.budget.reserved_bytes,
+            )
+        self.pool = None
+        self._pool_lock = threading.Lock()
+        self.server = None
+
+    def setup_logging(self):
+        """設定日誌（每個行程只設定一次，已設定時沿用既有設定）"""
+        configure_logging(default_log_file="pdf_cleaner_daemon.log")
+        self.logger = logging.getLogger(__name__)
+
+    def start_pool(self):
+        """
+        預先啟動所有工作行程，讓第一個請求就能使用已載入的清洗器
+
+        使用 ProcessPoolExecutor：工作行程因惡意文件當機（segfault、OOM）時，
+        執行中的請求會收到 BrokenProcessPool 而不會永遠等待，行程池隨後重新建立。
+        """
+        kwargs = {}
+        if self.max_tasks_per_child:
+            # max_tasks_per_child 需要 spawn 啟動方式（Python 3.11+）
+            kwargs["max_tasks_per_child"] = self.max_tasks_per_child
+            kwargs["mp_context"] = multiprocessing.get_context("spawn")
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker, initargs=(MODES, {}), **kwargs
+        )
+        # 同時送出與行程數相同的空工作，讓所有行程立即啟動並完成初始化
+        wait([self.pool.submit(os.getpid) for _ in range(self.workers)])
+        self.logger.info(f"已啟動 {self.workers} 個工作行程")
+
+    def _restart_pool(self, broken: ProcessPoolExecutor):
+        """工作行程異常結束後重新建立行程池（多個請求同時失敗時只重建一次）"""
+        with self._pool_lock:
+            if self.pool is not broken:
+                return
+            self.logger.error("工作行程異常結束，重新啟動工作行程池")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.start_pool()
+
+    def status(self) -> Dict:
+        """回傳服務狀態"""
+        with self._lock:
+            return {
+                "success": True,
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "active": self._active,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "memory_budget_mb": (
+                    round(self.budget.total_bytes / MB, 1) if self.budget else None
+                ),
+                "memory_reserved_mb": (
+                    round(self.budget.reserved_bytes / MB, 1) if self.budget else None
+                ),
+            }
+
+    def submit(self, job: Dict):
+        """執行一個清洗請求，回傳 (HTTP狀態碼, 結果)"""
+        input_path = job.get("input")
+        output_path = job.get("output")
+        mode = job.get("mode", "extract")
+
+        if not input_path or not output_path:
+            return 400, {"success": False, "message": "缺少 input 或 output"}
+        if mode not in MODES:
+            return 400, {"success": False, "message": f"不支援的清洗模式: {mode}"}
+
+        options = {
+            "dpi": job.get("dpi", 300),
+            "output_dpi": job.get("output_dpi"),
+            "max_image_dpi": job.get("max_image_dpi"),
+            "optimize": job.get("optimize", False),
+            "linearize": job.get("linearize", False),
+            "deterministic": job.get("deterministic", False),
+            "verify": job.get("verify", False),
+            "blank_pages": job.get("blank_pages", "keep"),
+            "palette": job.get("palette", "lossless"),
+            "colorspace": job.get("colorspace", "rgb"),
+        }
+        error = validate_options(options)
+        if error:
+            return 400, {"success": False, "message": f"選項錯誤: {error}"}
+
+        # 背壓: 工作行程與等待佇列都滿時立即拒絕，不讓請求無限堆積
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            self.metrics.observe_failure(mode, "rejected")
+            return 503, {"success": False, "message": "服務忙碌中，請稍後重試"}
+
+        reserved = 0
+        try:
+            if self.budget is not None:
+                reserved = estimate_job(input_path, mode, options["dpi"])["peak_bytes"]
+                self.budget.acquire(reserved)
+
+            with self._lock:
+                self._active += 1
+            pool = self.pool
+            try:
+                record = pool.submit(clean_one, input_path, output_path, mode, options).result()
+            except BrokenProcessPool:
+                self._restart_pool(pool)
+                self.metrics.observe_failure(mode, "worker_crash")
+                return 500, {"success": False, "message": "處理失敗: 工作行程異常結束"}
+            finally:
+                with self._lock:
+                    self._active -= 1
+            record["memory_estimate_mb"] = round(reserved / MB, 1)
+            self.metrics.observe(record)
+            return 200, record
+
+        except Exception as e:
+            self.logger.error(f"處理請求時發生錯誤: {e}")
+            self.metrics.observe_failure(mode, "worker_crash")
+            return 500, {"success": False, "message": f"處理失敗: {e}"}
+
+        finally:
+            if reserved:
+                self.budget.release(reserved)
+            with self._lock:
+                self._completed += 1
+            self._slots.release()
+
+    def serve(
+        self,
+        socket_path: Optional[str] = None,
+        port: int = DEFAULT_PORT,
+        metrics_port: Optional[int] = None,
+    ):
+        """
+        啟動服務直到收到終止訊號
+
+        服務本身以 GET /metrics 提供指標；使用 Unix socket 時可另外以
+        metrics_port 在本機HTTP埠提供，供 Prometheus 擷取。
+        """
+        self.start_pool()
+        metrics_server = None
+        if metrics_port is not None:
+            metrics_server = start_metrics_server(self.metrics, metrics_port)
+
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self.server = _UnixHTTPServer(socket_path, _DaemonRequestHandler)
+            self.server.local_port = None
+            address = f"unix:{socket_path}"
+        else:
+            # 只綁定本機位址，不對外開放
+            self.server = ThreadingHTTPServer(("127.0.0.1", port), _DaemonRequestHandler)
+            self.server.daemon_threads = True
+            self.server.local_port = port
+            address = f"http://127.0.0.1:{port}"
+
+        self.server.cleaner_daemon = self
+
+        def _stop(signum, frame):
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+
+        self.logger.info(f"清洗服務已啟動: {address}")
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if metrics_server is not None:
+                metrics_server.shutdown()
+            self.pool.shutdown()
+            if socket_path and os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self.logger.info("清洗服務已停止")
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """透過Unix socket連線的HTTP用戶端"""
+
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def request_clean(
+    input_path: str,
+    output_path: str,
+    mode: str = "extract",
+    dpi: int = 300,
+    socket_path: Optional[str] = None,
+    port: int = DEFAULT_PORT,
+    retries: int = 5,
+    timeout: Optional[float] = None,
+    output_dpi: Optional[int] = None,
+    blank_pages: str = "keep",
+    palette: str = "lossless",
+    colorspace: str = "rgb",
+    max_image_dpi: Optional[int] = None,
+    optimize: bool = False,
+    linearize: bool = False,
+    deterministic: bool = False,
+    verify: bool = False,
+) -> Dict:
+    """送出清洗請求，服務忙碌時以指數退避重試"""
+    payload = json.dumps(
+        {
+            # 服務的工作目錄可能不同，一律傳送絕對路徑
+            "input": os.path.abspath(input_path),
+            "output": os.path.abspath(output_path),
+            "mode": mode,
+            "dpi": dpi,
+            "output_dpi": output_dpi,
+            "max_image_dpi": max_image_dpi,
+            "optimize": optimize,
+            "linearize": linearize,
+            "deterministic": deterministic,
+            "verify": verify,
+            "blank_pages": blank_pages,
+            "palette": palette,
+            "colorspace": colorspace,
+        }
+    ).encode("utf-8")
+
+    delay = 0.1
+    for attempt in range(retries + 1):
+        if socket_path:
+            conn = _UnixHTTPConnection(socket_path, timeout=timeout)
+        else:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+
+        try:
+            conn.request(
+                "POST", "/clean", body=payload, headers={"Content-Type": "application/json"}
+            )
+            response = conn.getresponse()
+            result = json.loads(response.read() or b"{}")
+        finally:
+            conn.close()
+
+        if response.status != 503 or attempt == retries:
+            return result
+
+        time.sleep(delay)
+        delay = min(delay * 2, 5.0)
+
+    return result
+
+
+def main():
+    """主程式入口"""
+    parser = argparse.ArgumentParser(description="PDF清洗常駐服務與用戶端")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="啟動清洗服務")
+    serve_parser.add_argument(
+        "-j", "--workers", type=int, help="工作行程數量 (預設: 依CPU與記憶體決定)"
+    )
+    serve_parser.add_argument(
+        "--queue-size", type=int, help="忙碌時允許等待的請求數 (預設: 工作行程數的兩倍)"
+    )
+    serve_parser.add_argument(
+        "--max-tasks-per-child", type=int, help="工作行程處理多少份文件後重新啟動"
+    )
+    serve_parser.add_argument(
+        "--memory-budget",
+        type=int,
+        metavar="MB",
+        help="同時執行請求的預估記憶體總上限 (預設: 可用記憶體的80%%，0 代表不限制)",
+    )
+    serve_parser.add_argument(
+        "--metrics-port",
+        type=int,
+        nargs="?",
+        const=DEFAULT_METRICS_PORT,
+        help=f"另外在本機此埠提供 Prometheus 指標 /metrics (未指定埠時為 {DEFAULT_METRICS_PORT})",
+    )
+
+    client_parser = subparsers.add_parser("clean", help="透過服務清洗檔案")
+    client_parser.add_argument("input", help="輸入PDF檔案路徑")
+    client_parser.add_argument("output", help="輸出清潔PDF檔案路徑")
+    client_parser.add_argument(
+        "--mode", choices=MODES, default="extract", help="清洗模式 (預設: extract)"
+    )
+    client_parser.add_argument(
+        "--dpi", type=int, default=300, help="列印模式渲染DPI (預設: 300)"
+    )
+    client_parser.add_argument(
+        "--output-dpi",
+        type=dpi_arg,
+        help="列印模式輸出解析度，低於 --dpi 時超取樣後縮小 (預設: 與 --dpi 相同)",
+    )
+    client_parser.add_argument(
+        "--max-image-dpi",
+        type=dpi_arg,
+        help="內容提取模式圖片目標解析度，解析度過高的圖片縮小到此解析度 (預設: 不縮小)",
+    )
+    client_parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="輸出最佳化：移除未使用物件、合併相同串流並壓縮為物件串流",
+    )
+    client_parser.add_argument(
+        "--linearize",
+        action="store_true",
+        help="線性化輸出以便網頁檢視器快速顯示第一頁 (隱含 --optimize，需要 pikepdf)",
+    )
+    client_parser.add_argument(
+        "--deterministic",
+        action="store_true",
+        help="可重現輸出：相同的輸入與選項產生位元組完全相同的PDF (不分片、不增量重建)",
+    )
+    client_parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="以低解析度逐頁比較輸入與輸出的外觀，差異過大的頁面列於結果",
+    )
+    client_parser.add_argument(
+        "--blank-pages",
+        choices=BLANK_PAGE_MODES,
+        default="keep",
+        help="列印模式空白頁處理: keep 照常渲染, empty 輸出空白頁, drop 移除 (預設: keep)",
+    )
+    client_parser.add_argument(
+        "--palette",
+        choices=PALETTE_MODES,
+        default="lossless",
+        help="列印模式索引色: lossless 無損, quantize 另量化顏色略多的頁面, off 一律RGB (預設: lossless)",
+    )
+    client_parser.add_argument(
+        "--colorspace",
+        choices=COLORSPACES,
+        default="rgb",
+        help="列印模式輸出色彩: rgb 全彩, gray 灰階, mono 黑白, mono-dither 抖動黑白 (預設: rgb)",
+    )
+
+    for sub in (serve_parser, client_parser):
+        sub.add_argument("--socket", help="Unix socket 路徑 (未指定時使用本機HTTP)")
+        sub.add_argument(
+            "--port", type=int, default=DEFAULT_PORT, help=f"本機HTTP埠 (預設: {DEFAULT_PORT})"
+        )
+        sub.add_argument("-v", "--verbose", action="store_true", help="詳細輸出")
+
+    serve_parser.add_argument(
+        "--log-file", help='日誌檔案路徑，"-" 代表不寫入檔案 (預設: pdf_cleaner_daemon.log)'
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        configure_logging(
+            log_file=args.log_file,
+            level=logging.DEBUG if args.verbose else logging.INFO,
+            default_log_file="pdf_cleaner_daemon.log",
+        )
+        memory_budget = None if args.memory_budget is None else args.memory_budget * MB
+        daemon = CleanerDaemon(
+            args.workers, args.queue_size, args.max_tasks_per_child, memory_budget
+        )
+        daemon.serve(args.socket, args.port, args.metrics_port)
+        return 0
+
+    try:
+        result = request_clean(
+            args.input,
+            args.output,
+            args.mode,
+            args.dpi,
+            args.socket,
+            args.port,
+            output_dpi=args.output_dpi,
+            max_image_dpi=args.max_image_dpi,
+            optimize=args.optimize,
+            linearize=args.linearize,
+            deterministic=args.deterministic,
+            verify=args.verify,
+            blank_pages=args.blank_pages,
+            palette=args.palette,
+            colorspace=args.colorspace,
+        )
+    except OSError as e:
+        print(f"無法連線到清洗服務: {e}")
+        return 1
+
+    print(f"處理狀態: {'✅ 成功' if result.get('success') else '❌ 失敗'}")
+    print(f"處理訊息: {result.get('message', '')}")
+    if "elapsed" in result:
+        print(f"處理時間: {result['elapsed']:.3f} 秒")
+
+    return 0 if result.get("success") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
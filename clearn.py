@@ -14,18 +14,9 @@ import tempfile
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
-try:
-    import fitz  # PyMuPDF
-    import magic  # python-magic for file type detection
-    import PyPDF2
-    from PIL import Image
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib.utils import ImageReader
-    from reportlab.pdfgen import canvas
-except ImportError as e:
-    print(f"缺少必要的函式庫: {e}")
-    print("請執行: pip install PyPDF2 reportlab PyMuPDF Pillow python-magic")
-    sys.exit(1)
+# PyMuPDF、python-magic、PyPDF2、Pillow、reportlab 皆延遲到實際使用的方法內才載入，
+# 讓 --help、驗證或掃描等流程不必付出載入繪圖函式庫的啟動成本。
+# 安裝: pip install PyPDF2 reportlab PyMuPDF Pillow python-magic
 
 
 class PDFCleaner:
@@ -78,6 +69,9 @@ class PDFCleaner:
     def verify_pdf_file(self, file_path: str) -> bool:
         """驗證檔案是否為有效PDF"""
         try:
+            import magic  # python-magic for file type detection
+            import PyPDF2
+
             # 使用magic library檢查檔案類型
             if hasattr(magic, "from_file"):
                 mime_type = magic.from_file(file_path, mime=True)
@@ -136,87 +130,13 @@ class PDFCleaner:
 
         return threats
 
-        # def extract_safe_content(self, input_path: str) -> Tuple[List[Dict], bool]:
-        """提取安全內容"""
-        safe_content = []
-        has_threats = False
-
-        try:
-            # 使用PyMuPDF開啟文件
-            doc = fitz.open(input_path)
-
-            for page_num in range(doc.page_count):
-                page = doc[page_num]
-
-                # 提取純文字內容
-                text = page.get_text()
-
-                # 提取圖片（重新編碼以移除潛在威脅）
-                # 提取圖片（重新編碼以移除潛在威脅）
-            # 提取圖片（重新編碼以移除潛在威脅）
-            images = []
-
-            for img in page.get_images(full=True):
-                xref = img[0]
-
-                # ① 嘗試取得 bbox
-                try:
-                    bbox = page.get_image_bbox(xref)  # 只傳 xref
-                except ValueError:
-                    bbox = None
-
-                pix = None  # 先宣告，避免 finally NameError
-                try:
-                    # ② 轉成 Pixmap
-                    pix = fitz.Pixmap(doc, xref)
-
-                    # ③ 只保留 RGB 圖片
-                    if pix.n - pix.alpha < 4:
-                        img_data = pix.tobytes("png")
-                        images.append(
-                            {
-                                "data": img_data,
-                                "bbox": bbox,
-                                "format": "png",
-                            }
-                        )
-
-                except Exception as e:
-                    self.logger.warning(f"處理圖片時發生錯誤: {e}")
-                    has_threats = True
-
-                finally:
-                    # ④ 釋放 native 記憶體
-                    if pix is not None:
-                        pix = None
-                    # 如果 pix 建立失敗，略過
-
-                # 獲取頁面尺寸
-                page_rect = page.rect
-
-                safe_content.append(
-                    {
-                        "page_num": page_num,
-                        "text": text,
-                        "images": images,
-                        "width": page_rect.width,
-                        "height": page_rect.height,
-                    }
-                )
-
-            doc.close()
-
-        except Exception as e:
-            self.logger.error(f"提取內容時發生錯誤: {e}")
-            has_threats = True
-
-        return safe_content, has_threats
-
     def extract_safe_content(self, input_path: str) -> Tuple[List[Dict], bool]:
         safe_content = []
         has_threats = False
 
         try:
+            import fitz  # PyMuPDF
+
             doc = fitz.open(input_path)
 
             for page_num in range(doc.page_count):
@@ -278,7 +198,9 @@ class PDFCleaner:
         try:
             from io import BytesIO
 
+            from PIL import Image
             from reportlab.lib.pagesizes import letter
+            from reportlab.lib.utils import ImageReader
             from reportlab.pdfgen import canvas
 
             # 建立新的PDF
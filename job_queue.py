@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+"""
+PDF清洗工作佇列 - 以SQLite檔案協調多個工作行程與主機
+PDF Cleaning Job Queue - Coordinate worker processes and hosts through a SQLite file
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+from batch_cleaner import (
+    BLANK_PAGE_MODES,
+    COLORSPACES,
+    MODES,
+    PALETTE_MODES,
+    _init_worker,
+    clean_one,
+    collect_inputs,
+)
+from log_config import configure_logging
+from pdf_source import dpi_arg
+
+# 工作狀態
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+STATES = (QUEUED, RUNNING, DONE, FAILED)
+
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_MAX_ATTEMPTS = 3
+
+# 重試的指數退避：第 n 次重試等待 RETRY_BASE_SECONDS * 2^(n-1) 秒，最多 RETRY_MAX_SECONDS
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    input TEXT NOT NULL,
+    output TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    heartbeat_at REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    last_error TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (state, available_at);
+"""
+
+
+def worker_id() -> str:
+    """以主機名稱與行程編號識別工作行程"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """
+    SQLite 工作佇列 - 取得工作時以 BEGIN IMMEDIATE 鎖定資料庫，同一工作只會交給一個工作行程
+
+    工作行程持有有期限的租約並定期以心跳延長；行程或主機當機時租約逾期，
+    工作會重新交給其他工作行程。例外、當機與可重試的失敗（I/O 錯誤、記憶體不足，
+    見 clean_one 的 transient）以指數退避重試；清洗器回報的其他失敗（例如檔案驗證
+    失敗）直接記錄結果，不再重試。
+    """
+
+    def __init__(self, path: str, lease_seconds: float = DEFAULT_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # 每個執行緒使用自己的連線（心跳執行緒與工作執行緒分開）
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            # 使用傳統日誌模式而非 WAL，資料庫放在 NFS 等共用磁碟上時仍可正確鎖定
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute("PRAGMA busy_timeout=60000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """以 BEGIN IMMEDIATE 取得寫入鎖，避免多個工作行程同時取得同一工作"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def enqueue(
+        self,
+        input_path: str,
+        output_path: str,
+        mode: str = "extract",
+        options: Optional[Dict] = None,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> int:
+        """加入一個工作，回傳工作編號"""
+        if mode not in MODES:
+            raise ValueError(f"不支援的清洗模式: {mode}")
+
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (input, output, mode, options, max_attempts,"
+                " available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    # 其他主機的工作目錄可能不同，一律儲存絕對路徑
+                    os.path.abspath(input_path),
+                    os.path.abspath(output_path),
+                    mode,
+                    json.dumps(options or {}),
+                    max_attempts,
+                    now,
+                    now,
+                    now,
+                ),
+            )
+            return cursor.lastrowid
+
+    def claim(self, owner: str) -> Optional[Dict]:
+        """取得一個可執行的工作並建立租約，沒有工作時回傳 None"""
+        now = time.time()
+        with self._transaction() as conn:
+            # 租約逾期的工作（工作行程可能已當機）：已達重試上限者標記為失敗，
+            # 其餘以指數退避重新排入佇列
+            conn.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END,"
+                " available_at = ? + min(? * (1 << (attempts - 1)), ?),"
+                " lease_owner = NULL, lease_expires = NULL, updated_at = ?,"
+                " last_error = '租約逾期，工作行程可能已當機'"
+                " WHERE state = ? AND lease_expires < ?",
+                (FAILED, QUEUED, now, RETRY_BASE_SECONDS, RETRY_MAX_SECONDS, now, RUNNING, now),
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE state = ? AND available_at <= ? ORDER BY id LIMIT 1",
+                (QUEUED, now),
+            ).fetchone()
+            if row is None:
+                return None
+
+            conn.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, lease_owner = ?,"
+                " lease_expires = ?, heartbeat_at = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, owner, now + self.lease_seconds, now, now, row["id"]),
+            )
+
+        job = dict(row)
+        job["attempts"] += 1
+        job["options"] = json.loads(job["options"])
+        return job
+
+    def heartbeat(self, job_id: int, owner: str) -> bool:
+        """延長租約，租約已被其他工作行程取得時回傳 False"""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, heartbeat_at = ?"
+                " WHERE id = ? AND state = ? AND lease_owner = ?",
+                (now + self.lease_seconds, now, job_id, RUNNING, owner),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: int, owner: str, result: Dict) -> bool:
+        """記錄清洗結果；租約已失效時不覆寫其他工作行程的結果"""
+        now = time.time()
+        state = DONE if result.get("success") else FAILED
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = ?, result = ?, last_error = ?, lease_owner = NULL,"
+                " lease_expires = NULL, updated_at = ?"
+                " WHERE id = ? AND state = ? AND lease_owner = ?",
+                (
+                    state,
+                    json.dumps(result, ensure_ascii=False),
+                    None if result.get("success") else result.get("message"),
+                    now,
+                    job_id,
+                    RUNNING,
+                    owner,
+                ),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id: int, owner: str, error: str, result: Optional[Dict] = None) -> bool:
+        """記錄例外；未達重試上限時以指數退避重新排入佇列（與租約逾期相同）
+
+        result 為清洗器回報的暫時失敗結果（訊息、各階段耗時），一併保存供失敗後檢視。
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs"
+                " WHERE id = ? AND state = ? AND lease_owner = ?",
+                (job_id, RUNNING, owner),
+            ).fetchone()
+            if row is None:
+                return False
+
+            if row["attempts"] >= row["max_attempts"]:
+                state, available_at = FAILED, now
+            else:
+                delay = RETRY_BASE_SECONDS * 2 ** (row["attempts"] - 1)
+                state, available_at = QUEUED, now + min(delay, RETRY_MAX_SECONDS)
+
+            conn.execute(
+                "UPDATE jobs SET state = ?, available_at = ?, last_error = ?,"
+                " result = COALESCE(?, result), lease_owner = NULL, lease_expires = NULL,"
+                " updated_at = ? WHERE id = ?",
+                (
+                    state,
+                    available_at,
+                    error,
+                    None if result is None else json.dumps(result, ensure_ascii=False),
+                    now,
+                    job_id,
+                ),
+            )
+            return True
+
+    def requeue_failed(self) -> int:
+        """將失敗的工作重新排入佇列（重新計算重試次數），回傳筆數"""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = ?, attempts = 0, available_at = ?, updated_at = ?"
+                " WHERE state = ?",
+                (QUEUED, now, now, FAILED),
+            )
+            return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        """各狀態的工作數量"""
+        rows = self._connect().execute(
+            "SELECT state, COUNT(*) AS n FROM jobs GROUP BY state"
+        ).fetchall()
+        counts = {state: 0 for state in STATES}
+        counts.update({row["state"]: row["n"] for row in rows})
+        return counts
+
+    def has_unfinished(self) -> bool:
+        counts = self.counts()
+        return counts[QUEUED] + counts[RUNNING] > 0
+
+    def jobs(self, states: Optional[Iterable[str]] = None) -> List[Dict]:
+        """列出工作（可依狀態篩選）"""
+        query = "SELECT * FROM jobs"
+        params: tuple = ()
+        if states:
+            states = tuple(states)
+            query += f" WHERE state IN ({', '.join('?' for _ in states)})"
+            params = states
+        rows = self._connect().execute(query + " ORDER BY id", params).fetchall()
+        return [dict(row) for row in rows]
+
+
+class _Heartbeat:
+    """背景執行緒，在工作執行期間定期延長租約"""
+
+    def __init__(self, queue: JobQueue, job_id: int, owner: str):
+        self.queue = queue
+        self.job_id = job_id
+        self.owner = owner
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        interval = max(1.0, self.queue.lease_seconds / 3)
+        while not self._stop.wait(interval):
+            try:
+                if not self.queue.heartbeat(self.job_id, self.owner):
+                    logging.getLogger(__name__).warning(
+                        f"工作 {self.job_id} 的租約已失效，結果將不會寫回"
+                    )
+                    return
+            except sqlite3.Error as e:
+                logging.getLogger(__name__).warning(f"更新工作 {self.job_id} 心跳失敗: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def run_worker(
+    db_path: str,
+    lease_seconds: float = DEFAULT_LEASE_SECONDS,
+    poll_interval: float = 1.0,
+    wait: bool = False,
+) -> int:
+    """
+    持續取得並執行工作，回傳處理的工作數
+
+    wait 為 False 時，佇列中沒有待執行或執行中的工作即結束；
+    否則持續輪詢等待新工作。
+    """
+    logger = logging.getLogger(__name__)
+    queue = JobQueue(db_path, lease_seconds)
+    owner = worker_id()
+    _init_worker(MODES, {})
+    processed = 0
+
+    while True:
+        job = queue.claim(owner)
+        if job is None:
+            if not wait and not queue.has_unfinished():
+                return processed
+            time.sleep(poll_interval)
+            continue
+
+        logger.info(f"工作 {job['id']} 開始 (第 {job['attempts']} 次): {job['input']}")
+        try:
+            with _Heartbeat(queue, job["id"], owner):
+                record = clean_one(job["input"], job["output"], job["mode"], job["options"])
+        except Exception as e:
+            queue.fail(job["id"], owner, f"工作行程錯誤: {e}")
+            logger.error(f"工作 {job['id']} 發生錯誤: {e}")
+        else:
+            if not record.get("success") and record.get("transient"):
+                queue.fail(job["id"], owner, record.get("message", ""), record)
+                logger.warning(f"工作 {job['id']} 暫時失敗，稍後重試: {record.get('message', '')}")
+            elif not queue.complete(job["id"], owner, record):
+                logger.warning(f"工作 {job['id']} 的租約已由其他工作行程取得，捨棄結果")
+        processed += 1
+
+
+def _worker_process(db_path: str, lease_seconds: float, poll_interval: float, wait: bool):
+    configure_logging()
+    run_worker(db_path, lease_seconds, poll_interval, wait)
+
+
+def main():
+    """主程式入口"""
+    parser = argparse.ArgumentParser(
+        description="PDF清洗工作佇列 - 以SQLite檔案協調多個工作行程與主機，不需要外部服務"
+    )
+    parser.add_argument("db", help="SQLite 佇列檔案路徑")
+    parser.add_argument("-v", "--verbose", action="store_true", help="詳細輸出")
+    parser.add_argument(
+        "--log-file", help='日誌檔案路徑，"-" 代表不寫入檔案 (預設: pdf_job_queue.log)'
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = subparsers.add_parser("enqueue", help="加入清洗工作")
+    enqueue_parser.add_argument(
+        "inputs", nargs="*", help="輸入目錄、PDF檔案或萬用字元 (例如 'inbox/**/*.pdf')"
+    )
+    enqueue_parser.add_argument("-o", "--output-dir", required=True, help="輸出目錄")
+    enqueue_parser.add_argument("--list", dest="list_file", help="每行一個輸入路徑的清單檔案")
+    enqueue_parser.add_argument(
+        "--mode", choices=MODES, default="extract", help="清洗模式 (預設: extract)"
+    )
+    enqueue_parser.add_argument(
+        "--dpi", type=int, default=300, help="列印模式渲染DPI (預設: 300)"
+    )
+    enqueue_parser.add_argument(
+        "--output-dpi",
+        type=dpi_arg,
+        help="列印模式輸出解析度，低於 --dpi 時超取樣後縮小 (預設: 與 --dpi 相同)",
+    )
+    enqueue_parser.add_argument(
+        "--max-image-dpi",
+        type=dpi_arg,
+        help="內容提取模式圖片目標解析度，解析度過高的圖片縮小到此解析度 (預設: 不縮小)",
+    )
+    enqueue_parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="輸出最佳化：移除未使用物件、合併相同串流並壓縮為物件串流",
+    )
+    enqueue_parser.add_argument(
+        "--linearize",
+        action="store_true",
+        help="線性化輸出以便網頁檢視器快速顯示第一頁 (隱含 --optimize，需要 pikepdf)",
+    )
+    enqueue_parser.add_argument(
+        "--deterministic",
+        action="store_true",
+        help="可重現輸出：相同的輸入與選項產生位元組完全相同的PDF (不分片、不增量重建)",
+    )
+    enqueue_parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="以低解析度逐頁比較輸入與輸出的外觀，差異過大的頁面列於結果",
+    )
+    enqueue_parser.add_argument(
+        "--blank-pages",
+        choices=BLANK_PAGE_MODES,
+        default="keep",
+        help="列印模式空白頁處理: keep 照常渲染, empty 輸出空白頁, drop 移除 (預設: keep)",
+    )
+    enqueue_parser.add_argument(
+        "--palette",
+        choices=PALETTE_MODES,
+        default="lossless",
+        help="列印模式索引色: lossless 無損, quantize 另量化顏色略多的頁面, off 一律RGB (預設: lossless)",
+    )
+    enqueue_parser.add_argument(
+        "--colorspace",
+        choices=COLORSPACES,
+        default="rgb",
+        help="列印模式輸出色彩: rgb 全彩, gray 灰階, mono 黑白, mono-dither 抖動黑白 (預設: rgb)",
+    )
+    enqueue_parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=DEFAULT_MAX_ATTEMPTS,
+        help=f"發生例外或工作行程當機時的最多嘗試次數 (預設: {DEFAULT_MAX_ATTEMPTS})",
+    )
+
+    work_parser = subparsers.add_parser("work", help="執行佇列中的工作")
+    work_parser.add_argument(
+        "-j", "--workers", type=int, default=1, help="本機工作行程數量 (預設: 1)"
+    )
+    work_parser.add_argument(
+        "--lease",
+        type=float,
+        default=DEFAULT_LEASE_SECONDS,
+        help=f"租約秒數，逾期未更新心跳的工作會重新分派 (預設: {DEFAULT_LEASE_SECONDS})",
+    )
+    work_parser.add_argument(
+        "--poll-interval", type=float, default=1.0, help="沒有工作時的輪詢間隔秒數 (預設: 1)"
+    )
+    work_parser.add_argument(
+        "--wait", action="store_true", help="佇列清空後繼續等待新工作，而不是結束"
+    )
+
+    subparsers.add_parser("status", help="顯示各狀態的工作數量與失敗原因")
+    subparsers.add_parser("requeue", help="將失敗的工作重新排入佇列")
+
+    args = parser.parse_args()
+
+    configure_logging(
+        log_file=args.log_file,
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        default_log_file="pdf_job_queue.log",
+    )
+
+    queue = JobQueue(args.db)
+
+    if args.command == "enqueue":
+        inputs = collect_inputs(args.inputs, args.list_file)
+        if not inputs:
+            print("找不到任何PDF輸入檔案")
+            return 1
+        for input_path, rel_output in inputs:
+            queue.enqueue(
+                input_path,
+                os.path.join(args.output_dir, rel_output),
+                args.mode,
+                {
+                    "dpi": args.dpi,
+                    "output_dpi": args.output_dpi,
+                    "max_image_dpi": args.max_image_dpi,
+                    "optimize": args.optimize,
+                    "linearize": args.linearize,
+                    "deterministic": args.deterministic,
+                    "verify": args.verify,
+                    "blank_pages": args.blank_pages,
+                    "palette": args.palette,
+                    "colorspace": args.colorspace,
+                },
+                args.max_attempts,
+            )
+        print(f"已加入 {len(inputs)} 個工作")
+        return 0
+
+    if args.command == "requeue":
+        print(f"已重新排入 {queue.requeue_failed()} 個工作")
+        return 0
+
+    if args.command == "work":
+        if args.workers <= 1:
+            run_worker(args.db, args.lease, args.poll_interval, args.wait)
+        else:
+            processes = [
+                multiprocessing.Process(
+                    target=_worker_process,
+                    args=(args.db, args.lease, args.poll_interval, args.wait),
+                )
+                for _ in range(args.workers)
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+
+    counts = queue.counts()
+    print("\n" + "=" * 60)
+    print("PDF清洗工作佇列狀態")
+    print("=" * 60)
+    print(f"等待中: {counts[QUEUED]}")
+    print(f"執行中: {counts[RUNNING]}")
+    print(f"已完成: {counts[DONE]}")
+    print(f"失敗: {counts[FAILED]}")
+    for job in queue.jobs([FAILED]):
+        print(f"  - #{job['id']} {job['input']}: {job['last_error']}")
+    print("=" * 60)
+
+    return 0 if counts[FAILED] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
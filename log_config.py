@@ -0,0 +1,194 @@
+"""
+日誌設定 - 整個行程只設定一次，以佇列非同步寫出並彙總重複警告
+Logging Setup - Configure once per process, write asynchronously through a
+queue and aggregate repeated warnings per document
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from typing import Optional
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+# 以環境變數覆寫日誌設定，子行程（包含 spawn 啟動者）也會沿用；
+# 日誌檔案設為空字串或 "-" 代表不寫入檔案
+LOG_FILE_ENV = "CLEAN_PDF_LOG_FILE"
+LOG_LEVEL_ENV = "CLEAN_PDF_LOG_LEVEL"
+
+# 同一份文件中相同的警告最多輸出幾次，其餘在文件結束時彙總
+DEFAULT_MAX_REPEATS = 3
+
+_lock = threading.Lock()
+_queue_handler = None
+_listener = None
+_aggregator = None
+_config = None
+
+
+class RepeatedMessageFilter(logging.Filter):
+    """限制同一份文件中重複警告的輸出次數，並記錄被省略的筆數"""
+
+    def __init__(self, max_repeats: int = DEFAULT_MAX_REPEATS):
+        super().__init__()
+        self.max_repeats = max_repeats
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or getattr(record, "aggregated", False):
+            return True
+
+        key = (record.name, record.levelno, record.getMessage())
+        with self._lock:
+            count = self._counts.get(key, 0) + 1
+            self._counts[key] = count
+        return count <= self.max_repeats
+
+    def flush(self, logger: logging.Logger):
+        """輸出被省略警告的彙總並重新計數"""
+        with self._lock:
+            counts, self._counts = self._counts, {}
+
+        for (_name, level, message), count in counts.items():
+            if count > self.max_repeats:
+                logger.log(
+                    level,
+                    f"{message}（本文件共 {count} 次，省略 {count - self.max_repeats} 筆）",
+                    extra={"aggregated": True},
+                )
+
+
+def _build_handlers(log_file: Optional[str], console: bool, stream) -> list:
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = []
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    if console:
+        handlers.append(logging.StreamHandler(stream or sys.stdout))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def _start(config: dict):
+    global _queue_handler, _listener, _aggregator
+
+    root = logging.getLogger()
+    if _queue_handler is not None:
+        root.removeHandler(_queue_handler)
+    _stop_listener()
+
+    log_queue = queue.SimpleQueue()
+    _aggregator = RepeatedMessageFilter(config["max_repeats"])
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    _queue_handler.addFilter(_aggregator)
+
+    handlers = _build_handlers(config["log_file"], config["console"], config["stream"])
+    _listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+
+    root.addHandler(_queue_handler)
+    root.setLevel(config["level"])
+
+
+def configure_logging(
+    log_file: Optional[str] = None,
+    level: Optional[int] = None,
+    console: Optional[bool] = None,
+    stream=None,
+    max_repeats: int = DEFAULT_MAX_REPEATS,
+    default_log_file: Optional[str] = None,
+    force: bool = False,
+):
+    """
+    設定行程的日誌系統；已設定過時直接沿用
+
+    log_file 或 level 明確指定時會覆寫既有設定，並寫入環境變數讓子行程沿用。
+    default_log_file 只在沒有任何設定時使用（各工具的預設日誌檔）。
+    """
+    global _config
+
+    explicit = force or log_file is not None or level is not None
+
+    with _lock:
+        if _listener is not None and not explicit:
+            return
+
+        if log_file is None:
+            log_file = os.environ.get(LOG_FILE_ENV)
+            if log_file is None and _config is not None:
+                log_file = _config["log_file"]
+            if log_file is None:
+                log_file = default_log_file
+        else:
+            os.environ[LOG_FILE_ENV] = log_file
+
+        if level is None:
+            env_level = os.environ.get(LOG_LEVEL_ENV)
+            if env_level:
+                level = logging.getLevelName(env_level.upper())
+            elif _config is not None:
+                level = _config["level"]
+            else:
+                level = logging.INFO
+        else:
+            os.environ[LOG_LEVEL_ENV] = logging.getLevelName(level)
+
+        # 未指定的輸出目的地沿用既有設定（例如 fork 出來的工作行程）
+        if console is None:
+            console = _config["console"] if _config is not None else True
+        if stream is None and _config is not None:
+            stream = _config["stream"]
+
+        _config = {
+            "log_file": None if log_file in ("", "-") else log_file,
+            "level": level,
+            "console": console,
+            "stream": stream,
+            "max_repeats": max_repeats,
+        }
+        _start(_config)
+
+
+def flush_repeated_warnings(logger: logging.Logger):
+    """在一份文件處理結束時輸出重複警告的彙總"""
+    if _aggregator is not None:
+        _aggregator.flush(logger)
+
+
+def _after_fork_in_child():
+    # 子行程沒有父行程的寫出執行緒，必須重新建立，否則日誌會堆積在佇列中
+    global _lock, _queue_handler, _listener, _aggregator
+    _lock = threading.Lock()
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+    _queue_handler = None
+    _listener = None
+    _aggregator = None
+
+
+def _shutdown():
+    with _lock:
+        _stop_listener()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+atexit.register(_shutdown)
@@ -0,0 +1,153 @@
+"""
+記憶體預算 - 在開始清洗前依頁面尺寸與DPI估算記憶體需求並控管同時執行的工作
+Memory Budget - Estimate peak memory from page geometry and DPI before cleaning
+and admit concurrent jobs against a global budget
+"""
+
+import os
+import threading
+from typing import Dict, Optional
+
+MB = 1024 * 1024
+
+# 列印模式渲染為 RGB，每個像素 3 bytes
+BYTES_PER_PIXEL = 3
+
+# 列印模式管線中同時存在的點陣頁數上限（print.PIPELINE_DEPTH + 2 * print.ENCODE_THREADS + 1），
+# 另加一份渲染中 MuPDF 像素圖複製為 bytes 時的副本
+PRINT_PIPELINE_PAGES = 7
+
+# 寫入完成前保留在 reportlab 文件中的頁面（壓縮後）相對於點陣大小的比例
+PRINT_HELD_FACTOR = 0.25
+
+# 開啟文件、解碼內嵌圖片與 MuPDF 快取相對於輸入檔案大小的倍數
+INPUT_FACTOR = 4
+
+# 每份文件與頁面無關的固定開銷
+JOB_OVERHEAD_BYTES = {"extract": 64 * MB, "print": 128 * MB}
+
+# 預設可用於清洗工作的可用記憶體比例
+DEFAULT_BUDGET_FRACTION = 0.8
+
+
+def available_memory_bytes() -> Optional[int]:
+    """取得目前可用的實體記憶體 (bytes)"""
+    try:
+        with open("/proc/meminfo", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_memory_budget(fraction: float = DEFAULT_BUDGET_FRACTION) -> Optional[int]:
+    """預設記憶體預算：目前可用記憶體的固定比例，無法取得時回傳 None"""
+    available = available_memory_bytes()
+    if available is None:
+        return None
+    return int(available * fraction)
+
+
+def page_raster_bytes(width: float, height: float, dpi: int) -> int:
+    """以頁面尺寸（點）與DPI計算渲染後的點陣大小"""
+    scale = dpi / 72
+    return int(width * scale) * int(height * scale) * BYTES_PER_PIXEL
+
+
+def estimate_job(
+    input_path: str, mode: str, dpi: int = 300, pages: Optional[range] = None
+) -> Dict:
+    """
+    在清洗前估算一份文件（或 pages 指定的頁面範圍）的最高記憶體需求
+
+    列印模式依每頁尺寸計算點陣大小：最大的一頁乘上管線中同時存在的頁數決定
+    暫存需求，所有頁面的總和決定寫入完成前保留的壓縮資料。無法開啟的文件只依檔案大小估算。
+    dpi 為指定的渲染DPI；指定輸出DPI時實際渲染DPI不會高於它（print.render_resolution），
+    因此估算值是上限。
+    """
+    try:
+        input_bytes = os.path.getsize(input_path)
+    except OSError:
+        input_bytes = 0
+
+    estimate = {
+        "pages": 0,
+        "page_bytes": 0,
+        "peak_bytes": JOB_OVERHEAD_BYTES[mode] + input_bytes * INPUT_FACTOR,
+    }
+
+    try:
+        import fitz  # PyMuPDF
+
+        with fitz.open(input_path) as doc:
+            estimate["pages"] = doc.page_count
+            if mode != "print":
+                return estimate
+
+            total = 0
+            largest = 0
+            count = 0
+            for page_num in pages if pages is not None else range(doc.page_count):
+                rect = doc.page_cropbox(page_num)
+                raster = page_raster_bytes(rect.width, rect.height, dpi)
+                total += raster
+                largest = max(largest, raster)
+                count += 1
+    except Exception:
+        # 無法解析的文件交由清洗器回報錯誤
+        return estimate
+
+    estimate["page_bytes"] = largest
+    estimate["peak_bytes"] += int(
+        largest * (min(count, PRINT_PIPELINE_PAGES) + 1) + total * PRINT_HELD_FACTOR
+    )
+    return estimate
+
+
+class MemoryBudget:
+    """
+    全域記憶體預算 - 工作依預估的最高記憶體需求取得額度，完成後歸還
+
+    超過整體預算的單一工作只在沒有其他工作執行時放行，避免永遠無法執行。
+    """
+
+    def __init__(self, total_bytes: int):
+        self.total_bytes = total_bytes
+        self.reserved_bytes = 0
+        self.peak_reserved_bytes = 0
+        self._condition = threading.Condition()
+
+    def _fits(self, nbytes: int) -> bool:
+        return self.reserved_bytes == 0 or self.reserved_bytes + nbytes <= self.total_bytes
+
+    def _reserve(self, nbytes: int):
+        self.reserved_bytes += nbytes
+        self.peak_reserved_bytes = max(self.peak_reserved_bytes, self.reserved_bytes)
+
+    def try_acquire(self, nbytes: int) -> bool:
+        """預算足夠時立即取得額度，否則回傳 False"""
+        with self._condition:
+            if not self._fits(nbytes):
+                return False
+            self._reserve(nbytes)
+            return True
+
+    def acquire(self, nbytes: int, timeout: Optional[float] = None) -> bool:
+        """等待直到預算足夠後取得額度，逾時回傳 False"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._fits(nbytes), timeout):
+                return False
+            self._reserve(nbytes)
+            return True
+
+    def release(self, nbytes: int):
+        """歸還額度"""
+        with self._condition:
+            self.reserved_bytes = max(0, self.reserved_bytes - nbytes)
+            self._condition.notify_all()
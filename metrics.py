@@ -0,0 +1,288 @@
+"""
+清洗指標 - 以 Prometheus 文字格式在本機提供吞吐量、延遲分佈與錯誤統計
+Cleaning Metrics - Expose throughput, latency histograms and failure counts
+in Prometheus text format on localhost
+"""
+
+import bisect
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+
+DEFAULT_METRICS_PORT = 9464
+
+# 延遲分佈的上界（秒）：涵蓋常駐服務的毫秒級請求到大型文件的列印重建
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# 計算每秒文件數與頁數的時間窗（秒）
+THROUGHPUT_WINDOW = 60.0
+
+# 依結果訊息開頭判斷失敗原因（較長、較具體的訊息放在前面）
+FAILURE_CAUSES = (
+    ("輸入檔案不存在", "input_missing"),
+    ("檔案驗證失敗", "validation"),
+    ("無法渲染", "render"),
+    ("建立清潔PDF失敗", "rebuild"),
+    ("重建PDF失敗", "rebuild"),
+    ("分片處理失敗", "shard"),
+    ("合併分片失敗", "merge"),
+    ("工作行程錯誤", "worker_crash"),
+    ("移動輸出檔案失敗", "output"),
+    ("處理失敗", "exception"),
+    ("清洗失敗", "exception"),
+)
+
+# 指標名稱 -> (類型, 說明)
+METRICS = {
+    "clean_pdf_documents_total": ("counter", "已處理的文件數"),
+    "clean_pdf_pages_total": ("counter", "已處理的頁數"),
+    "clean_pdf_blank_pages_total": ("counter", "略過渲染的空白頁數"),
+    "clean_pdf_input_bytes_total": ("counter", "成功清洗的輸入檔案大小總和"),
+    "clean_pdf_output_bytes_total": ("counter", "產生的清潔檔案大小總和"),
+    "clean_pdf_document_seconds": ("histogram", "每份文件的處理時間"),
+    "clean_pdf_latency_seconds": ("histogram", "從偵測到檔案到清洗完成的時間"),
+    "clean_pdf_stage_seconds": ("histogram", "每份文件各階段的耗時"),
+    "clean_pdf_threats_total": ("counter", "發現的威脅數（依類型）"),
+    "clean_pdf_failures_total": ("counter", "失敗的文件或請求數（依原因）"),
+    "clean_pdf_cache_requests_total": ("counter", "快取查詢次數"),
+    "clean_pdf_cache_hit_ratio": ("gauge", "快取命中率"),
+    "clean_pdf_documents_per_second": ("gauge", "最近一分鐘每秒處理的文件數"),
+    "clean_pdf_pages_per_second": ("gauge", "最近一分鐘每秒處理的頁數"),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def failure_cause(message: str) -> str:
+    """由結果訊息取得失敗原因標籤"""
+    for prefix, cause in FAILURE_CAUSES:
+        if message.startswith(prefix):
+            return cause
+    return "other"
+
+
+def threat_type(threat: str) -> str:
+    """由威脅描述取得類型標籤（危險動作以動作名稱區分）"""
+    if threat.startswith("發現危險動作: "):
+        return threat.split(": ", 1)[1]
+    return threat.split(":", 1)[0]
+
+
+def _labels(**labels) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in items) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class CleanerMetrics:
+    """
+    彙總清洗結果的指標（執行緒安全）
+
+    observe() 接收 clean_pdf() / print_clean_pdf() 或批次工作的結果紀錄，
+    各階段耗時與快取計數直接取自結果中的 timings 與 counters。
+    """
+
+    def __init__(self, window: float = THROUGHPUT_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        # 指標名稱 -> 標籤 -> [各區間計數, 總和, 次數]
+        self._histograms: Dict[str, Dict[Labels, list]] = {}
+        self._gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+        # 最近完成的 (時間, 頁數)，用於計算每秒吞吐量
+        self._recent = deque()
+        self._started = time.monotonic()
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1):
+        """累加計數器"""
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + value
+
+    def observe_seconds(self, name: str, labels: Labels, seconds: float):
+        """記錄一筆延遲分佈"""
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            entry = series.get(labels)
+            if entry is None:
+                entry = series[labels] = [[0] * len(LATENCY_BUCKETS), 0.0, 0]
+            index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+            if index < len(LATENCY_BUCKETS):
+                entry[0][index] += 1
+            entry[1] += seconds
+            entry[2] += 1
+
+    def add_gauge(self, name: str, help_text: str, callback: Callable[[], float]):
+        """註冊在輸出時才讀取的即時數值（例如執行中的工作數）"""
+        self._gauges[name] = (help_text, callback)
+
+    def observe_failure(self, mode: str, cause: str):
+        """記錄未產生結果紀錄的失敗（例如服務忙碌而拒絕的請求）"""
+        self.inc("clean_pdf_failures_total", _labels(mode=mode, cause=cause))
+
+    def observe(self, record: Dict):
+        """記錄一份文件的清洗結果"""
+        mode = record.get("mode", "extract")
+        success = bool(record.get("success"))
+        pages = record.get("pages_processed", 0) if success else 0
+
+        self.inc(
+            "clean_pdf_documents_total",
+            _labels(mode=mode, status="success" if success else "failure"),
+        )
+        if success:
+            self.inc("clean_pdf_pages_total", _labels(mode=mode), pages)
+            if record.get("pages_blank"):
+                self.inc("clean_pdf_blank_pages_total", _labels(mode=mode), record["pages_blank"])
+            self.inc("clean_pdf_input_bytes_total", _labels(mode=mode), record.get("input_bytes", 0))
+            self.inc("clean_pdf_output_bytes_total", _labels(mode=mode), record.get("output_bytes", 0))
+        else:
+            self.observe_failure(mode, failure_cause(record.get("message", "")))
+
+        if "elapsed" in record:
+            self.observe_seconds("clean_pdf_document_seconds", _labels(mode=mode), record["elapsed"])
+        if "latency" in record:
+            self.observe_seconds("clean_pdf_latency_seconds", _labels(mode=mode), record["latency"])
+        for stage, seconds in record.get("timings", {}).items():
+            self.observe_seconds("clean_pdf_stage_seconds", _labels(mode=mode, stage=stage), seconds)
+
+        for threat in record.get("threats_found", []):
+            self.inc("clean_pdf_threats_total", _labels(type=threat_type(threat)))
+
+        for name, count in record.get("counters", {}).items():
+            for suffix, result in (("_cache_hits", "hit"), ("_cache_misses", "miss")):
+                if name.endswith(suffix):
+                    cache = name[: -len(suffix)]
+                    self.inc("clean_pdf_cache_requests_total", _labels(cache=cache, result=result), count)
+
+        with self._lock:
+            self._recent.append((time.monotonic(), pages))
+
+    def _throughput(self) -> Tuple[float, float]:
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0][0] > self.window:
+                self._recent.popleft()
+            documents = len(self._recent)
+            pages = sum(count for _, count in self._recent)
+        # 啟動未滿一個時間窗時以實際經過時間計算
+        elapsed = max(min(self.window, now - self._started), 1e-9)
+        return documents / elapsed, pages / elapsed
+
+    def _cache_ratios(self) -> Dict[Labels, float]:
+        requests = self._counters.get("clean_pdf_cache_requests_total", {})
+        totals: Dict[str, list] = {}
+        for labels, count in requests.items():
+            label_map = dict(labels)
+            entry = totals.setdefault(label_map["cache"], [0, 0])
+            entry[0 if label_map["result"] == "hit" else 1] += count
+        return {
+            _labels(cache=cache): hits / (hits + misses)
+            for cache, (hits, misses) in totals.items()
+            if hits + misses
+        }
+
+    def render(self) -> str:
+        """輸出 Prometheus 文字格式"""
+        documents_per_second, pages_per_second = self._throughput()
+        lines = []
+
+        def header(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for name, (kind, help_text) in METRICS.items():
+                if kind == "counter":
+                    series = self._counters.get(name, {})
+                    if not series:
+                        continue
+                    header(name, kind, help_text)
+                    for labels, value in sorted(series.items()):
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+                elif kind == "histogram":
+                    series = self._histograms.get(name, {})
+                    if not series:
+                        continue
+                    header(name, kind, help_text)
+                    for labels, (buckets, total, count) in sorted(series.items()):
+                        cumulative = 0
+                        for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+                            cumulative += bucket_count
+                            lines.append(
+                                f"{name}_bucket{_format_labels(labels, ('le', str(bound)))} {cumulative}"
+                            )
+                        lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {count}")
+                        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(round(total, 6))}")
+                        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+                elif name == "clean_pdf_cache_hit_ratio":
+                    ratios = self._cache_ratios()
+                    if not ratios:
+                        continue
+                    header(name, kind, help_text)
+                    for labels, ratio in sorted(ratios.items()):
+                        lines.append(f"{name}{_format_labels(labels)} {round(ratio, 6)}")
+
+        header("clean_pdf_documents_per_second", "gauge", METRICS["clean_pdf_documents_per_second"][1])
+        lines.append(f"clean_pdf_documents_per_second {round(documents_per_second, 6)}")
+        header("clean_pdf_pages_per_second", "gauge", METRICS["clean_pdf_pages_per_second"][1])
+        lines.append(f"clean_pdf_pages_per_second {round(pages_per_second, 6)}")
+
+        for name, (help_text, callback) in sorted(self._gauges.items()):
+            header(name, "gauge", help_text)
+            lines.append(f"{name} {_format_value(float(callback()))}")
+
+        return "\n".join(lines) + "\n"
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    """提供 /metrics 的HTTP處理器"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        send_metrics(self, self.server.metrics)
+
+
+def send_metrics(handler: BaseHTTPRequestHandler, metrics: CleanerMetrics):
+    """以指定的HTTP處理器回應指標內容（常駐服務在既有的伺服器上共用）"""
+    body = metrics.render().encode("utf-8")
+    handler.send_response(200)
+    handler.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+def start_metrics_server(
+    metrics: CleanerMetrics, port: int = DEFAULT_METRICS_PORT, host: str = "127.0.0.1"
+) -> ThreadingHTTPServer:
+    """在背景執行緒啟動只綁定本機的指標伺服器，呼叫端以 shutdown() 停止"""
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    server.daemon_threads = True
+    server.metrics = metrics
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
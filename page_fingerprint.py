@@ -0,0 +1,203 @@
+"""
+頁面指紋 - 以內容串流、資源與頁面幾何計算每頁的穩定雜湊，用於只重建變更的頁面
+Page Fingerprints - Stable per-page hashes of content streams, resources and
+geometry, used to rebuild only the pages that changed
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+from pdf_source import replace_output
+
+# 清潔輸出旁記錄每頁指紋的附屬檔案
+SIDECAR_SUFFIX = ".pages.json"
+SIDECAR_VERSION = 1
+
+_REFERENCE = re.compile(r"(\d+) (\d+) R")
+_LENGTH = re.compile(r"/Length \d+")
+
+
+class _ObjectHasher:
+    """
+    計算PDF物件的內容雜湊
+
+    間接參照以被參照物件的雜湊取代，因此重新存檔造成的物件重新編號不影響結果；
+    串流以解壓縮後的內容計算。指向頁面的參照（例如連結目的地）不展開，
+    避免一頁的指紋受到其他頁面內容影響。
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+        self._memo: Dict[int, str] = {}
+
+    def text(self, source: str) -> str:
+        """將物件原始碼中的參照換成被參照物件的雜湊"""
+        return _REFERENCE.sub(lambda m: f"<{self.digest(int(m.group(1)))}>", source)
+
+    def digest(self, xref: int) -> str:
+        if xref in self._memo:
+            return self._memo[xref]
+        # 先放入佔位值，循環參照（例如註解的 /Parent）不會無限遞迴
+        self._memo[xref] = "cycle"
+
+        doc = self.doc
+        if doc.xref_get_key(xref, "Type")[1] in ("/Page", "/Pages"):
+            self._memo[xref] = "page"
+            return "page"
+
+        h = hashlib.sha256()
+        source = doc.xref_object(xref, compressed=True)
+        if doc.xref_is_stream(xref):
+            h.update(self.text(_LENGTH.sub("", source)).encode("utf-8"))
+            try:
+                h.update(doc.xref_stream(xref) or b"")
+            except Exception:
+                h.update(doc.xref_stream_raw(xref) or b"")
+        else:
+            h.update(self.text(source).encode("utf-8"))
+
+        self._memo[xref] = h.hexdigest()
+        return self._memo[xref]
+
+
+def _inherited_key(doc, xref: int, key: str) -> Tuple[str, str]:
+    # /Resources 可以繼承自頁面樹中的上層節點
+    for _depth in range(64):
+        kind, value = doc.xref_get_key(xref, key)
+        if kind != "null":
+            return kind, value
+        kind, parent = doc.xref_get_key(xref, "Parent")
+        if kind != "xref":
+            break
+        xref = int(parent.split()[0])
+    return "null", ""
+
+
+def page_fingerprints(doc) -> List[str]:
+    """計算文件每頁的指紋（內容串流、資源、註解與頁面幾何）"""
+    hasher = _ObjectHasher(doc)
+    fingerprints = []
+    for page_num in range(doc.page_count):
+        page = doc[page_num]
+        h = hashlib.sha256()
+        h.update(repr((tuple(page.mediabox), tuple(page.cropbox), page.rotation)).encode("ascii"))
+        for key in ("Contents", "Resources", "Annots"):
+            kind, value = _inherited_key(doc, page.xref, key)
+            h.update(f"/{key} {kind} {hasher.text(value)}".encode("utf-8"))
+        fingerprints.append(h.hexdigest())
+    return fingerprints
+
+
+def sidecar_path(output_path: str) -> str:
+    return output_path + SIDECAR_SUFFIX
+
+
+def load_page_map(
+    previous_path: str,
+    dpi: int,
+    output_dpi: Optional[int] = None,
+    colorspace: str = "rgb",
+    palette: str = "lossless",
+    blank_pages: str = "keep",
+) -> Dict[str, int]:
+    """
+    讀取先前清潔輸出的頁面指紋，回傳 {指紋: 頁碼}
+
+    附屬檔案不存在、DPI、輸出色彩、索引色或空白頁處理方式不同，或輸出檔案在記錄後
+    被修改時回傳空字典（全部重建）。
+    """
+    try:
+        with open(sidecar_path(previous_path), "r", encoding="utf-8") as f:
+            sidecar = json.load(f)
+        if (
+            sidecar.get("version") != SIDECAR_VERSION
+            or sidecar.get("dpi") != dpi
+            or sidecar.get("output_dpi") != output_dpi
+            or sidecar.get("colorspace", "rgb") != colorspace
+            or sidecar.get("palette", "lossless") != palette
+            or sidecar.get("blank_pages", "keep") != blank_pages
+            or sidecar.get("output_size") != os.path.getsize(previous_path)
+        ):
+            return {}
+    except (OSError, ValueError):
+        return {}
+
+    page_map: Dict[str, int] = {}
+    for page_num, fingerprint in enumerate(sidecar.get("fingerprints", [])):
+        page_map.setdefault(fingerprint, page_num)
+    return page_map
+
+
+def save_page_map(
+    output_path: str,
+    fingerprints: List[str],
+    dpi: int,
+    output_dpi: Optional[int] = None,
+    colorspace: str = "rgb",
+    palette: str = "lossless",
+    blank_pages: str = "keep",
+):
+    """在清潔輸出旁記錄每頁指紋，供下次增量重建使用"""
+    sidecar = {
+        "version": SIDECAR_VERSION,
+        "dpi": dpi,
+        "output_dpi": output_dpi,
+        "colorspace": colorspace,
+        "palette": palette,
+        "blank_pages": blank_pages,
+        "output_size": os.path.getsize(output_path),
+        "fingerprints": fingerprints,
+    }
+    with open(sidecar_path(output_path), "w", encoding="utf-8") as f:
+        json.dump(sidecar, f)
+
+
+def assemble_pages(
+    plan: List[Tuple[str, int]],
+    previous_path: Optional[str],
+    rebuilt_data: bytes,
+    output_path: str,
+):
+    """
+    依 plan 組合輸出：每項為 ("previous", 頁碼) 或 ("rebuilt", 頁碼)
+
+    連續的頁面一次複製。先寫入暫存檔再取代，輸出與先前的檔案相同時也能安全覆寫。
+    """
+    import fitz  # PyMuPDF
+
+    # 合併連續頁面為 (來源, 起始頁, 結束頁)
+    runs: List[List] = []
+    for source, page_num in plan:
+        if runs and runs[-1][0] == source and runs[-1][2] + 1 == page_num:
+            runs[-1][2] = page_num
+        else:
+            runs.append([source, page_num, page_num])
+
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    fd, temp_path = tempfile.mkstemp(suffix=".pdf", dir=output_dir)
+    os.close(fd)
+    try:
+        with fitz.open() as merged:
+            previous = fitz.open(previous_path) if previous_path else None
+            rebuilt = fitz.open(stream=rebuilt_data, filetype="pdf") if rebuilt_data else None
+            try:
+                for source, first, last in runs:
+                    merged.insert_pdf(
+                        previous if source == "previous" else rebuilt,
+                        from_page=first,
+                        to_page=last,
+                    )
+            finally:
+                for doc in (previous, rebuilt):
+                    if doc is not None:
+                        doc.close()
+            merged.save(temp_path)
+        replace_output(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
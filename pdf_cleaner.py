@@ -8,24 +8,55 @@ import os
 import sys
 import logging
 import hashlib
+import json
 import tempfile
 import shutil
 from pathlib import Path
 from typing import List, Dict, Tuple, Optional
 import argparse
+from io import BytesIO
+
+from log_config import configure_logging, flush_repeated_warnings
+from pdf_optimize import describe_optimization, optimize_pdf
+from pdf_source import (DEFAULT_SPOOL_MB, STDIO_PATH, TRANSIENT_ERRORS, describe_source, dpi_arg,
+                        is_path, open_pdf_document, read_pdf_source, reserve_stdout, spool_stream,
+                        stream_output)
+from profiling import DEFAULT_TOP_PAGES, StageProfiler
+from stage_timer import StageTimer
+from visual_verify import describe_verification, verify_pdf
+
+# PyPDF2、reportlab、PyMuPDF、Pillow、python-magic 皆延遲到實際使用的方法內才載入，
+# 讓 --help、驗證或掃描等流程不必付出載入繪圖函式庫的啟動成本。
+# 安裝: pip install PyPDF2 reportlab PyMuPDF Pillow python-magic
+
+# 有效解析度超過目標解析度此倍數的圖片才重新取樣（差距不大時重新取樣得不償失）
+DOWNSAMPLE_THRESHOLD = 1.5
+
+
+def effective_image_dpi(width: int, height: int, bbox) -> Optional[float]:
+    """
+    以圖片像素尺寸與頁面上的顯示範圍 (points) 計算有效解析度
+
+    取兩軸中較低者；旋轉的圖片兩軸對應錯開時只會低估，不會過度縮小。
+    無法取得有效顯示範圍時回傳 None。
+    """
+    try:
+        box_width, box_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+    except (TypeError, IndexError):
+        return None
+    if not (0 < box_width < 1e6 and 0 < box_height < 1e6):
+        return None
+    return min(width * 72 / box_width, height * 72 / box_height)
+
+
+def downsample_size(width: int, height: int, dpi: float,
+                    max_dpi: Optional[int]) -> Optional[Tuple[int, int]]:
+    """有效解析度超過 max_dpi 的門檻時回傳縮小後的像素尺寸，否則回傳 None"""
+    if not max_dpi or dpi <= max_dpi * DOWNSAMPLE_THRESHOLD:
+        return None
+    scale = max_dpi / dpi
+    return max(1, round(width * scale)), max(1, round(height * scale))
 
-try:
-    import PyPDF2
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib.utils import ImageReader
-    import fitz  # PyMuPDF
-    from PIL import Image
-    import magic  # python-magic for file type detection
-except ImportError as e:
-    print(f"缺少必要的函式庫: {e}")
-    print("請執行: pip install PyPDF2 reportlab PyMuPDF Pillow python-magic")
-    sys.exit(1)
 
 class PDFCleaner:
     """
@@ -48,29 +79,29 @@ class PDFCleaner:
         ]
     
     def setup_logging(self):
-        """設定日誌系統"""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('pdf_cleaner.log', encoding='utf-8'),
-                logging.StreamHandler(sys.stdout)
-            ]
-        )
+        """設定日誌系統（每個行程只設定一次，已設定時沿用既有設定）"""
+        configure_logging(default_log_file='pdf_cleaner.log')
         self.logger = logging.getLogger(__name__)
     
-    def verify_pdf_file(self, file_path: str) -> bool:
-        """驗證檔案是否為有效PDF"""
+    def verify_pdf_file(self, file_path) -> bool:
+        """驗證檔案是否為有效PDF（接受檔案路徑或PDF位元組）"""
         try:
+            import magic  # python-magic for file type detection
+            import PyPDF2
+
             # 使用magic library檢查檔案類型
-            if hasattr(magic, 'from_file'):
-                mime_type = magic.from_file(file_path, mime=True)
+            if is_path(file_path):
+                detect_mime = getattr(magic, 'from_file', None)
+            else:
+                detect_mime = getattr(magic, 'from_buffer', None)
+            if detect_mime is not None:
+                mime_type = detect_mime(file_path, mime=True)
                 if mime_type != 'application/pdf':
                     self.logger.warning(f"檔案類型不正確: {mime_type}")
                     return False
             
             # 使用PyPDF2進行基本驗證
-            with open(file_path, 'rb') as file:
+            with (open(file_path, 'rb') if is_path(file_path) else BytesIO(file_path)) as file:
                 reader = PyPDF2.PdfReader(file)
                 if reader.is_encrypted:
                     self.logger.warning("檔案已加密，需要解密")
@@ -87,85 +118,116 @@ class PDFCleaner:
         
         return True
     
-    def scan_malicious_content(self, file_path: str) -> List[str]:
-        """掃描惡意內容"""
+    def scan_malicious_content(self, file_path) -> List[str]:
+        """掃描惡意內容（接受檔案路徑或PDF位元組）"""
         threats = []
         
         try:
-            with open(file_path, 'rb') as file:
-                content = file.read()
-                content_str = content.decode('utf-8', errors='ignore')
-                
-                # 檢查危險動作
-                for action in self.dangerous_actions:
-                    if action in content_str:
-                        threats.append(f"發現危險動作: {action}")
-                        self.logger.warning(f"發現威脅: {action}")
-                
-                # 檢查可疑的編碼內容
-                if b'%PDF-' not in content[:50]:
-                    threats.append("檔案標頭異常")
-                
-                # 檢查XFA表單（可能包含惡意腳本）
-                if b'<xfa:' in content or b'/XFA' in content:
-                    threats.append("發現XFA表單內容")
-                
-                # 檢查嵌入檔案
-                if b'/EmbeddedFile' in content or b'/FileAttachment' in content:
-                    threats.append("發現嵌入檔案")
-                
+            if is_path(file_path):
+                with open(file_path, 'rb') as file:
+                    content = file.read()
+            else:
+                content = file_path
+
+            content_str = content.decode('utf-8', errors='ignore')
+            
+            # 檢查危險動作
+            for action in self.dangerous_actions:
+                if action in content_str:
+                    threats.append(f"發現危險動作: {action}")
+                    self.logger.warning(f"發現威脅: {action}")
+            
+            # 檢查可疑的編碼內容
+            if b'%PDF-' not in content[:50]:
+                threats.append("檔案標頭異常")
+            
+            # 檢查XFA表單（可能包含惡意腳本）
+            if b'<xfa:' in content or b'/XFA' in content:
+                threats.append("發現XFA表單內容")
+            
+            # 檢查嵌入檔案
+            if b'/EmbeddedFile' in content or b'/FileAttachment' in content:
+                threats.append("發現嵌入檔案")
+            
         except Exception as e:
             self.logger.error(f"掃描過程中發生錯誤: {e}")
             threats.append(f"掃描錯誤: {e}")
         
         return threats
     
-    def extract_safe_content(self, input_path: str) -> Tuple[List[Dict], bool]:
-        """提取安全內容"""
+    def extract_safe_content(self, input_path,
+                             timer: Optional[StageTimer] = None,
+                             pages: Optional[range] = None,
+                             max_image_dpi: Optional[int] = None) -> Tuple[List[Dict], bool]:
+        """
+        提取安全內容（接受檔案路徑或PDF位元組，pages 指定只提取的頁面範圍）
+        
+        指定 max_image_dpi 時，依頁面上的顯示範圍計算每張圖片的有效解析度，
+        超過目標解析度的圖片在重新編碼前縮小，縮小的圖片記錄於 'downsampled'。
+        """
         safe_content = []
         has_threats = False
+        timer = timer or StageTimer()
         
         try:
             # 使用PyMuPDF開啟文件
-            doc = fitz.open(input_path)
+            doc = open_pdf_document(input_path)
+            # 多個頁面共用的圖片 (同一個 xref、相同輸出尺寸) 只解碼一次
+            image_cache: Dict[Tuple, Optional[Dict]] = {}
             
-            for page_num in range(doc.page_count):
-                page = doc[page_num]
-                
-                # 提取純文字內容
-                text = page.get_text()
-                
-                # 提取圖片（重新編碼以移除潛在威脅）
-                images = []
-                for img_index, img in enumerate(page.get_images()):
-                    try:
-                        xref = img[0]
-                        pix = fitz.Pixmap(doc, xref)
-                        
-                        # 只處理RGB圖片，避免CMYK等可能有問題的色彩空間
-                        if pix.n - pix.alpha < 4:
-                            img_data = pix.tobytes("png")
-                            images.append({
-                                'data': img_data,
-                                'bbox': page.get_image_bbox(img),
-                                'format': 'png'
-                            })
-                        pix = None
-                        
-                    except Exception as e:
-                        self.logger.warning(f"處理圖片時發生錯誤: {e}")
-                        has_threats = True
-                
-                # 獲取頁面尺寸
-                page_rect = page.rect
-                
-                safe_content.append({
-                    'page_num': page_num,
-                    'text': text,
-                    'images': images,
-                    'width': page_rect.width,
-                    'height': page_rect.height
-                })
+            for page_num in pages if pages is not None else range(doc.page_count):
+                with timer.page(page_num):
+                    page = doc[page_num]
+                    
+                    # 提取純文字內容
+                    text = page.get_text()
+                    
+                    # 提取圖片（重新編碼以移除潛在威脅）
+                    images = []
+                    for img_index, img in enumerate(page.get_images(full=True)):
+                        try:
+                            xref, width, height = img[0], img[2], img[3]
+                            bbox = page.get_image_bbox(img)
+                            dpi = effective_image_dpi(width, height, bbox) if max_image_dpi else None
+                            size = downsample_size(width, height, dpi, max_image_dpi) if dpi else None
+                            key = (xref, size)
+                            if key in image_cache:
+                                timer.count('image_cache_hits')
+                                encoded = image_cache[key]
+                            else:
+                                timer.count('image_cache_misses')
+                                encoded = self._transcode_image(doc, xref, size, timer)
+                                image_cache[key] = encoded
+                            
+                            if encoded is not None:
+                                image = {
+                                    'data': encoded['data'],
+                                    'bbox': bbox,
+                                    'format': 'png'
+                                }
+                                if 'downsampled' in encoded:
+                                    image['downsampled'] = {
+                                        'page': page_num + 1,
+                                        'xref': xref,
+                                        'dpi': round(dpi),
+                                        **encoded['downsampled'],
+                                    }
+                                images.append(image)
+                            
+                        except Exception as e:
+                            self.logger.warning(f"處理圖片時發生錯誤: {e}")
+                            has_threats = True
+                    
+                    # 獲取頁面尺寸
+                    page_rect = page.rect
+                    
+                    safe_content.append({
+                        'page_num': page_num,
+                        'text': text,
+                        'images': images,
+                        'width': page_rect.width,
+                        'height': page_rect.height
+                    })
             
             doc.close()
             
@@ -175,79 +237,136 @@ class PDFCleaner:
         
         return safe_content, has_threats
     
-    def create_clean_pdf(self, content_data: List[Dict], output_path: str) -> bool:
-        """建立清潔的PDF檔案"""
+    def _transcode_image(self, doc, xref: int, size: Optional[Tuple[int, int]],
+                         timer: StageTimer) -> Optional[Dict]:
+        """解碼圖片並重新編碼為 PNG；指定 size 時先以 MuPDF 縮小到該像素尺寸"""
+        import fitz  # PyMuPDF
+
+        pix = fitz.Pixmap(doc, xref)
+        # 只處理RGB圖片，避免CMYK等可能有問題的色彩空間
+        if pix.n - pix.alpha >= 4:
+            return None
+        
+        encoded = {}
+        if size is not None and size[0] < pix.width and size[1] < pix.height:
+            original = (pix.width, pix.height)
+            with timer.stage('downsample'):
+                pix = fitz.Pixmap(pix, size[0], size[1], None)
+            timer.count('images_downsampled')
+            encoded['downsampled'] = {
+                'original_size': original,
+                'output_size': (pix.width, pix.height),
+            }
+        encoded['data'] = pix.tobytes("png")
+        return encoded
+    
+    def _report_downsampling(self, result: Dict, content_data: List[Dict]):
+        """在結果中記錄每張縮小的圖片（頁碼、有效解析度與像素尺寸）"""
+        report = [img['downsampled'] for page in content_data
+                  for img in page['images'] if 'downsampled' in img]
+        if not report:
+            return
+        before = sum(r['original_size'][0] * r['original_size'][1] for r in report)
+        after = sum(r['output_size'][0] * r['output_size'][1] for r in report)
+        result['images_downsampled'] = report
+        self.logger.info(f"縮小 {len(report)} 張高解析度圖片，像素減少 {1 - after / before:.0%}")
+        for r in report:
+            self.logger.debug(
+                f"第 {r['page']} 頁圖片 {r['xref']}: {r['dpi']} DPI，"
+                f"{r['original_size'][0]}x{r['original_size'][1]} -> "
+                f"{r['output_size'][0]}x{r['output_size'][1]}")
+    
+    def create_clean_pdf(self, content_data: List[Dict], output_path,
+                         timer: Optional[StageTimer] = None,
+                         deterministic: bool = False) -> bool:
+        """
+        建立清潔的PDF檔案（輸出到檔案路徑或二進位串流）
+        
+        deterministic 為 True 時 reportlab 以固定的建立時間與文件 ID 輸出。
+        """
+        timer = timer or StageTimer()
         try:
             from reportlab.pdfgen import canvas
             from reportlab.lib.pagesizes import letter
-            from io import BytesIO
+            from reportlab.lib.utils import ImageReader
+            from PIL import Image
             
             # 建立新的PDF
-            c = canvas.Canvas(output_path, pagesize=letter)
+            c = canvas.Canvas(output_path, pagesize=letter,
+                              invariant=1 if deterministic else None)
             
             for page_data in content_data:
-                # 設定頁面尺寸
-                page_width = page_data['width'] if page_data['width'] > 0 else letter[0]
-                page_height = page_data['height'] if page_data['height'] > 0 else letter[1]
-                
-                c.setPageSize((page_width, page_height))
-                
-                # 添加文字內容
-                if page_data['text'].strip():
-                    text_obj = c.beginText()
-                    text_obj.setTextOrigin(50, page_height - 50)
-                    text_obj.setFont("Helvetica", 12)
+                with timer.page(page_data['page_num']):
+                    # 設定頁面尺寸
+                    page_width = page_data['width'] if page_data['width'] > 0 else letter[0]
+                    page_height = page_data['height'] if page_data['height'] > 0 else letter[1]
                     
-                    # 分行處理文字
-                    lines = page_data['text'].split('\n')
-                    for line in lines:
-                        if line.strip():
-                            text_obj.textLine(line)
+                    c.setPageSize((page_width, page_height))
                     
-                    c.drawText(text_obj)
-                
-                # 添加安全的圖片
-                for img in page_data['images']:
-                    try:
-                        img_stream = BytesIO(img['data'])
-                        # 使用PIL重新處理圖片以確保安全
-                        pil_img = Image.open(img_stream)
-                        
-                        # 轉換為RGB格式（移除可能的威脅）
-                        if pil_img.mode != 'RGB':
-                            pil_img = pil_img.convert('RGB')
+                    # 添加文字內容
+                    if page_data['text'].strip():
+                        text_obj = c.beginText()
+                        text_obj.setTextOrigin(50, page_height - 50)
+                        text_obj.setFont("Helvetica", 12)
                         
-                        # 保存為安全的格式
-                        safe_img_stream = BytesIO()
-                        pil_img.save(safe_img_stream, format='PNG')
-                        safe_img_stream.seek(0)
+                        # 分行處理文字
+                        lines = page_data['text'].split('\n')
+                        for line in lines:
+                            if line.strip():
+                                text_obj.textLine(line)
                         
-                        # 添加到PDF（如果有邊界框信息）
-                        if 'bbox' in img and img['bbox']:
-                            bbox = img['bbox']
-                            c.drawImage(ImageReader(safe_img_stream), 
-                                      bbox[0], page_height - bbox[3], 
-                                      bbox[2] - bbox[0], bbox[3] - bbox[1])
-                        else:
-                            # 預設位置
-                            c.drawImage(ImageReader(safe_img_stream), 50, 50, 200, 200)
+                        c.drawText(text_obj)
+                    
+                    # 添加安全的圖片
+                    for img in page_data['images']:
+                        try:
+                            with timer.stage('encode'):
+                                img_stream = BytesIO(img['data'])
+                                # 使用PIL重新處理圖片以確保安全
+                                pil_img = Image.open(img_stream)
+                                
+                                # 轉換為RGB格式（移除可能的威脅）
+                                if pil_img.mode != 'RGB':
+                                    pil_img = pil_img.convert('RGB')
+                                
+                                # 保存為安全的格式
+                                safe_img_stream = BytesIO()
+                                pil_img.save(safe_img_stream, format='PNG')
+                                safe_img_stream.seek(0)
                             
-                    except Exception as e:
-                        self.logger.warning(f"處理圖片時發生錯誤: {e}")
-                        continue
-                
-                c.showPage()
+                            # 添加到PDF（如果有邊界框信息）
+                            if 'bbox' in img and img['bbox']:
+                                bbox = img['bbox']
+                                c.drawImage(ImageReader(safe_img_stream), 
+                                          bbox[0], page_height - bbox[3], 
+                                          bbox[2] - bbox[0], bbox[3] - bbox[1])
+                            else:
+                                # 預設位置
+                                c.drawImage(ImageReader(safe_img_stream), 50, 50, 200, 200)
+                                
+                        except Exception as e:
+                            self.logger.warning(f"處理圖片時發生錯誤: {e}")
+                            continue
+                    
+                    c.showPage()
             
             c.save()
-            self.logger.info(f"清潔PDF已建立: {output_path}")
+            if is_path(output_path):
+                self.logger.info(f"清潔PDF已建立: {output_path}")
             return True
             
+        except TRANSIENT_ERRORS:
+            # 寫入失敗（例如磁碟已滿）交由呼叫端回報為可重試的錯誤
+            raise
         except Exception as e:
             self.logger.error(f"建立清潔PDF時發生錯誤: {e}")
             return False
     
-    def calculate_file_hash(self, file_path: str) -> str:
-        """計算檔案雜湊值"""
+    def calculate_file_hash(self, file_path) -> str:
+        """計算檔案雜湊值（接受檔案路徑或記憶體中的資料）"""
+        if not is_path(file_path):
+            return hashlib.sha256(file_path).hexdigest()
+
         hash_sha256 = hashlib.sha256()
         try:
             with open(file_path, "rb") as f:
@@ -259,97 +378,367 @@ class PDFCleaner:
         
         return hash_sha256.hexdigest()
     
-    def clean_pdf(self, input_path: str, output_path: str) -> Dict:
-        """主要的PDF清洗功能"""
-        result = {
+    def _new_result(self) -> Dict:
+        return {
             'success': False,
             'threats_found': [],
             'original_hash': '',
             'clean_hash': '',
             'message': ''
         }
+    
+    def _scan_source(self, source, result: Dict) -> bool:
+        """驗證檔案、計算雜湊值並掃描威脅，驗證失敗時回傳 False"""
+        # 1. 驗證輸入檔案
+        if not self.verify_pdf_file(source):
+            result['message'] = "檔案驗證失敗"
+            return False
+        
+        # 2. 計算原始檔案雜湊值
+        result['original_hash'] = self.calculate_file_hash(source)
+        
+        # 3. 掃描威脅
+        result['threats_found'] = self.scan_malicious_content(source)
+        return True
+    
+    def _clean_source(self, source, output, result: Dict, timer: StageTimer,
+                      max_image_dpi: Optional[int] = None,
+                      optimize: bool = False, linearize: bool = False,
+                      deterministic: bool = False, verify: bool = False) -> bool:
+        """對檔案路徑或PDF位元組執行驗證、掃描、提取與重建"""
+        with timer.stage('scan'):
+            if not self._scan_source(source, result):
+                return False
+        threats = list(result['threats_found'])
+        
+        # 4. 提取安全內容
+        with timer.stage('extract'):
+            content_data, extraction_threats = self.extract_safe_content(
+                source, timer, None, max_image_dpi)
+        
+        if extraction_threats:
+            result['threats_found'].append("內容提取過程中發現威脅")
+        
+        # 5. 建立清潔的PDF
+        with timer.stage('write'):
+            if not self.create_clean_pdf(content_data, output, timer, deterministic):
+                result['message'] = "建立清潔PDF失敗"
+                return False
+        
+        # 6. 輸出最佳化（雜湊值以最佳化後的輸出計算）
+        if optimize or linearize:
+            with timer.stage('optimize'):
+                result['optimization'] = optimize_pdf(output, linearize, deterministic)
+        
+        if verify:
+            self._verify_output(source, output, result, timer)
+        
+        with timer.stage('write'):
+            if is_path(output):
+                result['clean_hash'] = self.calculate_file_hash(output)
+            else:
+                result['clean_hash'] = self.calculate_file_hash(output.getbuffer())
+        result['success'] = True
+        result['pages_processed'] = len(content_data)
+        result['message'] = f"PDF清洗完成。發現 {len(threats)} 個威脅並已移除"
+        if 'optimization' in result:
+            result['message'] += describe_optimization(result['optimization'])
+        if 'verification' in result:
+            result['message'] += describe_verification(result['verification'])
+        self._report_downsampling(result, content_data)
+        
+        self.logger.info(f"清洗完成: {output if is_path(output) else '記憶體輸出'}")
+        self.logger.info(f"原始檔案雜湊: {result['original_hash']}")
+        self.logger.info(f"清潔檔案雜湊: {result['clean_hash']}")
+        return True
+    
+    def _verify_output(self, source, output, result: Dict, timer: StageTimer,
+                       pages: Optional[range] = None):
+        """以低解析度逐頁比較輸入與輸出的外觀，差異過大的頁面列於 result['verification']"""
+        with timer.stage('verify'):
+            result['verification'] = verify_pdf(
+                source, output if is_path(output) else output.getvalue(), pages)
+        flagged = result['verification']['flagged']
+        if flagged:
+            pages_text = ", ".join(str(item['page']) for item in flagged[:10])
+            self.logger.warning(f"視覺驗證: {len(flagged)} 頁與原始文件差異過大 ({pages_text})")
+    
+    def clean_pdf(self, input_path: str, output_path: str,
+                  profiler: Optional[StageProfiler] = None,
+                  max_image_dpi: Optional[int] = None,
+                  optimize: bool = False, linearize: bool = False,
+                  deterministic: bool = False, verify: bool = False) -> Dict:
+        """
+        主要的PDF清洗功能（profiler 用於記錄各階段的效能分析）
+        
+        max_image_dpi 為圖片的目標解析度，有效解析度超過其 DOWNSAMPLE_THRESHOLD 倍的
+        圖片縮小到目標解析度，縮小的圖片列於 result['images_downsampled']。
+        optimize 為 True 時對輸出執行最佳化後處理（見 pdf_optimize），linearize 另行線性化。
+        deterministic 為 True 時相同的輸入與選項產生位元組完全相同的輸出，clean_hash
+        可作為快取與去重複的鍵。verify 為 True 時以低解析度逐頁比較輸入與輸出的外觀，
+        結果記錄於 result['verification']；內容提取會重新排版文字，差異通常大於列印重建。
+        """
+        result = self._new_result()
+        timer = StageTimer(profiler)
         
         try:
             self.logger.info(f"開始清洗PDF: {input_path}")
             
-            # 1. 驗證輸入檔案
             if not os.path.exists(input_path):
                 result['message'] = "輸入檔案不存在"
                 return result
             
-            if not self.verify_pdf_file(input_path):
-                result['message'] = "檔案驗證失敗"
-                return result
+            self._clean_source(input_path, output_path, result, timer, max_image_dpi,
+                               optimize, linearize, deterministic, verify)
             
-            # 2. 計算原始檔案雜湊值
-            result['original_hash'] = self.calculate_file_hash(input_path)
+        except Exception as e:
+            self.logger.error(f"清洗過程中發生錯誤: {e}")
+            result['message'] = f"清洗失敗: {e}"
+            result['transient'] = isinstance(e, TRANSIENT_ERRORS)
+        
+        finally:
+            result['timings'] = timer.as_dict()
+            if timer.counters:
+                result['counters'] = dict(timer.counters)
+            flush_repeated_warnings(self.logger)
+        
+        return result
+    
+    def scan_pdf(self, input_path: str) -> Dict:
+        """只驗證與掃描文件，不產生輸出（success 代表文件通過驗證）"""
+        result = self._new_result()
+        timer = StageTimer()
+        
+        try:
+            if not os.path.exists(input_path):
+                result['message'] = "輸入檔案不存在"
+                return result
             
-            # 3. 掃描威脅
-            threats = self.scan_malicious_content(input_path)
-            result['threats_found'] = threats
+            with timer.stage('scan'):
+                if self._scan_source(input_path, result):
+                    doc = open_pdf_document(input_path)
+                    result['page_count'] = doc.page_count
+                    doc.close()
+                    result['success'] = True
+                    result['message'] = f"掃描完成。發現 {len(result['threats_found'])} 個威脅"
             
-            # 4. 提取安全內容
-            content_data, extraction_threats = self.extract_safe_content(input_path)
+        except Exception as e:
+            self.logger.error(f"掃描過程中發生錯誤: {e}")
+            result['message'] = f"掃描失敗: {e}"
+            result['transient'] = isinstance(e, TRANSIENT_ERRORS)
+        
+        finally:
+            result['timings'] = timer.as_dict()
+            flush_repeated_warnings(self.logger)
+        
+        return result
+    
+    def clean_pages(self, input_path: str, output_path: str, pages: range,
+                    max_image_dpi: Optional[int] = None, verify: bool = False) -> Dict:
+        """
+        只提取並重建指定頁面範圍（用於分片處理大型文件）
+        
+        不執行文件層級的驗證與掃描，呼叫端應另外以 scan_pdf() 對整份文件執行一次。
+        """
+        result = self._new_result()
+        result['pages_processed'] = 0
+        timer = StageTimer()
+        
+        try:
+            with timer.stage('extract'):
+                content_data, extraction_threats = self.extract_safe_content(
+                    input_path, timer, pages, max_image_dpi)
             
             if extraction_threats:
                 result['threats_found'].append("內容提取過程中發現威脅")
             
-            # 5. 建立清潔的PDF
-            if self.create_clean_pdf(content_data, output_path):
-                result['clean_hash'] = self.calculate_file_hash(output_path)
-                result['success'] = True
-                result['message'] = f"PDF清洗完成。發現 {len(threats)} 個威脅並已移除"
-                
-                self.logger.info(f"清洗完成: {output_path}")
-                self.logger.info(f"原始檔案雜湊: {result['original_hash']}")
-                self.logger.info(f"清潔檔案雜湊: {result['clean_hash']}")
-                
-            else:
-                result['message'] = "建立清潔PDF失敗"
+            with timer.stage('write'):
+                if not self.create_clean_pdf(content_data, output_path, timer):
+                    result['message'] = "建立清潔PDF失敗"
+                    return result
+            
+            result['success'] = True
+            result['pages_processed'] = len(content_data)
+            result['message'] = f"已重建第 {pages.start + 1}-{pages.stop} 頁"
+            self._report_downsampling(result, content_data)
+            if verify:
+                self._verify_output(input_path, output_path, result, timer, pages)
+            
+        except Exception as e:
+            self.logger.error(f"清洗過程中發生錯誤: {e}")
+            result['message'] = f"清洗失敗: {e}"
+            result['transient'] = isinstance(e, TRANSIENT_ERRORS)
+        
+        finally:
+            result['timings'] = timer.as_dict()
+            if timer.counters:
+                result['counters'] = dict(timer.counters)
+            flush_repeated_warnings(self.logger)
+        
+        return result
+    
+    def clean_pdf_bytes(self, data, output=None,
+                        profiler: Optional[StageProfiler] = None,
+                        max_image_dpi: Optional[int] = None,
+                        optimize: bool = False, linearize: bool = False,
+                        deterministic: bool = False, verify: bool = False) -> Dict:
+        """
+        清洗記憶體中的PDF，不經過暫存檔
+        
+        data 可為 bytes、bytearray、memoryview 或二進位檔案物件。
+        未指定 output 時，清潔PDF以 result['output_data'] 回傳；
+        否則寫入 output 串流。
+        """
+        result = self._new_result()
+        timer = StageTimer(profiler)
+        
+        try:
+            source = read_pdf_source(data)
+            if is_path(source):
+                raise TypeError("請使用 clean_pdf() 處理檔案路徑")
+            
+            self.logger.info(f"開始清洗PDF: {describe_source(source)}")
+            
+            buffer = BytesIO()
+            if self._clean_source(source, buffer, result, timer, max_image_dpi,
+                                  optimize, linearize, deterministic, verify):
+                if output is None:
+                    result['output_data'] = buffer.getvalue()
+                else:
+                    output.write(buffer.getbuffer())
             
         except Exception as e:
             self.logger.error(f"清洗過程中發生錯誤: {e}")
             result['message'] = f"清洗失敗: {e}"
+            result['transient'] = isinstance(e, TRANSIENT_ERRORS)
+        
+        finally:
+            result['timings'] = timer.as_dict()
+            if timer.counters:
+                result['counters'] = dict(timer.counters)
+            flush_repeated_warnings(self.logger)
         
         return result
 
 def main():
     """主程式入口"""
     parser = argparse.ArgumentParser(description='安全PDF清洗工具')
-    parser.add_argument('input', help='輸入PDF檔案路徑')
-    parser.add_argument('output', help='輸出清潔PDF檔案路徑')
+    parser.add_argument('input', help='輸入PDF檔案路徑，"-" 代表標準輸入')
+    parser.add_argument('output', help='輸出清潔PDF檔案路徑，"-" 代表標準輸出 (日誌與報告改寫到標準錯誤)')
+    parser.add_argument('--max-image-dpi', type=dpi_arg,
+                        help=f'圖片目標解析度；有效解析度超過其 {DOWNSAMPLE_THRESHOLD} 倍的圖片縮小到此解析度 (預設: 不縮小)')
+    parser.add_argument('--optimize', action='store_true',
+                        help='輸出最佳化：移除未使用物件、合併相同串流並壓縮為物件串流')
+    parser.add_argument('--linearize', action='store_true',
+                        help='線性化輸出以便網頁檢視器快速顯示第一頁 (隱含 --optimize，需要 pikepdf)')
+    parser.add_argument('--deterministic', action='store_true',
+                        help='可重現輸出：相同的輸入與選項產生位元組完全相同的PDF')
+    parser.add_argument('--verify', action='store_true',
+                        help='以低解析度逐頁比較輸入與輸出的外觀，列出差異過大的頁面')
+    parser.add_argument('--spool-mb', type=int, default=DEFAULT_SPOOL_MB,
+                        help=f'標準輸入不超過此大小時完全在記憶體中處理，超過時改寫入暫存檔 (預設: {DEFAULT_SPOOL_MB})')
+    parser.add_argument('--report-fd', type=int, metavar='FD',
+                        help='將結果以一行 JSON 寫入此檔案描述元 (例如 2 為標準錯誤)，取代文字報告')
     parser.add_argument('-v', '--verbose', action='store_true', help='詳細輸出')
+    parser.add_argument('--log-file', help='日誌檔案路徑，"-" 代表不寫入檔案 (預設: pdf_cleaner.log)')
+    parser.add_argument('--profile', metavar='DIR',
+                        help='將各階段的 cProfile 統計、tracemalloc 快照與 profile.json 摘要寫入 DIR')
+    parser.add_argument('--profile-top', type=int, default=DEFAULT_TOP_PAGES,
+                        help=f'效能分析摘要列出的最慢頁數 (預設: {DEFAULT_TOP_PAGES})')
     
     args = parser.parse_args()
     
-    if args.verbose:
-        logging.getLogger().setLevel(logging.DEBUG)
+    # 輸出寫到標準輸出時，日誌與報告改寫到標準錯誤
+    stdout_output = args.output == STDIO_PATH
+    report = sys.stderr if stdout_output else sys.stdout
+    pdf_stdout = reserve_stdout() if stdout_output else None
+    configure_logging(
+        log_file=args.log_file,
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        stream=sys.stderr if stdout_output else None,
+        default_log_file='pdf_cleaner.log'
+    )
     
     # 建立清洗工具實例
     cleaner = PDFCleaner()
+    options = (args.max_image_dpi, args.optimize, args.linearize, args.deterministic, args.verify)
     
     # 執行清洗
-    result = cleaner.clean_pdf(args.input, args.output)
+    profiler = StageProfiler(args.profile_top) if args.profile else None
+    if profiler:
+        profiler.start()
+    temp_paths = []
+    try:
+        source = args.input
+        if args.input == STDIO_PATH:
+            # 小於 --spool-mb 的輸入完全在記憶體中處理
+            source = spool_stream(sys.stdin.buffer, args.spool_mb * 1024 * 1024)
+            if is_path(source):
+                temp_paths.append(source)
+        
+        if is_path(source):
+            output_path = args.output
+            if stdout_output:
+                fd, output_path = tempfile.mkstemp(suffix='.pdf')
+                os.close(fd)
+                temp_paths.append(output_path)
+            result = cleaner.clean_pdf(source, output_path, profiler, *options)
+            if stdout_output and result['success']:
+                stream_output(output_path, pdf_stdout)
+        else:
+            result = cleaner.clean_pdf_bytes(source, pdf_stdout, profiler, *options)
+            if result['success'] and not stdout_output:
+                with open(args.output, 'wb') as f:
+                    f.write(result.pop('output_data'))
+    finally:
+        if pdf_stdout is not None:
+            pdf_stdout.close()
+        for path in temp_paths:
+            if os.path.exists(path):
+                os.remove(path)
+    if profiler:
+        profiler.stop()
+        profile_summary = profiler.write(args.profile, result['timings'])
+    
+    if args.report_fd is not None:
+        # 供管線使用的 JSON 結果，取代文字報告
+        with open(args.report_fd, 'w', encoding='utf-8', closefd=False) as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        return 0 if result['success'] else 1
     
     # 輸出結果
-    print("\n" + "="*50)
-    print("PDF清洗結果報告")
-    print("="*50)
-    print(f"狀態: {'成功' if result['success'] else '失敗'}")
-    print(f"訊息: {result['message']}")
-    print(f"發現威脅數量: {len(result['threats_found'])}")
+    print("\n" + "="*50, file=report)
+    print("PDF清洗結果報告", file=report)
+    print("="*50, file=report)
+    print(f"狀態: {'成功' if result['success'] else '失敗'}", file=report)
+    print(f"訊息: {result['message']}", file=report)
+    print(f"發現威脅數量: {len(result['threats_found'])}", file=report)
+    if result.get('images_downsampled'):
+        print(f"縮小圖片數量: {len(result['images_downsampled'])}", file=report)
+    if 'optimization' in result:
+        optimization = result['optimization']
+        print(f"輸出最佳化: {optimization['input_bytes']:,} -> {optimization['output_bytes']:,} bytes"
+              f"，耗時 {optimization['seconds']:.2f} 秒", file=report)
+    if 'verification' in result:
+        verification = result['verification']
+        print(f"視覺驗證: 比較 {verification['pages_compared']} 頁，"
+              f"差異過大 {len(verification['flagged'])} 頁", file=report)
+        for item in verification['flagged']:
+            print(f"  - 第 {item['page']} 頁: 相似度 {item['similarity']:.2f}", file=report)
     
     if result['threats_found']:
-        print("\n發現的威脅:")
+        print("\n發現的威脅:", file=report)
         for threat in result['threats_found']:
-            print(f"  - {threat}")
+            print(f"  - {threat}", file=report)
     
     if result['original_hash']:
-        print(f"\n原始檔案雜湊: {result['original_hash']}")
+        print(f"\n原始檔案雜湊: {result['original_hash']}", file=report)
     if result['clean_hash']:
-        print(f"清潔檔案雜湊: {result['clean_hash']}")
+        print(f"清潔檔案雜湊: {result['clean_hash']}", file=report)
+    if profiler:
+        print(f"效能分析結果: {profile_summary}", file=report)
     
-    print("="*50)
+    print("="*50, file=report)
     
     return 0 if result['success'] else 1
 
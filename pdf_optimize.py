@@ -0,0 +1,144 @@
+"""
+輸出最佳化 - 清洗輸出的後處理：移除未使用物件、合併相同串流、物件串流壓縮與線性化
+Output Optimization - Post-pass over cleaned output: garbage collection, stream
+deduplication, object streams and optional linearization
+"""
+
+import io
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, Optional
+
+from pdf_source import is_path, replace_output
+
+logger = logging.getLogger(__name__)
+
+
+def _strip_ascii85(doc) -> int:
+    """
+    將 reportlab 以 ASCII85 包裝的串流改為只有 FlateDecode，回傳處理的串流數
+
+    ASCII85 使串流大了 1/4，存檔時的 deflate 不會處理已有篩選器的串流；
+    只重新壓縮這些串流，不必像 expand 一樣解壓縮所有點陣。
+    """
+    count = 0
+    for xref in range(1, doc.xref_length()):
+        if not doc.xref_is_stream(xref):
+            continue
+        if "/ASCII85Decode" not in doc.xref_get_key(xref, "Filter")[1]:
+            continue
+        doc.update_stream(xref, doc.xref_stream(xref))
+        count += 1
+    return count
+
+
+def _linearize(data: bytes, deterministic: bool = False) -> Optional[bytes]:
+    """
+    以 pikepdf (qpdf) 線性化，未安裝時回傳 None
+
+    MuPDF 1.22 起不再支援線性化，因此改由 qpdf 處理。deterministic 為 True 時
+    文件 ID 由內容決定。
+    """
+    try:
+        import pikepdf
+    except ImportError:
+        return None
+
+    output = io.BytesIO()
+    with pikepdf.open(io.BytesIO(data)) as pdf:
+        pdf.save(
+            output,
+            linearize=True,
+            object_stream_mode=pikepdf.ObjectStreamMode.generate,
+            deterministic_id=deterministic,
+        )
+    return output.getvalue()
+
+
+def optimize_pdf_data(data: bytes, linearize: bool = False, deterministic: bool = False) -> Dict:
+    """
+    最佳化記憶體中的PDF，回傳報告（output_data 為最佳化後的內容）
+
+    移除未使用的物件並合併內容相同的物件與串流 (garbage=4)，將物件壓縮到
+    物件串流中；linearize 為 True 時另行線性化，讓網頁檢視器可先顯示第一頁。
+    deterministic 為 True 時沿用輸入的文件 ID，不產生新的隨機 ID。
+    """
+    import fitz  # PyMuPDF
+
+    start = time.perf_counter()
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        _strip_ascii85(doc)
+        optimized = doc.tobytes(
+            garbage=4, deflate=True, clean=True, use_objstms=1, no_new_id=deterministic
+        )
+
+    linearized = False
+    if linearize:
+        result = _linearize(optimized, deterministic)
+        if result is None:
+            logger.warning("未安裝 pikepdf，略過線性化")
+        else:
+            optimized = result
+            linearized = True
+
+    if len(optimized) >= len(data) and not linearized:
+        # 沒有縮小時保留原始輸出
+        optimized = data
+
+    return {
+        "input_bytes": len(data),
+        "output_bytes": len(optimized),
+        "seconds": round(time.perf_counter() - start, 4),
+        "linearized": linearized,
+        "output_data": optimized,
+    }
+
+
+def optimize_pdf(output, linearize: bool = False, deterministic: bool = False) -> Dict:
+    """
+    就地最佳化清洗輸出（檔案路徑或 BytesIO），回傳大小與耗時報告
+
+    檔案先寫入同目錄的暫存檔再取代，失敗時原始輸出維持不變。
+    """
+    if is_path(output):
+        with open(output, "rb") as f:
+            data = f.read()
+    else:
+        data = output.getvalue()
+
+    report = optimize_pdf_data(data, linearize, deterministic)
+    optimized = report.pop("output_data")
+    if optimized is not data:
+        if is_path(output):
+            output_dir = os.path.dirname(os.path.abspath(output))
+            fd, temp_path = tempfile.mkstemp(suffix=".pdf", dir=output_dir)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(optimized)
+                replace_output(temp_path, output)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        else:
+            output.seek(0)
+            output.truncate()
+            output.write(optimized)
+
+    logger.info(
+        f"輸出最佳化: {report['input_bytes'] / 1024:.0f} KB -> "
+        f"{report['output_bytes'] / 1024:.0f} KB，耗時 {report['seconds']:.2f} 秒"
+        + ("（已線性化）" if report["linearized"] else "")
+    )
+    return report
+
+
+def describe_optimization(report: Dict) -> str:
+    """產生附加在結果訊息後的最佳化摘要"""
+    saved = 1 - report["output_bytes"] / report["input_bytes"] if report["input_bytes"] else 0
+    text = f"（最佳化後縮小 {saved:.0%}"
+    if report["linearized"]:
+        text += "，已線性化"
+    return text + "）"
@@ -0,0 +1,191 @@
+"""
+PDF輸入來源工具 - 統一處理檔案路徑與記憶體中的PDF資料
+PDF Source Helpers - Accept file paths as well as in-memory PDF data
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+from typing import Union
+
+# 清洗器接受的輸入: 檔案路徑或記憶體中的PDF內容
+PDFSource = Union[str, bytes]
+
+# 可重試的錯誤：I/O 錯誤（NFS、磁碟已滿）與記憶體不足；其餘例外（例如格式錯誤的PDF）
+# 重試也會得到相同結果
+TRANSIENT_ERRORS = (OSError, MemoryError)
+
+# 命令列以 "-" 代表標準輸入（輸入）或標準輸出（輸出）
+STDIO_PATH = "-"
+
+# 標準輸入不超過此大小時完全在記憶體中處理，超過時改寫入暫存檔
+DEFAULT_SPOOL_MB = 64
+
+# 命令列與服務請求接受的解析度範圍 (DPI)
+MIN_DPI = 72
+MAX_DPI = 1200
+
+_COPY_CHUNK = 1024 * 1024
+
+
+def dpi_arg(value: str) -> int:
+    """argparse 型別：MIN_DPI-MAX_DPI 範圍內的整數解析度"""
+    try:
+        dpi = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"必須是整數: {value}")
+    if not MIN_DPI <= dpi <= MAX_DPI:
+        raise argparse.ArgumentTypeError(f"應在 {MIN_DPI}-{MAX_DPI} 範圍內: {dpi}")
+    return dpi
+
+
+def is_path(source) -> bool:
+    """判斷來源是否為檔案路徑"""
+    return isinstance(source, (str, os.PathLike))
+
+
+def read_pdf_source(source) -> PDFSource:
+    """將 bytes、bytearray、memoryview 或二進位檔案物件轉為 bytes，路徑維持不變"""
+    if is_path(source):
+        return os.fspath(source)
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, (bytearray, memoryview)):
+        return bytes(source)
+    if hasattr(source, "read"):
+        data = source.read()
+        if isinstance(data, str):
+            raise TypeError("需要以二進位模式開啟的檔案物件")
+        return bytes(data)
+
+    raise TypeError(f"不支援的PDF來源型別: {type(source).__name__}")
+
+
+def _umask() -> int:
+    """讀取行程的 umask（Linux 由 /proc 讀取，不必暫時變更 umask）"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError):
+        pass
+    mask = os.umask(0o022)
+    os.umask(mask)
+    return mask
+
+
+def replace_output(temp_path: str, output_path: str):
+    """
+    以暫存檔原子性地取代輸出檔案
+
+    mkstemp 建立的暫存檔權限為 0600；取代前改為既有輸出的權限，沒有既有輸出時
+    改為一般建立檔案的權限 (0666 & ~umask)，與直接寫入輸出的結果相同。
+    """
+    try:
+        mode = os.stat(output_path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = 0o666 & ~_umask()
+    os.chmod(temp_path, mode)
+    os.replace(temp_path, output_path)
+
+
+def describe_source(source) -> str:
+    """產生適合寫入日誌的來源描述"""
+    if is_path(source):
+        return os.fspath(source)
+    return f"<記憶體資料 {len(source)} bytes>"
+
+
+def open_pdf_document(source):
+    """以PyMuPDF開啟檔案路徑或記憶體中的PDF"""
+    import fitz  # PyMuPDF
+
+    if is_path(source):
+        return fitz.open(source)
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def output_hash(output) -> str:
+    """計算輸出PDF（檔案路徑、bytes 或 BytesIO）的 SHA-256 雜湊值"""
+    hash_sha256 = hashlib.sha256()
+    if is_path(output):
+        with open(output, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hash_sha256.update(chunk)
+    elif hasattr(output, "getbuffer"):
+        hash_sha256.update(output.getbuffer())
+    else:
+        hash_sha256.update(output)
+    return hash_sha256.hexdigest()
+
+
+def spool_stream(stream, max_bytes: int) -> PDFSource:
+    """
+    讀取整個二進位串流（例如標準輸入）
+
+    不超過 max_bytes 時回傳 bytes，清洗完全在記憶體中進行；超過時其餘內容
+    直接寫入暫存檔並回傳其路徑，呼叫端用完後負責刪除。
+    """
+    head = stream.read(max_bytes + 1)
+    if len(head) <= max_bytes:
+        return bytes(head)
+
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(head)
+            del head
+            shutil.copyfileobj(stream, f, _COPY_CHUNK)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def reserve_stdout():
+    """
+    將標準輸出保留給PDF資料，回傳指向原標準輸出的二進位串流
+
+    檔案描述元 1 改指向標準錯誤，函式庫直接寫到標準輸出的訊息（例如 PyMuPDF
+    的警告與 MuPDF 的錯誤訊息）因此不會混入輸出的PDF。
+    """
+    sys.stdout.flush()
+    stdout_fd = os.dup(1)
+    os.dup2(2, 1)
+    return os.fdopen(stdout_fd, "wb")
+
+
+def stream_output(output, stream):
+    """
+    將清洗輸出（檔案路徑或位元組）寫入二進位串流（例如標準輸出）
+
+    檔案以 os.sendfile 由核心直接複製到串流的檔案描述元，不經過使用者空間；
+    串流不支援時（非 Linux、非真實檔案描述元）改為分段複製。
+    """
+    if not is_path(output):
+        stream.write(output)
+        stream.flush()
+        return
+
+    with open(output, "rb") as f:
+        stream.flush()
+        offset = 0
+        try:
+            out_fd = stream.fileno()
+            size = os.fstat(f.fileno()).st_size
+            while offset < size:
+                sent = os.sendfile(out_fd, f.fileno(), offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+            return
+        except (AttributeError, OSError, ValueError) as e:
+            if offset:
+                # 已部分送出時無法改用其他方式補齊
+                raise OSError(f"寫入輸出串流失敗: {e}") from e
+        shutil.copyfileobj(f, stream, _COPY_CHUNK)
+        stream.flush()
@@ -5,25 +5,339 @@ Print-based PDF Cleaner - Remove threats through virtual printing
 """
 
 import argparse
+import io
+import json
 import logging
 import os
+import queue
 import sys
 import tempfile
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Optional, Sequence, Tuple
 
-try:
-    import io
+from log_config import configure_logging, flush_repeated_warnings
+from page_fingerprint import assemble_pages, load_page_map, page_fingerprints, save_page_map
+from pdf_optimize import describe_optimization, optimize_pdf
+from pdf_source import (
+    DEFAULT_SPOOL_MB,
+    STDIO_PATH,
+    TRANSIENT_ERRORS,
+    describe_source,
+    dpi_arg,
+    is_path,
+    open_pdf_document,
+    output_hash,
+    read_pdf_source,
+    reserve_stdout,
+    spool_stream,
+    stream_output,
+)
+from profiling import DEFAULT_TOP_PAGES, StageProfiler
+from raster_xobject import EncodedImage, draw_encoded_image
+from stage_timer import StageTimer
+from visual_verify import describe_verification, verify_pdf
 
+if TYPE_CHECKING:
+    import numpy as np
+
+# PyMuPDF、Pillow、reportlab 延遲到渲染與重建時才載入，
+# 讓 --help 與輸入驗證失敗的執行不必付出載入成本。
+# 安裝: pip install PyMuPDF reportlab Pillow
+
+# 渲染、壓縮與寫入三個階段同時執行：已渲染待壓縮的頁數與壓縮執行緒數
+# 決定同時存在的點陣數量上限（約 PIPELINE_DEPTH + 2 * ENCODE_THREADS + 1 頁）
+PIPELINE_DEPTH = 2
+ENCODE_THREADS = 2
+
+# 實際渲染DPI的上限（同命令列 --dpi 的範圍）；超取樣時減少倍數以免超過
+MAX_RENDER_DPI = 1200
+
+# 頁面點陣的 zlib 壓縮等級（zlib 壓縮時釋放 GIL，可與渲染同時進行）
+ZLIB_LEVEL = 6
+
+
+# 輸出色彩：rgb 全彩；gray 由 MuPDF 直接渲染為灰階；mono 為黑白（固定門檻），
+# mono-dither 以有序抖動 (ordered dithering) 保留灰階層次的黑白
+COLORSPACES = ("rgb", "gray", "mono", "mono-dither")
+# 黑白輸出的固定門檻（灰階值低於此值為黑）
+MONO_THRESHOLD = 128
+# 8×8 Bayer 抖動矩陣
+_BAYER_8X8 = (
+    (0, 32, 8, 40, 2, 34, 10, 42),
+    (48, 16, 56, 24, 50, 18, 58, 26),
+    (12, 44, 4, 36, 14, 46, 6, 38),
+    (60, 28, 52, 20, 62, 30, 54, 22),
+    (3, 35, 11, 43, 1, 33, 9, 41),
+    (51, 19, 59, 27, 49, 17, 57, 25),
+    (15, 47, 7, 39, 13, 45, 5, 37),
+    (63, 31, 55, 23, 61, 29, 53, 21),
+)
+
+# 空白頁處理方式：keep 照常渲染，empty 輸出同尺寸的空白頁，drop 自輸出中移除
+BLANK_PAGE_MODES = ("keep", "empty", "drop")
+
+# 空白頁偵測：以低解析度預覽計算墨跡像素比例
+BLANK_PREVIEW_DPI = 36
+# 任一色版低於此值的像素視為墨跡（淡色的螢光筆也會被計入）
+BLANK_INK_LEVEL = 200
+# 墨跡像素比例低於此值視為近乎空白（掃描雜訊、污點；A4 約為 25 個預覽像素）
+BLANK_INK_COVERAGE = 0.0002
+
+
+# 調色盤：lossless 將顏色不超過 PALETTE_MAX_COLORS 的頁面無損轉為索引色；
+# quantize 另將取樣顏色不超過 QUANTIZE_MAX_COLORS 的頁面（例如帶漸層的簡報）量化為索引色
+PALETTE_MODES = ("off", "lossless", "quantize")
+PALETTE_MAX_COLORS = 256
+QUANTIZE_MAX_COLORS = 4096
+# 量化前估計顏色數時每隔幾列取樣一列；轉換索引時每次處理的列數（限制暫存陣列大小）
+PALETTE_SAMPLE_STRIDE = 8
+PALETTE_BAND_ROWS = 64
+# 新顏色先取多少像素判斷是否超過上限；顏色雜湊表的位元數
+PALETTE_PROBE_PIXELS = 4096
+PALETTE_HASH_BITS = 18
+_HASH_MULTIPLIERS = (2654435761, 2246822519, 3266489917, 668265263, 374761393, 3935559000)
+
+
+def is_blank_page(page) -> bool:
+    """
+    判斷頁面是否空白或近乎空白
+
+    沒有內容串流也沒有註解的頁面直接判定為空白；其餘頁面以低解析度
+    預覽計算墨跡覆蓋率，只含少量雜點的掃描頁同樣視為空白。
+    """
     import fitz  # PyMuPDF
-    from PIL import Image
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib.utils import ImageReader
-    from reportlab.pdfgen import canvas
-except ImportError as e:
-    print(f"缺少必要函式庫: {e}")
-    print("請執行: pip install PyMuPDF reportlab Pillow")
-    sys.exit(1)
+    import numpy as np
+
+    doc = page.parent
+    if page.first_annot is None and page.first_widget is None:
+        if not any((doc.xref_stream(xref) or b"").strip() for xref in page.get_contents()):
+            return True
+
+    mat = fitz.Matrix(BLANK_PREVIEW_DPI / 72, BLANK_PREVIEW_DPI / 72)
+    pix = page.get_pixmap(matrix=mat, alpha=False)
+    pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3)
+    ink = np.count_nonzero(pixels.min(axis=2) < BLANK_INK_LEVEL)
+    return ink < BLANK_INK_COVERAGE * pix.width * pix.height
+
+
+def index_colors(
+    samples: bytes, width: int, height: int, quantize: bool = False
+) -> Optional[Tuple[bytes, "np.ndarray"]]:
+    """
+    將顏色少的 RGB 點陣轉為索引色，回傳 (RGB 調色盤, 索引陣列)；不適合時回傳 None
+
+    索引分段以顏色雜湊表計算，遇到新顏色時加入調色盤，超過 PALETTE_MAX_COLORS
+    即放棄，照片類頁面在第一個有照片的段落就會放棄。quantize 為 True 時，無法無損轉換但取樣
+    顏色不超過 QUANTIZE_MAX_COLORS 的頁面以 Pillow 量化為 PALETTE_MAX_COLORS 色（不混色）。
+    """
+    import numpy as np
+
+    rgb = np.frombuffer(samples, dtype=np.uint8).reshape(height, width, 3)
+    colors = np.empty(0, dtype=np.uint32)
+    table = None
+    indices = np.empty((height, width), dtype=np.uint8)
+    for top in range(0, height, PALETTE_BAND_ROWS):
+        band = indices[top : top + PALETTE_BAND_ROWS]
+        packed = _pack_rgb(rgb[top : top + PALETTE_BAND_ROWS])
+        if table is not None:
+            slots = table.slots(packed)
+            found = table.keys.take(slots) == packed
+            if found.all():
+                table.values.take(slots, out=band)
+                continue
+            packed_missing = packed[~found]
+        else:
+            packed_missing = packed
+
+        # 新顏色先以少量像素判斷，照片類的段落不必排序整段
+        if len(colors) + len(np.unique(packed_missing[:PALETTE_PROBE_PIXELS])) > PALETTE_MAX_COLORS:
+            break
+        colors = np.concatenate((colors, np.unique(packed_missing)))
+        table = _ColorTable.build(colors) if len(colors) <= PALETTE_MAX_COLORS else None
+        if table is None:
+            break
+        table.values.take(table.slots(packed), out=band)
+    else:
+        palette = np.stack(((colors >> 16) & 255, (colors >> 8) & 255, colors & 255), axis=1)
+        return palette.astype(np.uint8).tobytes(), indices
+    del indices
+
+    if quantize and len(np.unique(_pack_rgb(rgb[::PALETTE_SAMPLE_STRIDE]))) <= QUANTIZE_MAX_COLORS:
+        from PIL import Image
+
+        image = Image.frombuffer("RGB", (width, height), samples, "raw", "RGB", 0, 1)
+        quantized = image.quantize(
+            PALETTE_MAX_COLORS, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE
+        )
+        indices = np.asarray(quantized)
+        used = int(indices.max()) + 1
+        return bytes(quantized.getpalette()[: used * 3]), indices
+
+    return None
+
+
+class _ColorTable:
+    """
+    顏色 -> 調色盤索引的雜湊表（2^PALETTE_HASH_BITS 格，可常駐於CPU快取）
+
+    以乘法雜湊配置位置，建立時選用沒有碰撞的乘數；256 色以內幾乎不需重試。
+    """
+
+    def __init__(self, colors, multiplier: int):
+        import numpy as np
+
+        self.multiplier = np.uint32(multiplier)
+        slots = self.slots(colors)
+        # 24 位元顏色不會等於 0xFFFFFFFF，以此表示空格
+        self.keys = np.full(1 << PALETTE_HASH_BITS, 0xFFFFFFFF, dtype=np.uint32)
+        self.keys[slots] = colors
+        self.values = np.zeros(1 << PALETTE_HASH_BITS, dtype=np.uint8)
+        self.values[slots] = np.arange(len(colors), dtype=np.uint8)
+
+    def slots(self, packed):
+        return (packed * self.multiplier) >> (32 - PALETTE_HASH_BITS)
+
+    @classmethod
+    def build(cls, colors) -> Optional["_ColorTable"]:
+        """建立沒有碰撞的雜湊表；所有乘數都碰撞時回傳 None"""
+        import numpy as np
+
+        for multiplier in _HASH_MULTIPLIERS:
+            slots = (colors * np.uint32(multiplier)) >> (32 - PALETTE_HASH_BITS)
+            if len(np.unique(slots)) == len(colors):
+                return cls(colors, multiplier)
+        return None
+
+
+def _pack_rgb(pixels):
+    # 將 RGB 三個位元組合併為一個 24 位元整數（原地運算，避免額外的暫存陣列）
+    import numpy as np
+
+    packed = pixels[..., 0].astype(np.uint32)
+    packed <<= 8
+    packed |= pixels[..., 1]
+    packed <<= 8
+    packed |= pixels[..., 2]
+    return packed
+
+
+def pack_indices(indices, bits: int) -> bytes:
+    """將索引陣列依每像素 bits 位元打包，每列從新的位元組開始"""
+    import numpy as np
+
+    if bits == 8:
+        return indices.tobytes()
+    per_byte = 8 // bits
+    height, width = indices.shape
+    padding = -width % per_byte
+    if padding:
+        indices = np.pad(indices, ((0, 0), (0, padding)))
+    groups = indices.reshape(height, -1, per_byte)
+    packed = np.zeros(groups.shape[:2], dtype=np.uint8)
+    for i in range(per_byte):
+        packed |= groups[:, :, i] << np.uint8(8 - bits * (i + 1))
+    return packed.tobytes()
+
+
+def bitonal(samples: bytes, width: int, height: int, dither: bool = False) -> bytes:
+    """
+    將 8 位元灰階點陣轉為每像素 1 位元的黑白點陣（1 為白，每列從新的位元組開始）
+
+    dither 為 False 時以 MONO_THRESHOLD 為門檻；否則以 8×8 Bayer 矩陣做有序抖動。
+    """
+    import numpy as np
+
+    gray = np.frombuffer(samples, dtype=np.uint8).reshape(height, width)
+    if dither:
+        # 門檻值分佈於 (0, 256)，平鋪到整頁
+        matrix = (np.array(_BAYER_8X8, dtype=np.uint16) * 4 + 2).astype(np.uint8)
+        thresholds = np.tile(matrix, (-(-height // 8), -(-width // 8)))[:height, :width]
+        white = gray >= thresholds
+    else:
+        white = gray >= MONO_THRESHOLD
+    return np.packbits(white, axis=1).tobytes()
+
+
+def encode_raster(
+    samples: bytes,
+    width: int,
+    height: int,
+    palette: str = "lossless",
+    colorspace: str = "rgb",
+) -> EncodedImage:
+    """壓縮頁面點陣；依 palette 將顏色少的頁面改以索引色輸出，依 colorspace 輸出灰階或黑白"""
+    if colorspace == "gray":
+        return EncodedImage(
+            zlib.compress(samples, ZLIB_LEVEL), width, height, color_space="DeviceGray"
+        )
+    if colorspace in ("mono", "mono-dither"):
+        packed = bitonal(samples, width, height, dither=colorspace == "mono-dither")
+        return EncodedImage(
+            zlib.compress(packed, ZLIB_LEVEL),
+            width,
+            height,
+            color_space="DeviceGray",
+            bits_per_component=1,
+        )
+
+    if palette != "off":
+        indexed = index_colors(samples, width, height, quantize=palette == "quantize")
+        if indexed is not None:
+            colors, indices = indexed
+            count = len(colors) // 3
+            bits = next(b for b in (1, 2, 4, 8) if count <= 1 << b)
+            return EncodedImage(
+                zlib.compress(pack_indices(indices, bits), ZLIB_LEVEL),
+                width,
+                height,
+                bits_per_component=bits,
+                palette=colors,
+            )
+    return EncodedImage(zlib.compress(samples, ZLIB_LEVEL), width, height)
+
+
+def render_resolution(dpi: int, output_dpi: Optional[int] = None) -> Tuple[int, int]:
+    """
+    由渲染DPI與輸出DPI決定實際渲染DPI與縮小倍數
+
+    輸出DPI低於渲染DPI時，以不超過指定渲染DPI的輸出DPI最大整數倍渲染，
+    再以區域平均縮小為輸出DPI；否則直接以渲染DPI輸出。實際渲染DPI不會高於
+    指定的渲染DPI（記憶體預算依指定的渲染DPI估算）與 MAX_RENDER_DPI，
+    例如 300/200 以 200 DPI 渲染、不超取樣。回傳的渲染DPI可能與指定的不同，由呼叫端記錄。
+    """
+    if not output_dpi or output_dpi >= dpi:
+        return min(dpi, MAX_RENDER_DPI), 1
+    factor = max(1, min(dpi, MAX_RENDER_DPI) // output_dpi)
+    return output_dpi * factor, factor
+
+
+def area_downscale(samples: bytes, width: int, height: int, factor: int) -> Tuple[bytes, int, int]:
+    """
+    以區域平均將 RGB 或灰階點陣縮小為 1/factor，回傳 (點陣, 寬, 高)
+
+    每個輸出像素為 factor × factor 區塊的平均值（四捨五入）；
+    邊緣不足一個區塊的部分以邊緣像素補齊。
+    """
+    import numpy as np
+
+    pixels = np.frombuffer(samples, dtype=np.uint8).reshape(height, width, -1)
+    channels = pixels.shape[2]
+    out_height = -(-height // factor)
+    out_width = -(-width // factor)
+    pad_height = out_height * factor - height
+    pad_width = out_width * factor - width
+    if pad_height or pad_width:
+        pixels = np.pad(pixels, ((0, pad_height), (0, pad_width), (0, 0)), mode="edge")
+
+    blocks = pixels.reshape(out_height, factor, out_width, factor, channels)
+    area = factor * factor
+    sums = blocks.sum(axis=(1, 3), dtype=np.uint32)
+    averaged = ((sums + area // 2) // area).astype(np.uint8)
+    return averaged.tobytes(), out_width, out_height
 
 
 class PDFPrintCleaner:
@@ -33,124 +347,448 @@ class PDFPrintCleaner:
         self.setup_logging()
 
     def setup_logging(self):
-        """設定日誌"""
-        logging.basicConfig(
-            level=logging.INFO,
-            format="%(asctime)s - %(levelname)s - %(message)s",
-            handlers=[
-                logging.FileHandler("pdf_print_cleaner.log", encoding="utf-8"),
-                logging.StreamHandler(sys.stdout),
-            ],
-        )
+        """設定日誌（每個行程只設定一次，已設定時沿用既有設定）"""
+        configure_logging(default_log_file="pdf_print_cleaner.log")
         self.logger = logging.getLogger(__name__)
 
-    def render_pdf_to_images(self, input_path: str, dpi: int = 300) -> list:
-        """將PDF頁面渲染為圖像"""
-        self.logger.info(f"開始渲染PDF: {input_path}")
-        rendered_pages = []
+    def _render_page(
+        self,
+        doc,
+        page_num: int,
+        dpi: int,
+        factor: int,
+        timer: StageTimer,
+        blank_pages: str = "keep",
+        colorspace: str = "rgb",
+    ) -> dict:
+        """渲染單一頁面為 RGB 或灰階點陣（factor 為之後縮小的倍數）"""
+        import fitz  # PyMuPDF
 
-        try:
-            doc = fitz.open(input_path)
+        page = doc[page_num]
+        if blank_pages != "keep":
+            with timer.stage("blank"):
+                blank = is_blank_page(page)
+            if blank:
+                self.logger.debug(f"第 {page_num + 1} 頁為空白頁，略過渲染")
+                timer.count("blank_pages")
+                return {
+                    "page_num": page_num,
+                    "blank": True,
+                    "page_width": page.rect.width,
+                    "page_height": page.rect.height,
+                }
+
+        with timer.stage("render"):
+            self.logger.debug(f"渲染第 {page_num + 1}/{doc.page_count} 頁")
+            mat = fitz.Matrix(dpi / 72, dpi / 72)  # 縮放係數
+            # 灰階與黑白輸出直接由 MuPDF 渲染為單一色版，點陣只有 RGB 的 1/3
+            space = fitz.csRGB if colorspace == "rgb" else fitz.csGRAY
+            pix = page.get_pixmap(matrix=mat, colorspace=space, alpha=False)
+            return {
+                "page_num": page_num,
+                "samples": pix.samples,
+                "width": pix.width,
+                "height": pix.height,
+                "factor": factor,
+                "colorspace": colorspace,
+                # 頁面實際尺寸 (points)，與渲染解析度無關
+                "page_width": page.rect.width,
+                "page_height": page.rect.height,
+            }
+
+    def _encode_page(self, raster: dict, timer: StageTimer, palette: str = "lossless") -> dict:
+        """縮小並壓縮頁面點陣（在壓縮執行緒中執行）"""
+        if raster.get("blank"):
+            return {**raster, "image": None}
 
-            for page_num in range(doc.page_count):
-                self.logger.info(f"渲染第 {page_num + 1}/{doc.page_count} 頁")
+        with timer.stage("encode"):
+            samples, width, height = raster["samples"], raster["width"], raster["height"]
+            if raster["factor"] > 1:
+                samples, width, height = area_downscale(samples, width, height, raster["factor"])
+            image = encode_raster(samples, width, height, palette, raster["colorspace"])
+            if image.palette:
+                timer.count("indexed_pages")
+        return {
+            "page_num": raster["page_num"],
+            "image": image,
+            "page_width": raster["page_width"],
+            "page_height": raster["page_height"],
+        }
+
+    def _write_page(self, c, encoded: dict, timer: StageTimer, blank_pages: str = "keep"):
+        """將壓縮後的頁面依序寫入PDF（空白頁依 blank_pages 輸出空白頁或略過）"""
+        if encoded["image"] is None and blank_pages == "drop":
+            return
+
+        with timer.stage("write"):
+            self.logger.debug(f"處理第 {encoded['page_num'] + 1} 頁")
 
-                page = doc[page_num]
+            # 設定頁面大小為原始尺寸 (points)
+            page_width = encoded["page_width"]
+            page_height = encoded["page_height"]
 
-                # 設定渲染參數 - 高DPI確保品質
-                mat = fitz.Matrix(dpi / 72, dpi / 72)  # 縮放係數
-                pix = page.get_pixmap(matrix=mat)
+            c.setPageSize((page_width, page_height))
+            if encoded["image"] is not None:
+                draw_encoded_image(c, encoded["image"], 0, 0, page_width, page_height)
+            c.showPage()
 
-                # 轉換為PIL圖像
-                img_data = pix.tobytes("png")
-                img = Image.open(io.BytesIO(img_data))
+    def render_and_write(
+        self,
+        source,
+        output,
+        dpi: int = 300,
+        timer: Optional[StageTimer] = None,
+        pages: Optional[Sequence[int]] = None,
+        output_dpi: Optional[int] = None,
+        blank_pages: str = "keep",
+        palette: str = "lossless",
+        colorspace: str = "rgb",
+        deterministic: bool = False,
+    ) -> int:
+        """
+        以渲染、壓縮、寫入三段管線重建PDF，回傳處理的頁數（含移除的空白頁）
 
-                # 確保為RGB模式
-                if img.mode != "RGB":
-                    img = img.convert("RGB")
+        渲染在背景執行緒進行，壓縮交給壓縮執行緒，寫入依頁面順序在目前的執行緒進行；
+        各階段之間以容量有限的佇列連接，同時存在的點陣只有數頁。
+        效能分析時各階段依序在同一執行緒執行，以便正確歸屬各階段的統計。
+        output_dpi 低於 dpi 時以較高解析度渲染後縮小（超取樣），文字邊緣較平滑。
+        blank_pages 為 empty 或 drop 時先偵測空白頁，空白頁不渲染也不壓縮。
+        palette 決定顏色少的頁面是否以索引色輸出（見 PALETTE_MODES）；
+        colorspace 為 gray 或 mono 系列時直接渲染為灰階，不再經過 RGB（見 COLORSPACES）。
+        deterministic 為 True 時 reportlab 以固定的建立時間與文件 ID 輸出。
+        """
+        from reportlab.pdfgen import canvas
 
-                rendered_pages.append(
-                    {
-                        "image": img,
-                        "width": pix.width,
-                        "height": pix.height,
-                        "page_num": page_num,
-                    }
+        timer = timer or StageTimer()
+        render_dpi, factor = render_resolution(dpi, output_dpi)
+        if render_dpi != dpi:
+            self.logger.warning(
+                f"渲染DPI由 {dpi} 調整為 {render_dpi}"
+                f"（輸出DPI {output_dpi or render_dpi} 的 {factor} 倍，上限 {MAX_RENDER_DPI}）"
+            )
+        dpi = render_dpi
+        self.logger.info(f"開始渲染PDF: {describe_source(source)}")
+        doc = open_pdf_document(source)
+        page_nums = list(pages) if pages is not None else list(range(doc.page_count))
+        c = canvas.Canvas(output, invariant=1 if deterministic else None)
+        written = 0
+
+        try:
+            if timer.profiler is not None:
+                for page_num in page_nums:
+                    with timer.page(page_num):
+                        raster = self._render_page(
+                            doc, page_num, dpi, factor, timer, blank_pages, colorspace
+                        )
+                        encoded = self._encode_page(raster, timer, palette)
+                        self._write_page(c, encoded, timer, blank_pages)
+                        written += 1
+            else:
+                written = self._run_pipeline(
+                    doc, page_nums, dpi, factor, c, timer, blank_pages, palette, colorspace
                 )
 
-                pix = None  # 釋放記憶體
-                page = None  # 釋放頁面資源
+            if pages is None and written and c.getPageNumber() == 1:
+                # 整份文件都是空白頁時保留第一頁，避免輸出沒有頁面的PDF
+                rect = doc[page_nums[0]].rect
+                c.setPageSize((rect.width, rect.height))
+                c.showPage()
 
+            with timer.stage("write"):
+                c.save()
+        finally:
             doc.close()
-            self.logger.info(f"成功渲染 {len(rendered_pages)} 頁")
 
-        except Exception as e:
-            self.logger.error(f"渲染過程發生錯誤: {e}")
-            raise
+        if is_path(output):
+            self.logger.info(f"PDF創建完成: {output}")
+        return written
 
-        return rendered_pages
+    def _run_pipeline(
+        self,
+        doc,
+        page_nums: list,
+        dpi: int,
+        factor: int,
+        c,
+        timer: StageTimer,
+        blank_pages: str = "keep",
+        palette: str = "lossless",
+        colorspace: str = "rgb",
+    ) -> int:
+        rendered = queue.Queue(maxsize=PIPELINE_DEPTH)
+        stop = threading.Event()
+        end = object()
+
+        def put(item) -> bool:
+            # 寫入端失敗時停止等待，讓渲染執行緒可以結束
+            while not stop.is_set():
+                try:
+                    rendered.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
 
-    def create_pdf_from_images(self, rendered_pages: list, output_path: str) -> bool:
-        """從渲染圖像創建新PDF"""
-        self.logger.info(f"開始創建PDF: {output_path}")
+        def produce():
+            try:
+                for page_num in page_nums:
+                    raster = self._render_page(
+                        doc, page_num, dpi, factor, timer, blank_pages, colorspace
+                    )
+                    if not put(raster):
+                        return
+                put(end)
+            except BaseException as e:
+                put(e)
 
+        renderer = threading.Thread(target=produce, name="render", daemon=True)
+        renderer.start()
+        written = 0
         try:
-            # 創建PDF畫布
-            c = canvas.Canvas(output_path)
-
-            for page_data in rendered_pages:
-                img = page_data["image"]
-                width = page_data["width"]
-                height = page_data["height"]
-
-                self.logger.info(f"處理第 {page_data['page_num'] + 1} 頁")
-
-                # 將圖像轉換為可用於ReportLab的格式
-                img_buffer = io.BytesIO()
-                img.save(img_buffer, format="PNG", optimize=True)
-                img_buffer.seek(0)
-
-                # 設定頁面大小為原始尺寸
-                page_width = width * 72 / 300  # 轉換為點 (points)
-                page_height = height * 72 / 300
-
-                c.setPageSize((page_width, page_height))
-
-                # 將圖像放置到頁面上
-                c.drawImage(
-                    ImageReader(img_buffer),
-                    0,
-                    0,
-                    page_width,
-                    page_height,
-                    preserveAspectRatio=True,
-                )
+            with ThreadPoolExecutor(ENCODE_THREADS, thread_name_prefix="encode") as encoders:
+                window = deque()
+                while True:
+                    item = rendered.get()
+                    if item is end:
+                        break
+                    if isinstance(item, BaseException):
+                        raise item
+                    window.append(encoders.submit(self._encode_page, item, timer, palette))
+                    item = None
+                    # 保持頁面順序寫入；壓縮中的頁數超過執行緒數時等待最早的一頁
+                    if len(window) > ENCODE_THREADS:
+                        self._write_page(c, window.popleft().result(), timer, blank_pages)
+                        written += 1
+                while window:
+                    self._write_page(c, window.popleft().result(), timer, blank_pages)
+                    written += 1
+        finally:
+            stop.set()
+            renderer.join()
+        return written
 
-                # 釋放圖像相關資源
-                img.close()
-                img_buffer.close()
-                page_data["image"] = None
+    def _print_clean_source(
+        self,
+        source,
+        output,
+        dpi: int,
+        result: dict,
+        timer: StageTimer,
+        pages: Optional[range] = None,
+        output_dpi: Optional[int] = None,
+        blank_pages: str = "keep",
+        palette: str = "lossless",
+        colorspace: str = "rgb",
+        optimize: bool = False,
+        linearize: bool = False,
+        deterministic: bool = False,
+        verify: bool = False,
+    ) -> bool:
+        """對檔案路徑或PDF位元組執行渲染與重建"""
+        pages_written = self.render_and_write(
+            source,
+            output,
+            dpi,
+            timer,
+            pages,
+            output_dpi,
+            blank_pages,
+            palette,
+            colorspace,
+            deterministic,
+        )
 
-                c.showPage()
+        if not pages_written:
+            result["message"] = "無法渲染PDF頁面"
+            return False
 
-            c.save()
-            self.logger.info(f"PDF創建完成: {output_path}")
-            return True
+        result["pages_processed"] = pages_written
+        result["success"] = True
+        result["message"] = f"列印清洗完成，處理了 {pages_written} 頁"
+        self._report_blank_pages(result, timer, blank_pages)
+        if optimize or linearize:
+            self._optimize_output(output, result, timer, linearize, deterministic)
+        if verify:
+            self._verify_output(source, output, result, timer, pages)
+        if deterministic:
+            # 可重現的輸出才適合以雜湊值作為快取與去重複的鍵
+            result["clean_hash"] = output_hash(output)
+        return True
 
-        except Exception as e:
-            self.logger.error(f"創建PDF時發生錯誤: {e}")
-            return False
+    def _optimize_output(
+        self,
+        output,
+        result: dict,
+        timer: StageTimer,
+        linearize: bool = False,
+        deterministic: bool = False,
+    ):
+        """對輸出執行最佳化後處理，並在結果中記錄前後大小與耗時"""
+        with timer.stage("optimize"):
+            result["optimization"] = optimize_pdf(output, linearize, deterministic)
+        result["message"] += describe_optimization(result["optimization"])
+
+    def _verify_output(
+        self, source, output, result: dict, timer: StageTimer, pages: Optional[range] = None
+    ):
+        """以低解析度逐頁比較輸入與輸出的外觀，差異過大的頁面列於 result["verification"]"""
+        with timer.stage("verify"):
+            report = verify_pdf(source, output if is_path(output) else output.getvalue(), pages)
+        result["verification"] = report
+        result["message"] += describe_verification(report)
+        if report["flagged"]:
+            pages_text = ", ".join(str(item["page"]) for item in report["flagged"][:10])
+            self.logger.warning(f"視覺驗證: {len(report['flagged'])} 頁與原始文件差異過大 ({pages_text})")
+
+    def _report_blank_pages(self, result: dict, timer: StageTimer, blank_pages: str):
+        """在結果中記錄略過渲染的空白頁數"""
+        if blank_pages == "keep":
+            return
+        blank = timer.counters.get("blank_pages", 0)
+        result["pages_blank"] = blank
+        if blank:
+            action = "已移除" if blank_pages == "drop" else "以空白頁輸出"
+            result["message"] += f"（空白頁 {blank} 頁{action}）"
+            self.logger.info(f"略過 {blank} 頁空白頁的渲染，{action}")
+
+    def _incremental_print_clean(
+        self,
+        input_path: str,
+        output_path: str,
+        dpi: int,
+        result: dict,
+        timer: StageTimer,
+        previous: str,
+        output_dpi: Optional[int] = None,
+        blank_pages: str = "keep",
+        palette: str = "lossless",
+        colorspace: str = "rgb",
+        optimize: bool = False,
+        linearize: bool = False,
+        verify: bool = False,
+    ) -> bool:
+        """只重建指紋與先前輸出不同的頁面，其餘頁面直接沿用先前的清潔輸出"""
+        if blank_pages == "drop":
+            # 頁面指紋與輸出頁碼一一對應，增量重建時空白頁改為輸出空白頁
+            self.logger.warning("增量重建不移除空白頁，改為輸出空白頁")
+            blank_pages = "empty"
+
+        with timer.stage("scan"):
+            doc = open_pdf_document(input_path)
+            try:
+                fingerprints = page_fingerprints(doc)
+            finally:
+                doc.close()
+            reusable = load_page_map(
+                previous, dpi, output_dpi, colorspace, palette, blank_pages
+            )
+
+        changed = [n for n, fingerprint in enumerate(fingerprints) if fingerprint not in reusable]
+        result["pages_reused"] = len(fingerprints) - len(changed)
+        result["pages_rebuilt"] = len(changed)
+        self.logger.info(f"增量重建: 重用 {result['pages_reused']} 頁，重建 {len(changed)} 頁")
+
+        if not reusable:
+            # 沒有可重用的頁面時直接輸出，不需要再組合
+            if self.render_and_write(
+                input_path,
+                output_path,
+                dpi,
+                timer,
+                None,
+                output_dpi,
+                blank_pages,
+                palette,
+                colorspace,
+            ) != len(fingerprints):
+                result["message"] = "無法渲染PDF頁面"
+                return False
+        else:
+            rebuilt = io.BytesIO()
+            if changed and self.render_and_write(
+                input_path,
+                rebuilt,
+                dpi,
+                timer,
+                changed,
+                output_dpi,
+                blank_pages,
+                palette,
+                colorspace,
+            ) != len(changed):
+                result["message"] = "無法渲染PDF頁面"
+                return False
+
+            with timer.stage("write"):
+                rebuilt_index = {page_num: n for n, page_num in enumerate(changed)}
+                plan = [
+                    ("previous", reusable[fingerprint])
+                    if fingerprint in reusable
+                    else ("rebuilt", rebuilt_index[n])
+                    for n, fingerprint in enumerate(fingerprints)
+                ]
+                assemble_pages(plan, previous, rebuilt.getvalue(), output_path)
+
+        result["pages_processed"] = len(fingerprints)
+        result["success"] = True
+        result["message"] = (
+            f"列印清洗完成，處理了 {len(fingerprints)} 頁"
+            f"（重用 {result['pages_reused']} 頁，重建 {result['pages_rebuilt']} 頁）"
+        )
+        self._report_blank_pages(result, timer, blank_pages)
+        if optimize or linearize:
+            # 附屬檔案記錄最佳化後的輸出大小，最佳化須在記錄之前完成
+            self._optimize_output(output_path, result, timer, linearize)
+        if verify:
+            self._verify_output(input_path, output_path, result, timer)
+
+        save_page_map(
+            output_path, fingerprints, dpi, output_dpi, colorspace, palette, blank_pages
+        )
+        return True
 
     def print_clean_pdf(
-        self, input_path: str, output_path: str, dpi: int = 300
+        self,
+        input_path: str,
+        output_path: str,
+        dpi: int = 300,
+        profiler: Optional[StageProfiler] = None,
+        pages: Optional[range] = None,
+        previous: Optional[str] = None,
+        output_dpi: Optional[int] = None,
+        blank_pages: str = "keep",
+        palette: str = "lossless",
+        colorspace: str = "rgb",
+        optimize: bool = False,
+        linearize: bool = False,
+        deterministic: bool = False,
+        verify: bool = False,
     ) -> dict:
-        """主要清洗功能 - 透過列印重建"""
+        """
+        主要清洗功能 - 透過列印重建
+
+        profiler 用於記錄各階段的效能分析；pages 指定只重建的頁面範圍
+        （用於分片處理大型文件）。previous 為先前同一文件的清潔輸出（可與
+        output_path 相同），指定時只重建頁面指紋有變更的頁面，並在輸出旁
+        記錄本次的頁面指紋。output_dpi 為輸出點陣的解析度，低於 dpi 時
+        以 dpi 渲染後縮小（未指定時與 dpi 相同）。blank_pages 為 empty 時
+        空白頁以同尺寸的空白頁輸出，為 drop 時自輸出中移除（見 BLANK_PAGE_MODES）。
+        palette 為 lossless（預設）時顏色少的頁面無損轉為索引色，quantize 另量化
+        顏色略多的頁面，off 一律輸出 RGB。colorspace 為 gray 時輸出灰階，mono 與
+        mono-dither 輸出每像素 1 位元的黑白點陣（後者以有序抖動保留灰階層次）。
+        optimize 為 True 時對輸出執行最佳化後處理（見 pdf_optimize），linearize 另行
+        線性化；前後大小與耗時記錄於 result["optimization"]。deterministic 為 True 時
+        相同的輸入與選項產生位元組完全相同的輸出，並以 result["clean_hash"] 回報其雜湊值；
+        此時不使用增量重建（輸出會依先前的輸出而不同）。verify 為 True 時以低解析度
+        逐頁比較輸入與輸出的外觀，結果記錄於 result["verification"]（見 visual_verify）。
+        """
         result = {
             "success": False,
             "message": "",
             "pages_processed": 0,
             "output_file": output_path,
         }
+        timer = StageTimer(profiler)
 
         try:
             # 檢查輸入檔案
@@ -159,32 +797,137 @@ class PDFPrintCleaner:
                 return result
 
             self.logger.info(f"開始列印清洗: {input_path} -> {output_path}")
-            self.logger.info(f"使用DPI: {dpi}")
-
-            # 第一階段：渲染PDF為圖像
-            rendered_pages = self.render_pdf_to_images(input_path, dpi)
-
-            if not rendered_pages:
-                result["message"] = "無法渲染PDF頁面"
-                return result
+            self.logger.info(f"使用DPI: {dpi}" + (f"，輸出DPI: {output_dpi}" if output_dpi else ""))
 
-            result["pages_processed"] = len(rendered_pages)
+            if previous is not None and deterministic:
+                self.logger.warning("可重現輸出不使用增量重建，改為重建所有頁面")
+                previous = None
 
-            # 第二階段：從圖像重建PDF
-            if self.create_pdf_from_images(rendered_pages, output_path):
-                result["success"] = True
-                result["message"] = f"列印清洗完成，處理了 {len(rendered_pages)} 頁"
+            if previous is not None and pages is None:
+                cleaned = self._incremental_print_clean(
+                    input_path,
+                    output_path,
+                    dpi,
+                    result,
+                    timer,
+                    previous,
+                    output_dpi,
+                    blank_pages,
+                    palette,
+                    colorspace,
+                    optimize,
+                    linearize,
+                    verify,
+                )
+            else:
+                cleaned = self._print_clean_source(
+                    input_path,
+                    output_path,
+                    dpi,
+                    result,
+                    timer,
+                    pages,
+                    output_dpi,
+                    blank_pages,
+                    palette,
+                    colorspace,
+                    optimize,
+                    linearize,
+                    deterministic,
+                    verify,
+                )
 
+            if cleaned:
                 # 檢查輸出檔案大小
                 if os.path.exists(output_path):
                     size_mb = os.path.getsize(output_path) / (1024 * 1024)
                     self.logger.info(f"輸出檔案大小: {size_mb:.2f} MB")
-            else:
-                result["message"] = "重建PDF失敗"
 
         except Exception as e:
             self.logger.error(f"列印清洗過程發生錯誤: {e}")
             result["message"] = f"處理失敗: {str(e)}"
+            result["transient"] = isinstance(e, TRANSIENT_ERRORS)
+
+        finally:
+            result["timings"] = timer.as_dict()
+            if timer.counters:
+                result["counters"] = dict(timer.counters)
+            flush_repeated_warnings(self.logger)
+
+        return result
+
+    def print_clean_pdf_bytes(
+        self,
+        data,
+        output=None,
+        dpi: int = 300,
+        profiler: Optional[StageProfiler] = None,
+        output_dpi: Optional[int] = None,
+        blank_pages: str = "keep",
+        palette: str = "lossless",
+        colorspace: str = "rgb",
+        optimize: bool = False,
+        linearize: bool = False,
+        deterministic: bool = False,
+        verify: bool = False,
+    ) -> dict:
+        """
+        列印重建記憶體中的PDF，不經過暫存檔
+
+        data 可為 bytes、bytearray、memoryview 或二進位檔案物件。
+        未指定 output 時，清潔PDF以 result["output_data"] 回傳；
+        否則寫入 output 串流。
+        """
+        result = {
+            "success": False,
+            "message": "",
+            "pages_processed": 0,
+            "output_file": None,
+        }
+        timer = StageTimer(profiler)
+
+        try:
+            source = read_pdf_source(data)
+            if is_path(source):
+                raise TypeError("請使用 print_clean_pdf() 處理檔案路徑")
+
+            self.logger.info(f"開始列印清洗: {describe_source(source)}")
+            self.logger.info(f"使用DPI: {dpi}")
+
+            buffer = io.BytesIO()
+            if self._print_clean_source(
+                source,
+                buffer,
+                dpi,
+                result,
+                timer,
+                None,
+                output_dpi,
+                blank_pages,
+                palette,
+                colorspace,
+                optimize,
+                linearize,
+                deterministic,
+                verify,
+            ):
+                size_mb = buffer.getbuffer().nbytes / (1024 * 1024)
+                self.logger.info(f"輸出資料大小: {size_mb:.2f} MB")
+                if output is None:
+                    result["output_data"] = buffer.getvalue()
+                else:
+                    output.write(buffer.getbuffer())
+
+        except Exception as e:
+            self.logger.error(f"列印清洗過程發生錯誤: {e}")
+            result["message"] = f"處理失敗: {str(e)}"
+            result["transient"] = isinstance(e, TRANSIENT_ERRORS)
+
+        finally:
+            result["timings"] = timer.as_dict()
+            if timer.counters:
+                result["counters"] = dict(timer.counters)
+            flush_repeated_warnings(self.logger)
 
         return result
 
@@ -194,46 +937,221 @@ def main():
     parser = argparse.ArgumentParser(
         description="PDF列印清洗工具 - 透過虛擬列印移除所有潛在威脅"
     )
-    parser.add_argument("input", help="輸入PDF檔案路徑")
-    parser.add_argument("output", help="輸出清潔PDF檔案路徑")
+    parser.add_argument("input", help='輸入PDF檔案路徑，"-" 代表標準輸入')
+    parser.add_argument("output", help='輸出清潔PDF檔案路徑，"-" 代表標準輸出 (日誌與報告改寫到標準錯誤)')
     parser.add_argument(
         "--dpi", type=int, default=300, help="渲染DPI (預設: 300, 建議範圍: 150-600)"
     )
+    parser.add_argument(
+        "--output-dpi",
+        type=dpi_arg,
+        help="輸出點陣解析度；低於 --dpi 時以 --dpi 渲染後以區域平均縮小 (預設: 與 --dpi 相同)",
+    )
+    parser.add_argument(
+        "--blank-pages",
+        choices=BLANK_PAGE_MODES,
+        default="keep",
+        help="空白頁處理: keep 照常渲染, empty 輸出空白頁, drop 移除 (預設: keep)",
+    )
+    parser.add_argument(
+        "--palette",
+        choices=PALETTE_MODES,
+        default="lossless",
+        help="索引色: lossless 無損轉換顏色少的頁面, quantize 另量化顏色略多的頁面, off 一律RGB (預設: lossless)",
+    )
+    parser.add_argument(
+        "--colorspace",
+        choices=COLORSPACES,
+        default="rgb",
+        help="輸出色彩: rgb 全彩, gray 灰階, mono 黑白, mono-dither 抖動黑白 (預設: rgb)",
+    )
+    parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="輸出最佳化：移除未使用物件、合併相同串流並壓縮為物件串流",
+    )
+    parser.add_argument(
+        "--linearize",
+        action="store_true",
+        help="線性化輸出以便網頁檢視器快速顯示第一頁 (隱含 --optimize，需要 pikepdf)",
+    )
+    parser.add_argument(
+        "--deterministic",
+        action="store_true",
+        help="可重現輸出：相同的輸入與選項產生位元組完全相同的PDF，並回報其雜湊值",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="以低解析度逐頁比較輸入與輸出的外觀，列出差異過大的頁面",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="只重建與既有輸出檔案相比有變更的頁面，其餘頁面沿用既有輸出",
+    )
+    parser.add_argument(
+        "--previous",
+        metavar="PDF",
+        help="增量重建時沿用此先前清潔輸出的頁面 (隱含 --incremental)",
+    )
+    parser.add_argument(
+        "--spool-mb",
+        type=int,
+        default=DEFAULT_SPOOL_MB,
+        help=f"標準輸入不超過此大小時完全在記憶體中處理，超過時改寫入暫存檔 (預設: {DEFAULT_SPOOL_MB})",
+    )
+    parser.add_argument(
+        "--report-fd",
+        type=int,
+        metavar="FD",
+        help="將結果以一行 JSON 寫入此檔案描述元 (例如 2 為標準錯誤)，取代文字報告",
+    )
     parser.add_argument("-v", "--verbose", action="store_true", help="詳細輸出")
+    parser.add_argument(
+        "--log-file", help='日誌檔案路徑，"-" 代表不寫入檔案 (預設: pdf_print_cleaner.log)'
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="將各階段的 cProfile 統計、tracemalloc 快照與 profile.json 摘要寫入 DIR",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=DEFAULT_TOP_PAGES,
+        help=f"效能分析摘要列出的最慢頁數 (預設: {DEFAULT_TOP_PAGES})",
+    )
 
     args = parser.parse_args()
 
-    if args.verbose:
-        logging.getLogger().setLevel(logging.DEBUG)
+    # 輸出寫到標準輸出時，日誌與報告改寫到標準錯誤
+    stdout_output = args.output == STDIO_PATH
+    report = sys.stderr if stdout_output else sys.stdout
+    pdf_stdout = reserve_stdout() if stdout_output else None
+    configure_logging(
+        log_file=args.log_file,
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        stream=sys.stderr if stdout_output else None,
+        default_log_file="pdf_print_cleaner.log",
+    )
 
     # 驗證DPI範圍
     if args.dpi < 72 or args.dpi > 1200:
-        print("警告: DPI應在72-1200範圍內，使用預設值300")
+        print("警告: DPI應在72-1200範圍內，使用預設值300", file=report)
         args.dpi = 300
 
     # 創建清洗工具
     cleaner = PDFPrintCleaner()
+    options = {
+        "output_dpi": args.output_dpi,
+        "blank_pages": args.blank_pages,
+        "palette": args.palette,
+        "colorspace": args.colorspace,
+        "optimize": args.optimize,
+        "linearize": args.linearize,
+        "deterministic": args.deterministic,
+        "verify": args.verify,
+    }
 
     # 執行列印清洗
-    result = cleaner.print_clean_pdf(args.input, args.output, args.dpi)
+    profiler = StageProfiler(args.profile_top) if args.profile else None
+    if profiler:
+        profiler.start()
+    temp_paths = []
+    try:
+        source = args.input
+        if args.input == STDIO_PATH:
+            # 小於 --spool-mb 的輸入完全在記憶體中處理
+            source = spool_stream(sys.stdin.buffer, args.spool_mb * 1024 * 1024)
+            if is_path(source):
+                temp_paths.append(source)
+
+        previous = args.previous
+        if args.incremental and not stdout_output:
+            previous = previous or args.output
+
+        if is_path(source):
+            output_path = args.output
+            if stdout_output:
+                fd, output_path = tempfile.mkstemp(suffix=".pdf")
+                os.close(fd)
+                temp_paths.append(output_path)
+            result = cleaner.print_clean_pdf(
+                source, output_path, args.dpi, profiler, previous=previous, **options
+            )
+            if stdout_output and result["success"]:
+                stream_output(output_path, pdf_stdout)
+        else:
+            if previous is not None:
+                cleaner.logger.warning("記憶體中的輸入不使用增量重建，改為重建所有頁面")
+            result = cleaner.print_clean_pdf_bytes(
+                source, pdf_stdout, args.dpi, profiler, **options
+            )
+            if result["success"] and not stdout_output:
+                with open(args.output, "wb") as f:
+                    f.write(result.pop("output_data"))
+        if stdout_output or not is_path(source):
+            result["output_file"] = args.output
+    finally:
+        if pdf_stdout is not None:
+            pdf_stdout.close()
+        for path in temp_paths:
+            if os.path.exists(path):
+                os.remove(path)
+    if profiler:
+        profiler.stop()
+        profile_summary = profiler.write(args.profile, result["timings"])
+
+    if args.report_fd is not None:
+        # 供管線使用的 JSON 結果，取代文字報告
+        with open(args.report_fd, "w", encoding="utf-8", closefd=False) as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        return 0 if result["success"] else 1
 
     # 輸出結果報告
-    print("\n" + "=" * 60)
-    print("PDF列印清洗結果報告")
-    print("=" * 60)
-    print(f"處理狀態: {'✅ 成功' if result['success'] else '❌ 失敗'}")
-    print(f"處理訊息: {result['message']}")
-    print(f"處理頁數: {result['pages_processed']}")
+    print("\n" + "=" * 60, file=report)
+    print("PDF列印清洗結果報告", file=report)
+    print("=" * 60, file=report)
+    print(f"處理狀態: {'✅ 成功' if result['success'] else '❌ 失敗'}", file=report)
+    print(f"處理訊息: {result['message']}", file=report)
+    print(f"處理頁數: {result['pages_processed']}", file=report)
+    if "pages_reused" in result:
+        print(f"重用頁數: {result['pages_reused']}", file=report)
+        print(f"重建頁數: {result['pages_rebuilt']}", file=report)
+    if "pages_blank" in result:
+        print(f"空白頁數: {result['pages_blank']}", file=report)
+    if "optimization" in result:
+        optimization = result["optimization"]
+        print(
+            f"輸出最佳化: {optimization['input_bytes']:,} -> {optimization['output_bytes']:,} bytes"
+            f"，耗時 {optimization['seconds']:.2f} 秒",
+            file=report,
+        )
+
+    if result.get("clean_hash"):
+        print(f"清潔檔案雜湊: {result['clean_hash']}", file=report)
+    if "verification" in result:
+        verification = result["verification"]
+        print(
+            f"視覺驗證: 比較 {verification['pages_compared']} 頁，差異過大 {len(verification['flagged'])} 頁",
+            file=report,
+        )
+        for item in verification["flagged"]:
+            print(f"  - 第 {item['page']} 頁: 相似度 {item['similarity']:.2f}", file=report)
 
     if result["success"]:
-        print(f"輸出檔案: {result['output_file']}")
-        print("\n🔒 安全性說明:")
-        print("- 所有原始PDF結構已完全移除")
-        print("- JavaScript、表單、嵌入檔案等威脅已消除")
-        print("- 檔案內容已透過視覺渲染重建")
-        print("- 這是最高安全等級的PDF清洗方式")
-
-    print("=" * 60)
+        print(f"輸出檔案: {result['output_file']}", file=report)
+        print("\n🔒 安全性說明:", file=report)
+        print("- 所有原始PDF結構已完全移除", file=report)
+        print("- JavaScript、表單、嵌入檔案等威脅已消除", file=report)
+        print("- 檔案內容已透過視覺渲染重建", file=report)
+        print("- 這是最高安全等級的PDF清洗方式", file=report)
+
+    if profiler:
+        print(f"\n效能分析結果: {profile_summary}", file=report)
+
+    print("=" * 60, file=report)
 
     return 0 if result["success"] else 1
 
@@ -0,0 +1,153 @@
+"""
+效能分析 - 以 cProfile 與 tracemalloc 記錄每個清洗階段與最慢的頁面
+Profiling - Capture cProfile stats and tracemalloc snapshots per cleaning stage
+and record the slowest pages
+"""
+
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# 摘要中列出的最慢頁面與記憶體配置位置數量
+DEFAULT_TOP_PAGES = 10
+TOP_ALLOCATIONS = 10
+
+
+class StageProfiler:
+    """
+    附加在 StageTimer 上，於每個階段進出時切換 cProfile 並量測 tracemalloc
+
+    與 StageTimer 相同，巢狀階段採獨佔計算：進入內層階段時暫停外層的
+    profiler，離開時再恢復。同一階段多次進入時統計會累加。
+    """
+
+    def __init__(self, top_pages: int = DEFAULT_TOP_PAGES):
+        self.top_pages = top_pages
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        self.memory: Dict[str, Dict] = {}
+        self.page_seconds: Dict[int, float] = {}
+        self._snapshots: Dict[str, tracemalloc.Snapshot] = {}
+        self._stack: List[Dict] = []
+        self._started_tracemalloc = False
+
+    def start(self):
+        """開始追蹤記憶體配置（在清洗前呼叫）"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def stop(self):
+        """停止追蹤記憶體配置"""
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _profile(self, name: str) -> cProfile.Profile:
+        profile = self.profiles.get(name)
+        if profile is None:
+            profile = self.profiles[name] = cProfile.Profile()
+        return profile
+
+    def enter(self, name: str):
+        """進入階段：暫停外層 profiler，啟動本階段的 profiler"""
+        current = 0
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+
+        if self._stack:
+            self._profile(self._stack[-1]["name"]).disable()
+        self._stack.append({"name": name, "start": current, "peak": current})
+        self._profile(name).enable()
+
+    def exit(self, name: str):
+        """離開階段：記錄記憶體用量，恢復外層 profiler"""
+        self._profile(name).disable()
+        frame = self._stack.pop()
+
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            # 內層階段的峰值也算入外層階段
+            peak = max(peak, frame["peak"])
+            if self._stack:
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+
+            stats = self.memory.setdefault(
+                name, {"peak_bytes": 0, "net_bytes": 0, "calls": 0}
+            )
+            stats["calls"] += 1
+            stats["net_bytes"] += current - frame["start"]
+            if peak - frame["start"] > stats["peak_bytes"]:
+                # 只保留本階段記憶體峰值最高那一次的快照
+                stats["peak_bytes"] = peak - frame["start"]
+                self._snapshots[name] = tracemalloc.take_snapshot()
+
+        if self._stack:
+            self._profile(self._stack[-1]["name"]).enable()
+
+    @contextmanager
+    def page(self, page_num: int):
+        """累計單一頁面的處理時間（同一頁可分多次進入）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.page_seconds[page_num] = self.page_seconds.get(page_num, 0.0) + elapsed
+
+    def slowest_pages(self) -> List[Dict]:
+        ranked = sorted(self.page_seconds.items(), key=lambda item: item[1], reverse=True)
+        return [
+            {"page": page_num + 1, "seconds": round(seconds, 4)}
+            for page_num, seconds in ranked[: self.top_pages]
+        ]
+
+    def write(self, output_dir: str, timings: Optional[Dict] = None) -> str:
+        """
+        寫出分析結果，回傳摘要檔路徑
+
+        每個階段輸出 <stage>.pstats（可用 pstats 或 snakeviz 檢視）與
+        <stage>.tracemalloc（tracemalloc.Snapshot.load 讀取），
+        並輸出 profile.json 摘要。
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        stages = {}
+
+        for name, profile in self.profiles.items():
+            pstats_path = os.path.join(output_dir, f"{name}.pstats")
+            profile.dump_stats(pstats_path)
+            stage = {"pstats": os.path.basename(pstats_path)}
+
+            if name in self.memory:
+                stage.update(self.memory[name])
+
+            snapshot = self._snapshots.get(name)
+            if snapshot is not None:
+                snapshot_path = os.path.join(output_dir, f"{name}.tracemalloc")
+                snapshot.dump(snapshot_path)
+                stage["tracemalloc"] = os.path.basename(snapshot_path)
+                stage["top_allocations"] = [
+                    {"location": str(stat.traceback), "bytes": stat.size, "count": stat.count}
+                    for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+                ]
+
+            if timings and name in timings:
+                stage["seconds"] = timings[name]
+            stages[name] = stage
+
+        summary = {
+            "stages": stages,
+            "slowest_pages": self.slowest_pages(),
+            "pages_timed": len(self.page_seconds),
+        }
+        summary_path = os.path.join(output_dir, "profile.json")
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+        return summary_path
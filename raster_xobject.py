@@ -0,0 +1,150 @@
+"""
+點陣影像物件 - 將已壓縮的頁面點陣直接寫入 reportlab 文件，不再經過 PNG 與重新解碼
+Raster XObjects - Embed pre-compressed page rasters in a reportlab document
+without a PNG round-trip or re-decoding
+"""
+
+import hashlib
+from typing import Dict, Optional, Sequence
+
+
+class EncodedImage:
+    """
+    已編碼的影像串流與描述它所需的影像字典欄位
+
+    data 為經過 filters 編碼後的串流內容；decode_parms 對應 /DecodeParms。
+    palette 為索引色影像的調色盤（每色 color_space 的各色版位元組依序排列），
+    此時影像以 [/Indexed color_space 最大索引 調色盤] 色彩空間輸出。
+    """
+
+    __slots__ = (
+        "data",
+        "width",
+        "height",
+        "color_space",
+        "bits_per_component",
+        "filters",
+        "decode_parms",
+        "palette",
+    )
+
+    def __init__(
+        self,
+        data: bytes,
+        width: int,
+        height: int,
+        color_space: str = "DeviceRGB",
+        bits_per_component: int = 8,
+        filters: Sequence[str] = ("FlateDecode",),
+        decode_parms: Optional[Dict[str, int]] = None,
+        palette: Optional[bytes] = None,
+    ):
+        self.data = data
+        self.width = width
+        self.height = height
+        self.color_space = color_space
+        self.bits_per_component = bits_per_component
+        self.filters = tuple(filters)
+        self.decode_parms = decode_parms
+        self.palette = palette
+
+    @property
+    def components(self) -> int:
+        return {"DeviceGray": 1, "DeviceRGB": 3, "DeviceCMYK": 4}[self.color_space]
+
+
+def _image_xobject_class():
+    # reportlab 延遲載入，匯入本模組不需要付出載入成本
+    from reportlab.pdfbase.pdfdoc import PDFArray, PDFDictionary, PDFImageXObject, PDFName, PDFStream
+
+    class _EncodedImageXObject(PDFImageXObject):
+        """直接輸出已編碼串流的影像物件（不套用 reportlab 的 ASCII85 與重新壓縮）"""
+
+        def __init__(self, name: str, image: EncodedImage):
+            self.name = name
+            self.image = image
+            self.width = image.width
+            self.height = image.height
+            self.mask = None
+
+        def format(self, document):
+            image = self.image
+            stream = PDFStream(content=image.data)
+            dictionary = stream.dictionary
+            dictionary["Type"] = PDFName("XObject")
+            dictionary["Subtype"] = PDFName("Image")
+            dictionary["Width"] = image.width
+            dictionary["Height"] = image.height
+            dictionary["BitsPerComponent"] = image.bits_per_component
+            if image.palette:
+                dictionary["ColorSpace"] = PDFArray(
+                    [
+                        PDFName("Indexed"),
+                        PDFName(image.color_space),
+                        len(image.palette) // image.components - 1,
+                        # 位元組原樣輸出；reportlab 的 PDFString 會重新編碼二進位內容
+                        b"<" + image.palette.hex().encode("ascii") + b">",
+                    ]
+                )
+            else:
+                dictionary["ColorSpace"] = PDFName(image.color_space)
+            dictionary["Filter"] = PDFArray([PDFName(f) for f in image.filters])
+            if image.decode_parms:
+                dictionary["DecodeParms"] = PDFDictionary(dict(image.decode_parms))
+            return stream.format(document)
+
+    return _EncodedImageXObject
+
+
+_xobject_class = None
+
+
+def image_key(image: EncodedImage) -> str:
+    """
+    影像物件的去重鍵
+
+    涵蓋影像字典輸出的所有欄位：只比對串流內容時，樣本相同但尺寸、色彩空間
+    或調色盤不同的影像（例如不同顏色的單色頁面）會誤用同一個物件。
+    """
+    fields = (
+        image.width,
+        image.height,
+        image.color_space,
+        image.bits_per_component,
+        image.filters,
+        sorted((image.decode_parms or {}).items()),
+        len(image.data),
+        len(image.palette) if image.palette is not None else None,
+    )
+    digest = hashlib.sha1(repr(fields).encode("ascii"))
+    digest.update(image.data)
+    if image.palette is not None:
+        digest.update(image.palette)
+    return "raster" + digest.hexdigest()
+
+
+def draw_encoded_image(canvas, image: EncodedImage, x: float, y: float, width: float, height: float):
+    """
+    在 reportlab 畫布上繪製已編碼的影像
+
+    與 Canvas.drawImage 相同，內容與影像字典都相同的影像在文件中只儲存一次。
+    """
+    global _xobject_class
+    if _xobject_class is None:
+        _xobject_class = _image_xobject_class()
+
+    name = image_key(image)
+    document = canvas._doc
+    registered = document.getXObjectName(name)
+    if document.idToObject.get(registered) is None:
+        xobject = _xobject_class(name, image)
+        canvas._setXObjects(xobject)
+        document.Reference(xobject, registered)
+        document.addForm(name, xobject)
+
+    canvas.saveState()
+    canvas.translate(x, y)
+    canvas.scale(width, height)
+    canvas._code.append(f"/{registered} Do")
+    canvas.restoreState()
+    canvas._formsinuse.append(name)
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+PDF掃描索引 - 平行驗證與掃描大量檔案並將結果保存在SQLite索引中
+PDF Scan Index - Verify and scan large trees in parallel and keep the results
+in a persistent SQLite index for triage
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterable, List, Optional
+
+from batch_cleaner import WORKER_CRASH_MESSAGE, _init_scan_worker, collect_inputs, scan_one
+from log_config import configure_logging
+from metrics import threat_type
+
+# 每累積多少筆結果寫入一次索引（單一交易）
+COMMIT_BATCH = 500
+
+# 分類
+FLAGGED = "flagged"
+CLEAN = "clean"
+INVALID = "invalid"
+CATEGORIES = (FLAGGED, CLEAN, INVALID)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL DEFAULT '',
+    valid INTEGER NOT NULL,
+    page_count INTEGER,
+    threat_count INTEGER NOT NULL DEFAULT 0,
+    threats TEXT NOT NULL DEFAULT '[]',
+    message TEXT NOT NULL DEFAULT '',
+    scanned_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_triage ON files (valid, threat_count);
+CREATE TABLE IF NOT EXISTS threats (
+    path TEXT NOT NULL REFERENCES files (path) ON DELETE CASCADE,
+    type TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS threats_type ON threats (type);
+CREATE INDEX IF NOT EXISTS threats_path ON threats (path);
+"""
+
+
+class ScanIndex:
+    """
+    掃描結果索引 - 每個檔案一筆紀錄：路徑、大小、修改時間、SHA-256、威脅與頁數
+
+    大小與修改時間未變更的檔案在重新掃描時略過。威脅另外依類型存放，
+    可直接查詢需要重建的檔案。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def is_current(self, path: str, stat: os.stat_result) -> bool:
+        """索引中的紀錄是否仍對應目前的檔案內容（大小與修改時間未變）"""
+        row = self.conn.execute(
+            "SELECT size, mtime_ns FROM files WHERE path = ?", (path,)
+        ).fetchone()
+        return row is not None and (row["size"], row["mtime_ns"]) == (
+            stat.st_size,
+            stat.st_mtime_ns,
+        )
+
+    def record_many(self, entries: Iterable[Dict]):
+        """以單一交易寫入多筆掃描結果"""
+        now = time.time()
+        with self._transaction() as conn:
+            for entry in entries:
+                threats = entry.get("threats_found", [])
+                conn.execute("DELETE FROM threats WHERE path = ?", (entry["path"],))
+                conn.execute(
+                    "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256, valid,"
+                    " page_count, threat_count, threats, message, scanned_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        entry["path"],
+                        entry["size"],
+                        entry["mtime_ns"],
+                        entry.get("original_hash", ""),
+                        1 if entry.get("success") else 0,
+                        entry.get("page_count"),
+                        len(threats),
+                        json.dumps(threats, ensure_ascii=False),
+                        entry.get("message", ""),
+                        now,
+                    ),
+                )
+                conn.executemany(
+                    "INSERT INTO threats (path, type) VALUES (?, ?)",
+                    [(entry["path"], kind) for kind in sorted(set(map(threat_type, threats)))],
+                )
+
+    def query(
+        self,
+        category: Optional[str] = None,
+        threat: Optional[str] = None,
+        min_pages: Optional[int] = None,
+    ) -> List[sqlite3.Row]:
+        """
+        查詢索引
+
+        category 為 flagged（通過驗證但發現威脅）、clean（通過驗證且無威脅）
+        或 invalid（未通過驗證）；threat 只選出含有該類型威脅的檔案。
+        """
+        conditions = []
+        params: list = []
+        if category == FLAGGED:
+            conditions.append("valid = 1 AND threat_count > 0")
+        elif category == CLEAN:
+            conditions.append("valid = 1 AND threat_count = 0")
+        elif category == INVALID:
+            conditions.append("valid = 0")
+        if threat:
+            conditions.append("path IN (SELECT path FROM threats WHERE type = ?)")
+            params.append(threat)
+        if min_pages is not None:
+            conditions.append("page_count >= ?")
+            params.append(min_pages)
+
+        sql = "SELECT * FROM files"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        return self.conn.execute(sql + " ORDER BY path", params).fetchall()
+
+    def stats(self) -> Dict:
+        """各分類的檔案數與各類型威脅的檔案數"""
+        row = self.conn.execute(
+            "SELECT COUNT(*) AS total,"
+            " COALESCE(SUM(valid = 1 AND threat_count > 0), 0) AS flagged,"
+            " COALESCE(SUM(valid = 1 AND threat_count = 0), 0) AS clean,"
+            " COALESCE(SUM(valid = 0), 0) AS invalid,"
+            " COALESCE(SUM(page_count), 0) AS pages FROM files"
+        ).fetchone()
+        threats = {
+            r["type"]: r["files"]
+            for r in self.conn.execute(
+                "SELECT type, COUNT(*) AS files FROM threats GROUP BY type ORDER BY files DESC"
+            )
+        }
+        return {**dict(row), "threats": threats}
+
+
+def scan_tree(
+    index: ScanIndex,
+    inputs: List[str],
+    workers: Optional[int] = None,
+    rescan: bool = False,
+) -> Dict:
+    """
+    平行驗證並掃描檔案，將結果寫入索引
+
+    未指定 rescan 時，大小與修改時間和索引紀錄相同的檔案不重新掃描。
+    同時送出的工作數有上限，大量檔案也不會一次建立所有工作。
+    工作行程當機時重新建立行程池，當時執行中的檔案各自單獨重試一次，
+    單獨掃描仍然當機的檔案記為無效。
+    """
+    logger = logging.getLogger(__name__)
+    workers = max(1, workers or os.cpu_count() or 1)
+    summary = {"total": len(inputs), "scanned": 0, "skipped": 0, "flagged": 0, "invalid": 0}
+    start = time.perf_counter()
+    pending = {}
+    finished: List[Dict] = []
+    # 工作行程當機時執行中、等待單獨重試的檔案
+    retry: Deque[Dict] = deque()
+    isolated = set()
+    broken = False
+
+    def flush():
+        if finished:
+            index.record_many(finished)
+            finished.clear()
+
+    def collect(done):
+        nonlocal broken
+        for future in done:
+            entry = pending.pop(future)
+            try:
+                entry.update(future.result())
+            except BrokenProcessPool:
+                broken = True
+                if entry["path"] not in isolated:
+                    isolated.add(entry["path"])
+                    retry.append(entry)
+                    continue
+                entry.update({"success": False, "message": WORKER_CRASH_MESSAGE})
+            except Exception as e:
+                entry.update({"success": False, "message": f"工作行程錯誤: {e}"})
+
+            summary["scanned"] += 1
+            if not entry.get("success"):
+                summary["invalid"] += 1
+            elif entry.get("threats_found"):
+                summary["flagged"] += 1
+                logger.info(f"發現威脅: {entry['path']}: {', '.join(entry['threats_found'])}")
+            finished.append(entry)
+            if len(finished) >= COMMIT_BATCH:
+                flush()
+
+    def make_executor():
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_scan_worker)
+
+    def recover():
+        # 行程池損壞時其餘執行中的工作也會隨即失敗：全部收回、重新建立行程池，
+        # 再逐一單獨重試受影響的檔案
+        nonlocal executor, broken
+        while broken:
+            collect(wait(pending)[0])
+            logger.error("工作行程異常結束，重新啟動工作行程池")
+            executor.shutdown(wait=False, cancel_futures=True)
+            executor = make_executor()
+            broken = False
+            while retry and not broken:
+                entry = retry.popleft()
+                pending[executor.submit(scan_one, entry["path"])] = entry
+                collect(wait(pending)[0])
+
+    def submit(entry: Dict):
+        nonlocal broken
+        try:
+            pending[executor.submit(scan_one, entry["path"])] = entry
+        except BrokenProcessPool:
+            broken = True
+            recover()
+            pending[executor.submit(scan_one, entry["path"])] = entry
+
+    executor = make_executor()
+    try:
+        for input_path in inputs:
+            path = os.path.abspath(input_path)
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                logger.warning(f"無法讀取檔案資訊: {path}: {e}")
+                continue
+
+            if not rescan and index.is_current(path, stat):
+                summary["skipped"] += 1
+                continue
+
+            if len(pending) >= workers * 4:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+                recover()
+
+            submit({"path": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+            recover()
+    finally:
+        executor.shutdown()
+    flush()
+
+    summary["elapsed"] = round(time.perf_counter() - start, 4)
+    return summary
+
+
+def main():
+    """主程式入口"""
+    parser = argparse.ArgumentParser(
+        description="PDF掃描索引 - 清洗前先平行掃描大量檔案，找出需要處理的檔案"
+    )
+    parser.add_argument("index", help="SQLite索引檔案路徑")
+    parser.add_argument("-v", "--verbose", action="store_true", help="詳細輸出")
+    parser.add_argument(
+        "--log-file", help='日誌檔案路徑，"-" 代表不寫入檔案 (預設: pdf_scan_index.log)'
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scan_parser = subparsers.add_parser("scan", help="掃描檔案並更新索引")
+    scan_parser.add_argument(
+        "inputs", nargs="*", help="輸入目錄、PDF檔案或萬用字元 (例如 'archive/**/*.pdf')"
+    )
+    scan_parser.add_argument("--list", dest="list_file", help="每行一個輸入路徑的清單檔案")
+    scan_parser.add_argument(
+        "-j", "--workers", type=int, help="工作行程數量 (預設: CPU核心數)"
+    )
+    scan_parser.add_argument(
+        "--rescan", action="store_true", help="重新掃描所有檔案，不略過未變更的檔案"
+    )
+
+    query_parser = subparsers.add_parser("query", help="列出符合條件的檔案路徑")
+    query_parser.add_argument(
+        "--category",
+        choices=CATEGORIES,
+        help="flagged: 發現威脅, clean: 無威脅, invalid: 未通過驗證",
+    )
+    query_parser.add_argument("--threat", help="只列出含有此類型威脅的檔案 (例如 /JavaScript)")
+    query_parser.add_argument("--min-pages", type=int, help="只列出頁數至少為此值的檔案")
+    query_parser.add_argument("--json", action="store_true", help="以JSONL輸出完整紀錄")
+
+    subparsers.add_parser("stats", help="顯示索引統計")
+
+    args = parser.parse_args()
+
+    # 查詢結果輸出到標準輸出，日誌改寫到標準錯誤
+    configure_logging(
+        log_file=args.log_file,
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        stream=sys.stderr,
+        default_log_file="pdf_scan_index.log",
+    )
+
+    index = ScanIndex(args.index)
+    try:
+        if args.command == "scan":
+            inputs = [path for path, _rel in collect_inputs(args.inputs, args.list_file)]
+            if not inputs:
+                print("找不到任何PDF輸入檔案", file=sys.stderr)
+                return 1
+            summary = scan_tree(index, inputs, args.workers, args.rescan)
+            print(
+                f"掃描完成: 共 {summary['total']} 個檔案，掃描 {summary['scanned']}，"
+                f"略過未變更 {summary['skipped']}，發現威脅 {summary['flagged']}，"
+                f"驗證失敗 {summary['invalid']} ({summary['elapsed']:.2f} 秒)"
+            )
+
+        elif args.command == "query":
+            for row in index.query(args.category, args.threat, args.min_pages):
+                if args.json:
+                    record = dict(row)
+                    record["threats"] = json.loads(record["threats"])
+                    print(json.dumps(record, ensure_ascii=False))
+                else:
+                    print(row["path"])
+
+        else:
+            stats = index.stats()
+            print(f"檔案總數: {stats['total']} (共 {stats['pages']} 頁)")
+            print(f"發現威脅: {stats['flagged']}")
+            print(f"無威脅: {stats['clean']}")
+            print(f"驗證失敗: {stats['invalid']}")
+            for kind, count in stats["threats"].items():
+                print(f"  {kind}: {count}")
+    finally:
+        index.close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -156,10 +156,20 @@ setup(
             "clean_pdf=pdf_cleaner:main",
             "pdf_cleaner=pdf_cleaner:main",
             "pdf_print_cleaner=print:main",
+            "pdf_batch_cleaner=batch_cleaner:main",
+            "pdf_cleaner_daemon=cleaner_daemon:main",
+            "pdf_job_queue=job_queue:main",
+            "pdf_watch_folder=watch_folder:main",
+            "pdf_scan_index=scan_index:main",
             # 別名
             "clean-pdf=pdf_cleaner:main",
             "pdf-cleaner=pdf_cleaner:main",
             "pdf-print-cleaner=print:main",
+            "pdf-batch-cleaner=batch_cleaner:main",
+            "pdf-cleaner-daemon=cleaner_daemon:main",
+            "pdf-job-queue=job_queue:main",
+            "pdf-watch-folder=watch_folder:main",
+            "pdf-scan-index=scan_index:main",
         ]
     },
     python_requires=">=3.7",
@@ -0,0 +1,217 @@
+"""
+頁面分片 - 將大型文件依頁面複雜度切成多個範圍平行清洗後再合併
+Page Sharding - Split a large document into page ranges by complexity,
+clean them in parallel and merge the partial PDFs
+"""
+
+import hashlib
+import os
+import shutil
+import time
+from typing import Dict, List, Optional
+
+from memory_budget import page_raster_bytes
+from pdf_optimize import describe_optimization, optimize_pdf
+from visual_verify import combine_verifications, describe_verification
+
+# 頁數少於此值的文件不分片
+SHARD_MIN_PAGES = 100
+
+# 每個分片至少包含的頁數，避免分片過細使每個行程重複開啟文件的成本過高
+MIN_PAGES_PER_SHARD = 10
+
+# 每個工作行程分配的分片數，讓較快完成的行程可以接手剩餘分片
+SHARDS_PER_WORKER = 3
+
+# 頁面複雜度估算：每個內容串流或圖片 byte 的相對成本，與列印模式每個點陣 byte 的相對成本
+CONTENT_BYTE_COST = 1.0
+RASTER_BYTE_COST = 0.05
+
+
+def _stream_length(doc, xref: int) -> int:
+    kind, value = doc.xref_get_key(xref, "Length")
+    if kind == "int":
+        return int(value)
+    return 0
+
+
+def page_costs(input_path: str, mode: str, dpi: int = 300) -> List[float]:
+    """
+    估算每頁的相對處理成本
+
+    內容提取模式的成本取決於內容串流與圖片大小；列印模式另外加上渲染後的點陣大小。
+    只讀取物件字典中的長度，不解壓縮任何串流。
+    """
+    import fitz  # PyMuPDF
+
+    costs = []
+    with fitz.open(input_path) as doc:
+        for page_num in range(doc.page_count):
+            page = doc[page_num]
+            content = sum(_stream_length(doc, xref) for xref in page.get_contents())
+            images = sum(_stream_length(doc, img[0]) for img in page.get_images())
+            cost = (content + images) * CONTENT_BYTE_COST
+            if mode == "print":
+                rect = page.rect
+                cost += page_raster_bytes(rect.width, rect.height, dpi) * RASTER_BYTE_COST
+            costs.append(max(cost, 1.0))
+    return costs
+
+
+def plan_shards(
+    costs: List[float], shard_count: int, min_pages: int = MIN_PAGES_PER_SHARD
+) -> List[range]:
+    """依每頁成本將頁面切成成本相近的連續範圍"""
+    page_count = len(costs)
+    shard_count = max(1, min(shard_count, page_count // max(1, min_pages)))
+    if shard_count == 1:
+        return [range(0, page_count)]
+
+    target = sum(costs) / shard_count
+    shards = []
+    start = 0
+    accumulated = 0.0
+    for page_num, cost in enumerate(costs):
+        accumulated += cost
+        remaining_shards = shard_count - len(shards) - 1
+        remaining_pages = page_count - page_num - 1
+        if (
+            remaining_shards > 0
+            and accumulated >= target * (len(shards) + 1)
+            and page_num + 1 - start >= min_pages
+            and remaining_pages >= min_pages * remaining_shards
+        ):
+            shards.append(range(start, page_num + 1))
+            start = page_num + 1
+    shards.append(range(start, page_count))
+    return shards
+
+
+def merge_shards(shard_paths: List[str], output_path: str):
+    """依序合併分片PDF；只複製物件，不重新編碼任何內容"""
+    import fitz  # PyMuPDF
+
+    with fitz.open() as merged:
+        for path in shard_paths:
+            with fitz.open(path) as shard:
+                # 只含空白頁且空白頁被移除的分片沒有頁面
+                if shard.page_count:
+                    merged.insert_pdf(shard)
+        if not merged.page_count:
+            # 整份文件都是被移除的空白頁，保留一頁空白頁
+            merged.new_page()
+        merged.save(output_path)
+
+
+def _file_hash(path: str) -> str:
+    hash_sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hash_sha256.update(chunk)
+    return hash_sha256.hexdigest()
+
+
+def combine_shard_results(
+    mode: str,
+    input_path: str,
+    output_path: str,
+    shard_dir: str,
+    shard_results: List[Dict],
+    scan_result: Optional[Dict] = None,
+    optimize: bool = False,
+    linearize: bool = False,
+) -> Dict:
+    """
+    合併所有分片並產生與單一文件清洗相同格式的結果
+
+    shard_results 依頁面順序排列，每項須包含 shard_path；內容提取模式的
+    scan_result 為整份文件的驗證與掃描結果。optimize 為 True 時對合併後的輸出
+    執行一次最佳化後處理。各分片已在工作行程中驗證時合併其視覺驗證報告。
+    完成後刪除分片暫存目錄。
+    """
+    record = {
+        "input": input_path,
+        "output": output_path,
+        "mode": mode,
+        "success": False,
+        "message": "",
+        "shards": len(shard_results),
+        "pages_processed": sum(r.get("pages_processed", 0) for r in shard_results),
+    }
+    if any("pages_blank" in r for r in shard_results):
+        record["pages_blank"] = sum(r.get("pages_blank", 0) for r in shard_results)
+    downsampled = [image for r in shard_results for image in r.get("images_downsampled", [])]
+    if downsampled:
+        record["images_downsampled"] = downsampled
+    verifications = [r["verification"] for r in shard_results if "verification" in r]
+    if verifications:
+        record["verification"] = combine_verifications(verifications)
+
+    timings: Dict[str, float] = {}
+    counters: Dict[str, int] = {}
+    for result in ([scan_result] if scan_result else []) + shard_results:
+        for name, seconds in result.get("timings", {}).items():
+            timings[name] = timings.get(name, 0.0) + seconds
+        for name, count in result.get("counters", {}).items():
+            counters[name] = counters.get(name, 0) + count
+
+    try:
+        if mode != "print":
+            scan_result = scan_result or {}
+            record["threats_found"] = list(scan_result.get("threats_found", []))
+            record["original_hash"] = scan_result.get("original_hash", "")
+            record["clean_hash"] = ""
+            if not scan_result.get("success"):
+                record["message"] = scan_result.get("message") or "檔案驗證失敗"
+                return record
+
+        failed = [r for r in shard_results if not r.get("success")]
+        if failed:
+            record["message"] = f"分片處理失敗: {failed[0].get('message', '')}"
+            return record
+
+        start = time.perf_counter()
+        merge_shards([r["shard_path"] for r in shard_results], output_path)
+        timings["write"] = timings.get("write", 0.0) + time.perf_counter() - start
+        if optimize or linearize:
+            record["optimization"] = optimize_pdf(output_path, linearize)
+            timings["optimize"] = timings.get("optimize", 0.0) + record["optimization"]["seconds"]
+
+        record["success"] = True
+        record["input_bytes"] = os.path.getsize(input_path)
+        record["output_bytes"] = os.path.getsize(output_path)
+        if mode == "print":
+            record["message"] = (
+                f"列印清洗完成，處理了 {record['pages_processed']} 頁"
+                f"（{len(shard_results)} 個分片）"
+            )
+            if record.get("pages_blank"):
+                record["message"] += f"（空白頁 {record['pages_blank']} 頁）"
+        else:
+            threat_count = len(record["threats_found"])
+            if any(r.get("threats_found") for r in shard_results):
+                record["threats_found"].append("內容提取過程中發現威脅")
+            record["clean_hash"] = _file_hash(output_path)
+            record["message"] = (
+                f"PDF清洗完成。發現 {threat_count} 個威脅並已移除"
+                f"（{len(shard_results)} 個分片）"
+            )
+        if "optimization" in record:
+            record["message"] += describe_optimization(record["optimization"])
+        if "verification" in record:
+            record["message"] += describe_verification(record["verification"])
+
+    except Exception as e:
+        record["message"] = f"合併分片失敗: {e}"
+
+    finally:
+        record["timings"] = {name: round(seconds, 4) for name, seconds in timings.items()}
+        if counters:
+            record["counters"] = counters
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+    return record
+
+
+def shard_path(shard_dir: str, index: int) -> str:
+    return os.path.join(shard_dir, f"shard_{index:04d}.pdf")
@@ -0,0 +1,102 @@
+"""
+階段計時 - 記錄清洗流程中各階段的耗時
+Stage Timing - Record the time spent in each stage of a cleaning run
+"""
+
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict
+
+# 清洗流程的標準階段名稱
+STAGES = ("scan", "extract", "render", "encode", "write")
+
+
+class StageTimer:
+    """
+    累計各階段耗時，同一階段可重複進入
+
+    階段可以巢狀，外層階段只計入扣除內層後的時間，
+    因此各階段耗時加總不會重複計算。
+    各階段記錄牆鐘時間：多個執行緒同時處於同一階段（例如列印模式的編碼執行緒）時，
+    重疊的時間只計算一次，單一階段的耗時不會超過整體耗時；不同階段可平行進行，
+    因此各階段加總仍可能大於整體耗時。
+    profiler 為選用的 profiling.StageProfiler，未指定時不做任何額外工作。
+    counters 記錄各階段的事件次數（例如快取命中與未命中）。
+    """
+
+    def __init__(self, profiler=None):
+        self.timings: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.profiler = profiler
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # 各階段目前正在計時的執行緒數，以及開始有執行緒計時的時間
+        self._active: Dict[str, int] = {}
+        self._since: Dict[str, float] = {}
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def add(self, name: str, seconds: float):
+        """直接累加某階段的耗時"""
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def _resume(self, name: str, now: float):
+        # 呼叫端須持有 _lock
+        active = self._active.get(name, 0)
+        if active == 0:
+            self._since[name] = now
+        self._active[name] = active + 1
+
+    def _pause(self, name: str, now: float):
+        # 呼叫端須持有 _lock；最後一個執行緒離開時才累加這段牆鐘時間
+        active = self._active[name] - 1
+        self._active[name] = active
+        if active == 0:
+            self.timings[name] = self.timings.get(name, 0.0) + now - self._since.pop(name)
+
+    def count(self, name: str, n: int = 1):
+        """累加事件次數"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def stage(self, name: str):
+        """計時一個階段"""
+        stack = self._stack()
+        if self.profiler is not None:
+            self.profiler.enter(name)
+        # 只有最內層的階段在計時：進入內層時暫停外層，離開後再恢復
+        now = time.perf_counter()
+        with self._lock:
+            if stack:
+                self._pause(stack[-1], now)
+            self._resume(name, now)
+        stack.append(name)
+        try:
+            yield
+        finally:
+            stack.pop()
+            now = time.perf_counter()
+            with self._lock:
+                self._pause(name, now)
+                if stack:
+                    self._resume(stack[-1], now)
+            if self.profiler is not None:
+                self.profiler.exit(name)
+
+    def page(self, page_num: int):
+        """標記單一頁面的處理範圍（僅在效能分析時記錄）"""
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.page(page_num)
+
+    def as_dict(self) -> Dict[str, float]:
+        """回傳四捨五入後的各階段耗時（秒）"""
+        with self._lock:
+            return {name: round(seconds, 4) for name, seconds in self.timings.items()}
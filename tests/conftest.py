@@ -0,0 +1,43 @@
+"""
+測試共用設定 - 讓測試可以直接匯入專案根目錄的模組
+Test configuration - Make the top-level modules importable from the tests
+"""
+
+import importlib
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from log_config import LOG_FILE_ENV  # noqa: E402
+
+# 測試不寫入各工具的預設日誌檔
+os.environ.setdefault(LOG_FILE_ENV, "-")
+
+
+@pytest.fixture(scope="session")
+def print_module():
+    """print.py 的模組名稱與內建函式相同，以 importlib 匯入"""
+    return importlib.import_module("print")
+
+
+@pytest.fixture
+def solid_pages_pdf(tmp_path):
+    """產生每頁為單一顏色的 PDF，回傳建立函式 (colors) -> 路徑"""
+    import fitz
+
+    def build(colors, size=200):
+        path = tmp_path / "solid.pdf"
+        doc = fitz.open()
+        for color in colors:
+            page = doc.new_page(width=size, height=size)
+            page.draw_rect(page.rect, color=color, fill=color)
+        doc.save(str(path))
+        doc.close()
+        return str(path)
+
+    return build
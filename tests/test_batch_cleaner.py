@@ -0,0 +1,57 @@
+"""
+批次清洗測試
+Batch cleaning tests
+"""
+
+import json
+import os
+import shutil
+import signal
+
+import batch_cleaner
+from batch_cleaner import WORKER_CRASH_MESSAGE, run_batch
+
+_clean_one = batch_cleaner.clean_one
+
+
+def _crashing_clean_one(input_path, output_path, *args, **kwargs):
+    # 模擬 MuPDF 處理惡意文件時 segfault
+    if "crash" in os.path.basename(input_path):
+        os.kill(os.getpid(), signal.SIGKILL)
+    return _clean_one(input_path, output_path, *args, **kwargs)
+
+
+def test_run_batch_survives_worker_crash(monkeypatch, solid_pages_pdf, tmp_path):
+    source = solid_pages_pdf([(0, 0, 1)])
+    names = ["a.pdf", "b.pdf", "crash.pdf", "c.pdf", "d.pdf", "e.pdf"]
+    inputs = []
+    for name in names:
+        path = tmp_path / name
+        shutil.copy(source, path)
+        inputs.append((str(path), name))
+    monkeypatch.setattr(batch_cleaner, "clean_one", _crashing_clean_one)
+
+    records = []
+
+    class _Results:
+        def write(self, line):
+            records.append(json.loads(line))
+
+        def flush(self):
+            pass
+
+    summary = run_batch(
+        inputs,
+        str(tmp_path / "out"),
+        workers=2,
+        results_file=_Results(),
+        memory_budget=0,
+        shard_min_pages=0,
+    )
+
+    assert summary["succeeded"] == len(names) - 1
+    assert summary["failed"] == 1
+    assert len(records) == len(names)
+    failed = [record for record in records if not record["success"]]
+    assert [os.path.basename(record["input"]) for record in failed] == ["crash.pdf"]
+    assert failed[0]["message"] == WORKER_CRASH_MESSAGE
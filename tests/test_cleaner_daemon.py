@@ -0,0 +1,88 @@
+"""
+清洗常駐服務HTTP處理器測試
+Cleaning daemon HTTP handler tests
+"""
+
+import http.client
+import json
+import logging
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from cleaner_daemon import _DaemonRequestHandler
+
+
+class _RecordingDaemon:
+    """只記錄收到的請求，不啟動工作行程"""
+
+    def __init__(self):
+        self.jobs = []
+        self.logger = logging.getLogger(__name__)
+
+    def submit(self, job):
+        self.jobs.append(job)
+        return 200, {"success": True}
+
+    def status(self):
+        return {"success": True}
+
+
+@pytest.fixture
+def daemon_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _DaemonRequestHandler)
+    server.daemon_threads = True
+    server.local_port = server.server_address[1]
+    server.cleaner_daemon = _RecordingDaemon()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _post(server, headers, body=b'{"input": "/tmp/a.pdf", "output": "/etc/passwd"}'):
+    conn = http.client.HTTPConnection("127.0.0.1", server.local_port, timeout=5)
+    try:
+        conn.putrequest("POST", "/clean", skip_host=True)
+        for key, value in headers.items():
+            conn.putheader(key, value)
+        conn.putheader("Content-Length", str(len(body)))
+        conn.endheaders(body)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def test_accepts_local_json_request(daemon_server):
+    port = daemon_server.local_port
+    for host in (f"127.0.0.1:{port}", f"localhost:{port}", "localhost"):
+        status, _ = _post(daemon_server, {"Host": host, "Content-Type": "application/json"})
+        assert status == 200
+    assert len(daemon_server.cleaner_daemon.jobs) == 3
+
+
+@pytest.mark.parametrize("content_type", [None, "text/plain", "application/x-www-form-urlencoded"])
+def test_rejects_non_json_content_type(daemon_server, content_type):
+    headers = {"Host": f"127.0.0.1:{daemon_server.local_port}"}
+    if content_type:
+        headers["Content-Type"] = content_type
+
+    status, _ = _post(daemon_server, headers)
+
+    assert status == 415
+    assert daemon_server.cleaner_daemon.jobs == []
+
+
+@pytest.mark.parametrize("host", [None, "evil.example:{port}", "127.0.0.1:1", "localhost.evil.example"])
+def test_rejects_foreign_host(daemon_server, host):
+    headers = {"Content-Type": "application/json"}
+    if host:
+        headers["Host"] = host.format(port=daemon_server.local_port)
+
+    status, _ = _post(daemon_server, headers)
+
+    assert status == 403
+    assert daemon_server.cleaner_daemon.jobs == []
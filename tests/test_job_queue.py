@@ -0,0 +1,51 @@
+"""
+工作佇列測試
+Job queue tests
+"""
+
+import json
+
+import job_queue
+from job_queue import FAILED, QUEUED, JobQueue, run_worker
+
+
+def _transient_clean_one(input_path, output_path, mode, options):
+    return {
+        "success": False,
+        "transient": True,
+        "message": "磁碟暫時無法讀取",
+        "timings": {"open": 0.01},
+    }
+
+
+def test_final_transient_failure_keeps_result(monkeypatch, tmp_path):
+    db_path = str(tmp_path / "jobs.db")
+    queue = JobQueue(db_path)
+    queue.enqueue(str(tmp_path / "in.pdf"), str(tmp_path / "out.pdf"), max_attempts=1)
+    monkeypatch.setattr(job_queue, "clean_one", _transient_clean_one)
+
+    assert run_worker(db_path) == 1
+
+    (job,) = queue.jobs()
+    assert job["state"] == FAILED
+    assert job["last_error"] == "磁碟暫時無法讀取"
+    result = json.loads(job["result"])
+    assert result["message"] == "磁碟暫時無法讀取"
+    assert result["timings"] == {"open": 0.01}
+
+
+def test_fail_without_result_keeps_previous_result(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_id = queue.enqueue(str(tmp_path / "in.pdf"), str(tmp_path / "out.pdf"), max_attempts=3)
+
+    queue.claim("worker")
+    assert queue.fail(job_id, "worker", "暫時失敗", {"success": False, "message": "暫時失敗"})
+    (job,) = queue.jobs()
+    assert job["state"] == QUEUED
+
+    queue._connect().execute("UPDATE jobs SET available_at = 0")
+    queue.claim("worker")
+    assert queue.fail(job_id, "worker", "工作行程錯誤: boom")
+    (job,) = queue.jobs()
+    assert job["last_error"] == "工作行程錯誤: boom"
+    assert json.loads(job["result"])["message"] == "暫時失敗"
@@ -0,0 +1,121 @@
+"""
+索引色輸出測試
+Indexed-colour output tests
+"""
+
+import zlib
+
+import fitz
+import numpy as np
+import pytest
+
+
+def _rgb(pixels):
+    return np.ascontiguousarray(pixels, dtype=np.uint8)
+
+
+def _decode(palette: bytes, indices) -> np.ndarray:
+    return np.frombuffer(palette, dtype=np.uint8).reshape(-1, 3)[indices]
+
+
+def test_index_colors_roundtrip(print_module):
+    rng = np.random.default_rng(0)
+    colors = rng.integers(0, 256, size=(5, 3), dtype=np.uint8)
+    pixels = colors[rng.integers(0, 5, size=(10, 7))]
+
+    palette, indices = print_module.index_colors(_rgb(pixels).tobytes(), 7, 10)
+
+    assert len(palette) // 3 == 5
+    assert indices.shape == (10, 7)
+    assert np.array_equal(_decode(palette, indices), pixels)
+
+
+def test_index_colors_adds_colors_missing_from_earlier_bands(print_module):
+    # 第一段只有白色；之後的段落出現雜湊表中沒有的顏色，須走補建雜湊表的路徑
+    rows = print_module.PALETTE_BAND_ROWS * 2 + 3
+    pixels = np.full((rows, 5, 3), 255, dtype=np.uint8)
+    pixels[print_module.PALETTE_BAND_ROWS + 1, 2] = (255, 0, 0)
+    pixels[-1, :] = (0, 0, 255)
+
+    palette, indices = print_module.index_colors(_rgb(pixels).tobytes(), 5, rows)
+
+    assert len(palette) // 3 == 3
+    assert np.array_equal(_decode(palette, indices), pixels)
+
+
+def test_index_colors_gives_up_above_palette_limit(print_module):
+    count = print_module.PALETTE_MAX_COLORS + 1
+    pixels = np.zeros((1, count, 3), dtype=np.uint8)
+    pixels[0, :, 0] = np.arange(count) % 256
+    pixels[0, :, 1] = np.arange(count) // 256
+
+    assert print_module.index_colors(_rgb(pixels).tobytes(), count, 1) is None
+
+
+def test_color_table_miss(print_module):
+    colors = np.array([0x000000, 0xFF0000, 0x00FF00], dtype=np.uint32)
+    table = print_module._ColorTable.build(colors)
+
+    known = table.slots(colors)
+    assert np.array_equal(table.keys.take(known), colors)
+    assert list(table.values.take(known)) == [0, 1, 2]
+
+    missing = np.array([0x0000FF, 0x123456], dtype=np.uint32)
+    assert not (table.keys.take(table.slots(missing)) == missing).any()
+
+
+@pytest.mark.parametrize("bits", [1, 2, 4])
+@pytest.mark.parametrize("width", [1, 3, 5, 8, 9])
+def test_pack_indices_pads_each_row(print_module, bits, width):
+    rng = np.random.default_rng(bits * 100 + width)
+    indices = rng.integers(0, 1 << bits, size=(3, width), dtype=np.uint8)
+
+    packed = print_module.pack_indices(indices, bits)
+
+    row_bytes = -(-width * bits // 8)
+    assert len(packed) == 3 * row_bytes
+    unpacked = np.unpackbits(np.frombuffer(packed, dtype=np.uint8).reshape(3, row_bytes), axis=1)
+    values = unpacked.reshape(3, -1, bits) @ (1 << np.arange(bits - 1, -1, -1))
+    assert np.array_equal(values[:, :width], indices)
+    assert not values[:, width:].any()
+
+
+def test_pack_indices_8_bit(print_module):
+    indices = np.arange(12, dtype=np.uint8).reshape(3, 4)
+    assert print_module.pack_indices(indices, 8) == indices.tobytes()
+
+
+def test_encode_raster_uniform_pages_differ_by_palette(print_module):
+    from raster_xobject import image_key
+
+    blue = np.zeros((4, 4, 3), dtype=np.uint8)
+    blue[..., 2] = 255
+    red = np.zeros((4, 4, 3), dtype=np.uint8)
+    red[..., 0] = 255
+
+    blue_image = print_module.encode_raster(blue.tobytes(), 4, 4)
+    red_image = print_module.encode_raster(red.tobytes(), 4, 4)
+
+    assert blue_image.bits_per_component == red_image.bits_per_component == 1
+    assert zlib.decompress(blue_image.data) == zlib.decompress(red_image.data)
+    assert (blue_image.palette, red_image.palette) == (b"\x00\x00\xff", b"\xff\x00\x00")
+    assert image_key(blue_image) != image_key(red_image)
+
+
+def test_print_clean_same_layout_pages_keep_palettes(print_module, tmp_path):
+    # 版面相同、顏色不同的兩頁：索引串流相同，只有調色盤不同
+    source = str(tmp_path / "layout.pdf")
+    doc = fitz.open()
+    for color in ((0, 1, 0), (1, 0, 1)):
+        page = doc.new_page(width=200, height=200)
+        page.draw_rect(fitz.Rect(50, 50, 150, 150), color=color, fill=color)
+    doc.save(source)
+    doc.close()
+    output = str(tmp_path / "out.pdf")
+
+    result = print_module.PDFPrintCleaner().print_clean_pdf(source, output, dpi=72)
+    assert result["success"], result
+
+    with fitz.open(output) as cleaned:
+        centers = [page.get_pixmap().pixel(100, 100) for page in cleaned]
+    assert centers == [(0, 255, 0), (255, 0, 255)]
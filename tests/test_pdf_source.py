@@ -0,0 +1,40 @@
+"""
+PDF輸入來源工具測試
+PDF source helper tests
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+import pytest
+
+from pdf_source import MAX_DPI, MIN_DPI, dpi_arg
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("value", [str(MIN_DPI), "300", str(MAX_DPI)])
+def test_dpi_arg_accepts_range(value):
+    assert dpi_arg(value) == int(value)
+
+
+@pytest.mark.parametrize("value", ["-5", "0", str(MIN_DPI - 1), str(MAX_DPI + 1), "300.5", "abc"])
+def test_dpi_arg_rejects_invalid(value):
+    with pytest.raises(argparse.ArgumentTypeError):
+        dpi_arg(value)
+
+
+@pytest.mark.parametrize("script", ["print.py", "batch_cleaner.py", "watch_folder.py"])
+def test_cli_rejects_out_of_range_output_dpi(script, tmp_path):
+    args = [sys.executable, os.path.join(REPO_ROOT, script)]
+    if script == "print.py":
+        args += ["in.pdf", "out.pdf"]
+    else:
+        args += [str(tmp_path), "-o", str(tmp_path / "out")]
+    proc = subprocess.run(
+        args + ["--output-dpi", "-5"], capture_output=True, text=True, cwd=tmp_path
+    )
+    assert proc.returncode == 2
+    assert "--output-dpi" in proc.stderr
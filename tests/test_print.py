@@ -0,0 +1,31 @@
+"""
+列印重建測試
+Print-mode rebuild tests
+"""
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "dpi, output_dpi, expected",
+    [
+        (300, None, (300, 1)),
+        (300, 300, (300, 1)),
+        (600, 300, (600, 2)),
+        (300, 200, (200, 1)),
+        (600, 250, (500, 2)),
+        (1200, 700, (700, 1)),
+        (300, 72, (288, 4)),
+    ],
+)
+def test_render_resolution(print_module, dpi, output_dpi, expected):
+    assert print_module.render_resolution(dpi, output_dpi) == expected
+
+
+@pytest.mark.parametrize("dpi", range(72, 1201, 37))
+@pytest.mark.parametrize("output_dpi", [72, 100, 150, 200, 300, 450, 600])
+def test_render_resolution_never_exceeds_requested_dpi(print_module, dpi, output_dpi):
+    render_dpi, factor = print_module.render_resolution(dpi, output_dpi)
+    assert render_dpi <= min(dpi, print_module.MAX_RENDER_DPI)
+    if output_dpi < dpi:
+        assert render_dpi == output_dpi * factor
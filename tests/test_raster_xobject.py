@@ -0,0 +1,49 @@
+"""
+點陣影像物件測試
+Raster XObject tests
+"""
+
+import fitz
+
+from raster_xobject import EncodedImage, image_key
+
+
+def _image(**overrides):
+    fields = dict(data=b"\x00" * 16, width=4, height=4, color_space="DeviceGray")
+    fields.update(overrides)
+    return EncodedImage(**fields)
+
+
+def test_image_key_same_fields_share_key():
+    assert image_key(_image()) == image_key(_image())
+
+
+def test_image_key_covers_image_dictionary():
+    base = image_key(_image())
+    variants = [
+        _image(width=8, height=2),
+        _image(color_space="DeviceRGB"),
+        _image(bits_per_component=1),
+        _image(filters=("FlateDecode", "DCTDecode")),
+        _image(decode_parms={"Predictor": 15}),
+        _image(palette=b"\x00\x00\xff"),
+    ]
+    keys = {image_key(image) for image in variants}
+    assert base not in keys
+    assert len(keys) == len(variants)
+    assert image_key(_image(palette=b"\x00\x00\xff")) != image_key(_image(palette=b"\xff\x00\x00"))
+
+
+def test_print_clean_keeps_page_colors(print_module, solid_pages_pdf, tmp_path):
+    # 同尺寸的單色頁面點陣樣本相同，只有調色盤不同
+    source = solid_pages_pdf([(0, 0, 1), (1, 0, 0)])
+    output = str(tmp_path / "out.pdf")
+
+    result = print_module.PDFPrintCleaner().print_clean_pdf(source, output, dpi=72)
+    assert result["success"], result
+
+    with fitz.open(output) as doc:
+        xrefs = [page.get_images()[0][0] for page in doc]
+        colors = [page.get_pixmap().pixel(100, 100) for page in doc]
+    assert xrefs[0] != xrefs[1]
+    assert colors == [(0, 0, 255), (255, 0, 0)]
@@ -0,0 +1,43 @@
+"""
+掃描索引測試
+Scan index tests
+"""
+
+import os
+import shutil
+import signal
+
+import scan_index
+from batch_cleaner import WORKER_CRASH_MESSAGE, scan_one
+from scan_index import ScanIndex, scan_tree
+
+
+def _crashing_scan_one(input_path):
+    # 模擬 MuPDF 解析惡意文件時 segfault
+    if "crash" in os.path.basename(input_path):
+        os.kill(os.getpid(), signal.SIGKILL)
+    return scan_one(input_path)
+
+
+def test_scan_tree_survives_worker_crash(monkeypatch, solid_pages_pdf, tmp_path):
+    source = solid_pages_pdf([(0, 0, 1)])
+    names = ["a.pdf", "b.pdf", "crash.pdf", "c.pdf", "d.pdf", "e.pdf", "f.pdf"]
+    inputs = []
+    for name in names:
+        shutil.copy(source, tmp_path / name)
+        inputs.append(str(tmp_path / name))
+    monkeypatch.setattr(scan_index, "scan_one", _crashing_scan_one)
+
+    index = ScanIndex(str(tmp_path / "index.db"))
+    try:
+        summary = scan_tree(index, inputs, workers=2)
+        invalid = index.query("invalid")
+        clean = index.query("clean")
+    finally:
+        index.close()
+
+    assert summary["scanned"] == len(names)
+    assert summary["invalid"] == 1
+    assert [os.path.basename(row["path"]) for row in invalid] == ["crash.pdf"]
+    assert invalid[0]["message"] == WORKER_CRASH_MESSAGE
+    assert len(clean) == len(names) - 1
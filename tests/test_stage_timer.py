@@ -0,0 +1,40 @@
+"""
+階段計時測試
+Stage timing tests
+"""
+
+import threading
+import time
+
+from stage_timer import StageTimer
+
+
+def test_nested_stage_excludes_inner_time():
+    timer = StageTimer()
+    with timer.stage("write"):
+        time.sleep(0.05)
+        with timer.stage("encode"):
+            time.sleep(0.1)
+
+    assert 0.1 <= timer.timings["encode"] < 0.14
+    assert 0.05 <= timer.timings["write"] < 0.09
+
+
+def test_concurrent_threads_count_wall_clock_once():
+    timer = StageTimer()
+    barrier = threading.Barrier(3)
+
+    def encode():
+        barrier.wait()
+        with timer.stage("encode"):
+            time.sleep(0.2)
+
+    threads = [threading.Thread(target=encode) for _ in range(3)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    assert 0.2 <= timer.timings["encode"] <= wall
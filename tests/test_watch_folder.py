@@ -0,0 +1,51 @@
+"""
+收件夾監看測試
+Watch-folder tests
+"""
+
+import io
+import json
+import os
+import shutil
+import signal
+
+import watch_folder
+from batch_cleaner import WORKER_CRASH_MESSAGE, clean_one
+from watch_folder import FolderWatcher
+
+
+def _crashing_clean_one(input_path, output_path, *args, **kwargs):
+    # 模擬 MuPDF 處理惡意文件時 segfault
+    if "crash" in os.path.basename(input_path):
+        os.kill(os.getpid(), signal.SIGKILL)
+    return clean_one(input_path, output_path, *args, **kwargs)
+
+
+def test_watcher_survives_worker_crash(monkeypatch, solid_pages_pdf, tmp_path):
+    source = solid_pages_pdf([(0, 0, 1)])
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    names = ["a.pdf", "crash.pdf", "b.pdf", "c.pdf", "d.pdf"]
+    for name in names:
+        shutil.copy(source, inbox / name)
+    monkeypatch.setattr(watch_folder, "clean_one", _crashing_clean_one)
+
+    results = io.StringIO()
+    watcher = FolderWatcher(
+        str(inbox),
+        str(tmp_path / "out"),
+        workers=2,
+        settle_seconds=0,
+        poll_interval=0.05,
+        results_file=results,
+        use_inotify=False,
+    )
+    summary = watcher.run(once=True)
+
+    assert summary == {"succeeded": len(names) - 1, "failed": 1}
+    cleaned = sorted(os.listdir(tmp_path / "out"))
+    assert cleaned == sorted(name for name in names if name != "crash.pdf")
+    failed = [json.loads(line) for line in results.getvalue().splitlines()]
+    failed = [record for record in failed if not record["success"]]
+    assert [os.path.basename(record["input"]) for record in failed] == ["crash.pdf"]
+    assert failed[0]["message"] == WORKER_CRASH_MESSAGE
@@ -0,0 +1,240 @@
+"""
+視覺驗證 - 以低解析度渲染原始與清潔文件，逐頁比較外觀是否一致
+Visual Verification - Render the original and cleaned documents at low DPI and
+compare them page by page
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional
+
+from pdf_source import open_pdf_document
+
+# 驗證渲染解析度：足以看出版面與內容的差異，渲染成本約為 150 DPI 的 1/9
+VERIFY_DPI = 50
+
+# 相似度低於此值的頁面標記為差異過大：外觀相同的列印重建約 0.93 以上（雜訊照片最低），
+# 版面重排的內容提取約 0.4
+VERIFY_THRESHOLD = 0.8
+
+# 每個工作一次比較的頁數；同時送出的工作數為行程數的倍數，記憶體用量與文件頁數無關
+VERIFY_CHUNK_PAGES = 8
+VERIFY_TASKS_PER_WORKER = 2
+
+# 結構相似度的區塊大小與穩定常數（8 位元灰階）
+SSIM_BLOCK = 8
+_SSIM_C1 = (0.01 * 255) ** 2
+_SSIM_C2 = (0.03 * 255) ** 2
+
+# 工作行程開啟的兩份文件
+_worker_documents = None
+
+
+def _gray_pixels(page, dpi: int):
+    """將頁面渲染為 8 位元灰階陣列"""
+    import fitz  # PyMuPDF
+    import numpy as np
+
+    scale = dpi / 72
+    pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), colorspace=fitz.csGRAY, alpha=False)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+
+
+def _box_blur(pixels):
+    """3×3 平均濾波（邊緣延伸）"""
+    import numpy as np
+
+    height, width = pixels.shape
+    padded = np.pad(pixels, 1, mode="edge")
+    blurred = np.zeros_like(pixels)
+    for dy in range(3):
+        for dx in range(3):
+            blurred += padded[dy : dy + height, dx : dx + width]
+    return blurred / 9
+
+
+def page_similarity(original, cleaned) -> Dict[str, float]:
+    """
+    比較兩頁灰階點陣，回傳平均絕對差 (0-255) 與結構相似度 (SSIM, 0-1)
+
+    結構相似度在 3×3 平均濾波後以 SSIM_BLOCK × SSIM_BLOCK 的區塊計算平均、變異數與
+    共變異數後取平均；濾波消除重新取樣造成的像素級差異（清潔輸出是點陣，原始文件是
+    向量），只保留版面與內容的差異。尺寸因捨入不同時只比較重疊的部分。
+    """
+    import numpy as np
+
+    height = min(original.shape[0], cleaned.shape[0])
+    width = min(original.shape[1], cleaned.shape[1])
+    x = original[:height, :width].astype(np.float32)
+    y = cleaned[:height, :width].astype(np.float32)
+    difference = float(np.abs(x - y).mean()) if x.size else 0.0
+    if x.size:
+        x, y = _box_blur(x), _box_blur(y)
+
+    rows, cols = height // SSIM_BLOCK, width // SSIM_BLOCK
+    if not rows or not cols:
+        return {"difference": difference, "similarity": 1 - difference / 255}
+
+    shape = (rows, SSIM_BLOCK, cols, SSIM_BLOCK)
+    x = x[: rows * SSIM_BLOCK, : cols * SSIM_BLOCK].reshape(shape)
+    y = y[: rows * SSIM_BLOCK, : cols * SSIM_BLOCK].reshape(shape)
+    mean_x = x.mean(axis=(1, 3))
+    mean_y = y.mean(axis=(1, 3))
+    var_x = (x * x).mean(axis=(1, 3)) - mean_x * mean_x
+    var_y = (y * y).mean(axis=(1, 3)) - mean_y * mean_y
+    covariance = (x * y).mean(axis=(1, 3)) - mean_x * mean_y
+    ssim = ((2 * mean_x * mean_y + _SSIM_C1) * (2 * covariance + _SSIM_C2)) / (
+        (mean_x * mean_x + mean_y * mean_y + _SSIM_C1) * (var_x + var_y + _SSIM_C2)
+    )
+    return {"difference": difference, "similarity": float(ssim.mean())}
+
+
+def _init_worker(original, cleaned):
+    """工作行程初始化 - 每個行程只開啟一次兩份文件"""
+    global _worker_documents
+    _worker_documents = (open_pdf_document(original), open_pdf_document(cleaned))
+
+
+def _compare_chunk(first: int, last: int, offset: int, dpi: int, documents=None) -> List[Dict]:
+    """比較清潔文件的第 [first, last) 頁與原始文件對應的頁面（原始頁碼 = 清潔頁碼 + offset）"""
+    original, cleaned = documents or _worker_documents
+    scores = []
+    for page_num in range(first, last):
+        score = page_similarity(
+            _gray_pixels(original[page_num + offset], dpi), _gray_pixels(cleaned[page_num], dpi)
+        )
+        score["page"] = page_num + offset + 1
+        scores.append(score)
+    return scores
+
+
+def _default_workers(chunks: int) -> int:
+    # 已在工作行程中（批次處理）時不再開啟行程池，避免行程數超過CPU核心數
+    if multiprocessing.parent_process() is not None:
+        return 1
+    return max(1, min(os.cpu_count() or 1, chunks))
+
+
+def verify_pdf(
+    original,
+    cleaned,
+    pages: Optional[range] = None,
+    dpi: int = VERIFY_DPI,
+    threshold: float = VERIFY_THRESHOLD,
+    workers: Optional[int] = None,
+) -> Dict:
+    """
+    逐頁比較原始與清潔文件的外觀，回傳驗證報告
+
+    original 與 cleaned 可為檔案路徑或PDF位元組。pages 為清潔文件對應的原始
+    頁面範圍（分片輸出），未指定時比較整份文件。頁面分批交給行程池渲染，
+    行程只回傳每頁的分數；相似度低於 threshold 的頁面列於 flagged。
+    頁數不一致（例如移除了空白頁）時無法逐頁對應，不做比較。
+    """
+    start = time.perf_counter()
+    report = {
+        "dpi": dpi,
+        "threshold": threshold,
+        "pages_compared": 0,
+        "flagged": [],
+    }
+
+    documents = (open_pdf_document(original), open_pdf_document(cleaned))
+    try:
+        page_count = documents[1].page_count
+        expected = len(pages) if pages is not None else documents[0].page_count
+        if page_count != expected:
+            report["message"] = f"頁數不同（原始 {expected} 頁，清潔 {page_count} 頁），未比較"
+            report["seconds"] = round(time.perf_counter() - start, 4)
+            return report
+
+        offset = pages.start if pages is not None else 0
+        chunks = [
+            (first, min(first + VERIFY_CHUNK_PAGES, page_count))
+            for first in range(0, page_count, VERIFY_CHUNK_PAGES)
+        ]
+        workers = workers or _default_workers(len(chunks))
+
+        scores: List[Dict] = []
+        if workers == 1:
+            for first, last in chunks:
+                scores.extend(_compare_chunk(first, last, offset, dpi, documents))
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=(original, cleaned)
+            ) as executor:
+                pending = set()
+                for first, last in chunks:
+                    if len(pending) >= workers * VERIFY_TASKS_PER_WORKER:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            scores.extend(future.result())
+                    pending.add(executor.submit(_compare_chunk, first, last, offset, dpi))
+                for future in pending:
+                    scores.extend(future.result())
+    finally:
+        for doc in documents:
+            doc.close()
+
+    _summarize(report, scores, threshold)
+    report["seconds"] = round(time.perf_counter() - start, 4)
+    return report
+
+
+def _summarize(report: Dict, scores: List[Dict], threshold: float):
+    report["pages_compared"] = len(scores)
+    if not scores:
+        return
+    similarities = [score["similarity"] for score in scores]
+    report["min_similarity"] = round(min(similarities), 4)
+    report["mean_similarity"] = round(sum(similarities) / len(similarities), 4)
+    report["max_difference"] = round(max(score["difference"] for score in scores), 2)
+    report["flagged"] = sorted(
+        (
+            {
+                "page": score["page"],
+                "similarity": round(score["similarity"], 4),
+                "difference": round(score["difference"], 2),
+            }
+            for score in scores
+            if score["similarity"] < threshold
+        ),
+        key=lambda item: item["page"],
+    )
+
+
+def combine_verifications(reports: List[Dict]) -> Dict:
+    """合併各分片的驗證報告"""
+    combined = {
+        "dpi": reports[0]["dpi"],
+        "threshold": reports[0]["threshold"],
+        "pages_compared": sum(r["pages_compared"] for r in reports),
+        "flagged": sorted(
+            (item for r in reports for item in r["flagged"]), key=lambda item: item["page"]
+        ),
+        "seconds": round(sum(r.get("seconds", 0.0) for r in reports), 4),
+    }
+    compared = [r for r in reports if r["pages_compared"]]
+    if compared:
+        combined["min_similarity"] = min(r["min_similarity"] for r in compared)
+        combined["mean_similarity"] = round(
+            sum(r["mean_similarity"] * r["pages_compared"] for r in compared)
+            / combined["pages_compared"],
+            4,
+        )
+        combined["max_difference"] = max(r["max_difference"] for r in compared)
+    messages = [r["message"] for r in reports if "message" in r]
+    if messages:
+        combined["message"] = messages[0]
+    return combined
+
+
+def describe_verification(report: Dict) -> str:
+    """產生附加在結果訊息後的驗證摘要"""
+    if "message" in report:
+        return f"（視覺驗證: {report['message']}）"
+    if report["flagged"]:
+        return f"（視覺驗證: {len(report['flagged'])} 頁差異過大）"
+    return f"（視覺驗證通過，最低相似度 {report.get('min_similarity', 1.0):.2f}）"
@@ -0,0 +1,559 @@
+#!/usr/bin/env python3
+"""
+PDF收件夾監看工具 - 偵測新進或變更的PDF並立即清洗
+PDF Watch Folder - Detect new or changed PDFs in an inbox and clean them right away
+"""
+
+import argparse
+import ctypes
+import json
+import logging
+import os
+import select
+import shutil
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from batch_cleaner import (
+    BLANK_PAGE_MODES,
+    COLORSPACES,
+    MODES,
+    PALETTE_MODES,
+    WORKER_CRASH_MESSAGE,
+    _init_worker,
+    clean_one,
+    default_worker_count,
+)
+from log_config import configure_logging
+from metrics import DEFAULT_METRICS_PORT, CleanerMetrics, start_metrics_server
+from pdf_source import dpi_arg
+
+# 掃描間隔與檔案大小、修改時間維持不變多久才視為寫入完成（秒）
+DEFAULT_POLL_INTERVAL = 0.2
+DEFAULT_SETTLE_SECONDS = 0.5
+
+# 下載或複製中的暫存檔副檔名
+_TEMP_SUFFIXES = (".part", ".partial", ".tmp", ".crdownload", ".download")
+
+
+class _Waker:
+    """
+    等待下一次掃描：檔案系統事件 (Linux inotify) 或工作完成時提前喚醒，
+    否則在輪詢間隔後醒來。無法使用 inotify 時只以輪詢偵測。
+    """
+
+    # inotify 事件：寫入後關閉、移入、建立（新目錄）
+    _IN_CLOSE_WRITE = 0x00000008
+    _IN_MOVED_TO = 0x00000080
+    _IN_CREATE = 0x00000100
+
+    def __init__(self, use_inotify: bool = True):
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+        os.set_blocking(self._write_fd, False)
+        self._libc = None
+        self._inotify_fd = None
+        self._watched = set()
+
+        if use_inotify and sys.platform.startswith("linux"):
+            try:
+                libc = ctypes.CDLL(None, use_errno=True)
+                fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+                if fd >= 0:
+                    self._libc = libc
+                    self._inotify_fd = fd
+            except (OSError, AttributeError):
+                pass
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self._inotify_fd is not None
+
+    def watch(self, directory: str):
+        """加入要監看的目錄（重複加入會被忽略）"""
+        if self._inotify_fd is None or directory in self._watched:
+            return
+        mask = self._IN_CLOSE_WRITE | self._IN_MOVED_TO | self._IN_CREATE
+        if self._libc.inotify_add_watch(self._inotify_fd, os.fsencode(directory), mask) >= 0:
+            self._watched.add(directory)
+
+    def wake(self):
+        """從其他執行緒喚醒等待中的掃描迴圈"""
+        try:
+            os.write(self._write_fd, b"\0")
+        except BlockingIOError:
+            pass
+
+    def wait(self, timeout: float):
+        fds = [self._read_fd]
+        if self._inotify_fd is not None:
+            fds.append(self._inotify_fd)
+        try:
+            readable, _, _ = select.select(fds, [], [], timeout)
+        except InterruptedError:
+            return
+        for fd in readable:
+            try:
+                while os.read(fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        for fd in (self._read_fd, self._write_fd, self._inotify_fd):
+            if fd is not None:
+                os.close(fd)
+
+
+class FolderWatcher:
+    """監看收件夾，將寫入完成的PDF送入有限的工作行程池清洗，並以原子方式移到輸出目錄"""
+
+    def __init__(
+        self,
+        inbox: str,
+        output_dir: str,
+        mode: str = "extract",
+        workers: Optional[int] = None,
+        options: Optional[Dict] = None,
+        settle_seconds: float = DEFAULT_SETTLE_SECONDS,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        archive_dir: Optional[str] = None,
+        results_file=None,
+        use_inotify: bool = True,
+        metrics: Optional[CleanerMetrics] = None,
+    ):
+        self.inbox = os.path.abspath(inbox)
+        self.output_dir = os.path.abspath(output_dir)
+        self.archive_dir = os.path.abspath(archive_dir) if archive_dir else None
+        self.mode = mode
+        self.options = options or {}
+        self.workers = workers or default_worker_count(mode, self.options.get("dpi", 300))
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.results_file = results_file
+        self.metrics = metrics
+        self.logger = logging.getLogger(__name__)
+
+        self._waker = _Waker(use_inotify)
+        self._stop = threading.Event()
+        # 路徑 -> (簽章, 簽章首次出現的時間, 首次偵測時間)
+        self._candidates: Dict[str, Tuple[Tuple[int, int], float, float]] = {}
+        # 路徑 -> 已處理的簽章
+        self._processed: Dict[str, Tuple[int, int]] = {}
+        # 執行中的工作 -> (路徑, 簽章, 首次偵測時間, 輸出路徑, 暫存路徑)
+        self._pending: Dict = {}
+        self._in_flight = set()
+        # 工作行程當機時執行中的檔案：各自單獨重試一次，仍然當機才記為失敗
+        self._isolated = set()
+        self._broken = False
+        self.summary = {"succeeded": 0, "failed": 0}
+        if metrics is not None:
+            metrics.add_gauge("clean_pdf_in_progress", "執行中的清洗工作數", lambda: len(self._in_flight))
+
+    def stop(self):
+        """要求停止監看（等待執行中的工作完成）"""
+        self._stop.set()
+        self._waker.wake()
+
+    def _excluded(self, path: str) -> bool:
+        # 輸出與封存目錄位於收件夾內時不可再被當作輸入
+        for directory in (self.output_dir, self.archive_dir):
+            if directory and (path == directory or path.startswith(directory + os.sep)):
+                return True
+        return False
+
+    def _output_path(self, path: str) -> str:
+        return os.path.join(self.output_dir, os.path.relpath(path, self.inbox))
+
+    def _already_cleaned(self, path: str, stat: os.stat_result) -> bool:
+        # 重新啟動時，輸出比輸入新的檔案視為已處理
+        try:
+            return os.stat(self._output_path(path)).st_mtime_ns >= stat.st_mtime_ns
+        except OSError:
+            return False
+
+    def scan(self, first_scan: bool = False) -> List[Tuple[str, Tuple[int, int], float]]:
+        """掃描收件夾，回傳已寫入完成、需要清洗的檔案"""
+        now = time.monotonic()
+        seen = set()
+        ready = []
+
+        for root, dirs, files in os.walk(self.inbox):
+            dirs[:] = [
+                d
+                for d in dirs
+                if not d.startswith(".") and not self._excluded(os.path.join(root, d))
+            ]
+            self._waker.watch(root)
+
+            for name in files:
+                lower = name.lower()
+                if name.startswith(".") or lower.endswith(_TEMP_SUFFIXES) or not lower.endswith(".pdf"):
+                    continue
+
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+
+                signature = (stat.st_size, stat.st_mtime_ns)
+                seen.add(path)
+                if first_scan and self._already_cleaned(path, stat):
+                    self._processed[path] = signature
+                if self._processed.get(path) == signature or path in self._in_flight:
+                    continue
+
+                previous = self._candidates.get(path)
+                if previous is None or previous[0] != signature:
+                    detected = previous[2] if previous else now
+                    self._candidates[path] = (signature, now, detected)
+                    continue
+
+                # 大小與修改時間維持不變超過設定時間，視為寫入完成
+                if now - previous[1] >= self.settle_seconds:
+                    if stat.st_size > 0:
+                        ready.append((path, signature, previous[2]))
+                    else:
+                        # 空檔案（截斷或中斷的傳送）記為失敗，不再等待；之後寫入內容時會重新處理
+                        del self._candidates[path]
+                        self._processed[path] = signature
+                        self._record(
+                            {
+                                "input": path,
+                                "output": self._output_path(path),
+                                "mode": self.mode,
+                                "success": False,
+                                "message": "空檔案",
+                                "latency": round(now - previous[2], 4),
+                            }
+                        )
+
+        # 已被移除的檔案不再追蹤
+        for path in list(self._candidates):
+            if path not in seen:
+                del self._candidates[path]
+        for path in list(self._processed):
+            if path not in seen:
+                del self._processed[path]
+
+        return ready
+
+    def _make_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.mode, self.options),
+        )
+
+    def _can_submit(self, path: str) -> bool:
+        # 當機後重試的檔案單獨執行：等其他工作結束再送出，執行期間不送出其他檔案
+        if self._broken or self._isolated & self._in_flight:
+            return False
+        return path not in self._isolated or not self._in_flight
+
+    def _submit(self, executor, path: str, signature, detected: float) -> bool:
+        """送出清洗工作；行程池已損壞時回傳 False（工作未送出）"""
+        output_path = self._output_path(path)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        # 先寫到同一目錄的暫存檔，完成後以 os.replace 原子性地換成正式檔名
+        temp_path = os.path.join(
+            os.path.dirname(output_path), f".{os.path.basename(output_path)}.{os.getpid()}.tmp"
+        )
+        try:
+            future = executor.submit(clean_one, path, temp_path)
+        except BrokenProcessPool:
+            self._broken = True
+            return False
+        self._candidates.pop(path, None)
+        future.add_done_callback(lambda _f: self._waker.wake())
+        self._pending[future] = (path, signature, detected, output_path, temp_path)
+        self._in_flight.add(path)
+        self.logger.info(f"開始清洗: {path}")
+        return True
+
+    def _finish(self, future) -> Optional[Tuple[str, Tuple[int, int], float]]:
+        """處理完成的工作；工作行程當機而需要重試時回傳要重新排入的項目"""
+        path, signature, detected, output_path, temp_path = self._pending.pop(future)
+        self._in_flight.discard(path)
+
+        try:
+            record = future.result()
+        except BrokenProcessPool:
+            self._broken = True
+            if path not in self._isolated:
+                self._isolated.add(path)
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                return path, signature, detected
+            record = {"input": path, "mode": self.mode, "success": False, "message": WORKER_CRASH_MESSAGE}
+        except Exception as e:
+            record = {"input": path, "mode": self.mode, "success": False, "message": f"工作行程錯誤: {e}"}
+
+        record["output"] = output_path
+        try:
+            if record.get("success"):
+                os.replace(temp_path, output_path)
+                if self.archive_dir:
+                    archive_path = os.path.join(self.archive_dir, os.path.relpath(path, self.inbox))
+                    os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+                    shutil.move(path, archive_path)
+                    record["archived"] = archive_path
+            elif os.path.exists(temp_path):
+                os.remove(temp_path)
+        except OSError as e:
+            record["success"] = False
+            record["message"] = f"移動輸出檔案失敗: {e}"
+
+        # 處理期間檔案若再次變更，簽章不同會在下次掃描時重新清洗
+        self._isolated.discard(path)
+        self._processed[path] = signature
+        record["latency"] = round(time.monotonic() - detected, 4)
+        self._record(record)
+
+    def _record(self, record: Dict):
+        """更新統計並寫入結果與指標"""
+        path = record["input"]
+        output_path = record["output"]
+        if record.get("success"):
+            self.summary["succeeded"] += 1
+            self.logger.info(f"清洗完成: {output_path} (從偵測到完成 {record['latency']:.2f} 秒)")
+        else:
+            self.summary["failed"] += 1
+            self.logger.error(f"清洗失敗: {path}: {record.get('message', '')}")
+        if self.metrics is not None:
+            self.metrics.observe(record)
+
+        if self.results_file is not None:
+            self.results_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.results_file.flush()
+
+    def run(self, once: bool = False) -> Dict:
+        """
+        開始監看直到呼叫 stop()
+
+        once 為 True 時只處理目前已存在（並已寫入完成）的檔案後結束，可取代排程執行。
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        max_in_flight = self.workers * 2
+        first_scan = True
+        waiting: List = []
+
+        self.logger.info(
+            f"開始監看: {self.inbox} -> {self.output_dir} "
+            f"({'inotify' if self._waker.uses_inotify else '輪詢'}, {self.workers} 個工作行程)"
+        )
+
+        executor = self._make_executor()
+        try:
+            while True:
+                for future in [f for f in self._pending if f.done()]:
+                    retry = self._finish(future)
+                    if retry is not None:
+                        waiting.insert(0, retry)
+
+                # 行程池損壞時其餘執行中的工作也會隨即失敗；全部收回後重新建立行程池
+                if self._broken and not self._pending:
+                    self.logger.error("工作行程異常結束，重新啟動工作行程池")
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = self._make_executor()
+                    self._broken = False
+
+                if self._stop.is_set():
+                    if not self._pending:
+                        break
+                else:
+                    queued = {path for path, _, _ in waiting}
+                    waiting.extend(
+                        item for item in self.scan(first_scan) if item[0] not in queued
+                    )
+                    first_scan = False
+                    while (
+                        waiting
+                        and len(self._pending) < max_in_flight
+                        and self._can_submit(waiting[0][0])
+                    ):
+                        if not self._submit(executor, *waiting[0]):
+                            break
+                        waiting.pop(0)
+
+                    if once and not waiting and not self._pending and not self._candidates:
+                        break
+
+                self._waker.wait(self.poll_interval)
+        finally:
+            executor.shutdown()
+            self._waker.close()
+
+        return self.summary
+
+
+def main():
+    """主程式入口"""
+    parser = argparse.ArgumentParser(
+        description="PDF收件夾監看工具 - 偵測新進或變更的PDF並立即清洗"
+    )
+    parser.add_argument("inbox", help="要監看的收件夾")
+    parser.add_argument("-o", "--output-dir", required=True, help="輸出目錄")
+    parser.add_argument(
+        "--mode", choices=MODES, default="extract", help="清洗模式 (預設: extract)"
+    )
+    parser.add_argument(
+        "--dpi", type=int, default=300, help="列印模式渲染DPI (預設: 300)"
+    )
+    parser.add_argument(
+        "--output-dpi",
+        type=dpi_arg,
+        help="列印模式輸出解析度，低於 --dpi 時超取樣後縮小 (預設: 與 --dpi 相同)",
+    )
+    parser.add_argument(
+        "--max-image-dpi",
+        type=dpi_arg,
+        help="內容提取模式圖片目標解析度，解析度過高的圖片縮小到此解析度 (預設: 不縮小)",
+    )
+    parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="輸出最佳化：移除未使用物件、合併相同串流並壓縮為物件串流",
+    )
+    parser.add_argument(
+        "--linearize",
+        action="store_true",
+        help="線性化輸出以便網頁檢視器快速顯示第一頁 (隱含 --optimize，需要 pikepdf)",
+    )
+    parser.add_argument(
+        "--deterministic",
+        action="store_true",
+        help="可重現輸出：相同的輸入與選項產生位元組完全相同的PDF (不分片、不增量重建)",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="以低解析度逐頁比較輸入與輸出的外觀，差異過大的頁面列於結果",
+    )
+    parser.add_argument(
+        "--blank-pages",
+        choices=BLANK_PAGE_MODES,
+        default="keep",
+        help="列印模式空白頁處理: keep 照常渲染, empty 輸出空白頁, drop 移除 (預設: keep)",
+    )
+    parser.add_argument(
+        "--palette",
+        choices=PALETTE_MODES,
+        default="lossless",
+        help="列印模式索引色: lossless 無損, quantize 另量化顏色略多的頁面, off 一律RGB (預設: lossless)",
+    )
+    parser.add_argument(
+        "--colorspace",
+        choices=COLORSPACES,
+        default="rgb",
+        help="列印模式輸出色彩: rgb 全彩, gray 灰階, mono 黑白, mono-dither 抖動黑白 (預設: rgb)",
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, help="工作行程數量 (預設: 依CPU與記憶體決定)"
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=DEFAULT_SETTLE_SECONDS,
+        help=f"檔案大小與修改時間維持不變多久才開始清洗 (秒，預設: {DEFAULT_SETTLE_SECONDS})",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help=f"掃描間隔 (秒，預設: {DEFAULT_POLL_INTERVAL})",
+    )
+    parser.add_argument("--polling", action="store_true", help="不使用 inotify，只以輪詢偵測")
+    parser.add_argument("--archive-dir", help="清洗成功後將原始檔案移到此目錄")
+    parser.add_argument("--once", action="store_true", help="處理目前的檔案後結束")
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        nargs="?",
+        const=DEFAULT_METRICS_PORT,
+        help=f"在本機此埠提供 Prometheus 指標 /metrics (未指定埠時為 {DEFAULT_METRICS_PORT})",
+    )
+    parser.add_argument(
+        "--results",
+        default="watch_results.jsonl",
+        help="JSONL結果檔案路徑，'-' 代表標準輸出 (預設: watch_results.jsonl)",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="詳細輸出")
+    parser.add_argument(
+        "--log-file", help='日誌檔案路徑，"-" 代表不寫入檔案 (預設: pdf_watch_folder.log)'
+    )
+
+    args = parser.parse_args()
+
+    configure_logging(
+        log_file=args.log_file,
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        stream=sys.stderr if args.results == "-" else None,
+        default_log_file="pdf_watch_folder.log",
+    )
+
+    if not os.path.isdir(args.inbox):
+        print(f"收件夾不存在: {args.inbox}")
+        return 1
+
+    results_file = (
+        sys.stdout if args.results == "-" else open(args.results, "a", encoding="utf-8")
+    )
+
+    metrics = metrics_server = None
+    if args.metrics_port is not None:
+        metrics = CleanerMetrics()
+        metrics_server = start_metrics_server(metrics, args.metrics_port)
+
+    watcher = FolderWatcher(
+        args.inbox,
+        args.output_dir,
+        args.mode,
+        args.workers,
+        {
+            "dpi": args.dpi,
+            "output_dpi": args.output_dpi,
+            "max_image_dpi": args.max_image_dpi,
+            "optimize": args.optimize,
+            "linearize": args.linearize,
+            "deterministic": args.deterministic,
+            "verify": args.verify,
+            "blank_pages": args.blank_pages,
+            "palette": args.palette,
+            "colorspace": args.colorspace,
+        },
+        args.settle,
+        args.poll_interval,
+        args.archive_dir,
+        results_file,
+        use_inotify=not args.polling,
+        metrics=metrics,
+    )
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: watcher.stop())
+
+    try:
+        summary = watcher.run(once=args.once)
+    finally:
+        if results_file is not sys.stdout:
+            results_file.close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+
+    report = sys.stderr if args.results == "-" else sys.stdout
+    print(
+        f"監看結束: 成功 {summary['succeeded']}，失敗 {summary['failed']}",
+        file=report,
+    )
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())